@@ -1,38 +1,331 @@
-import logging
+import io
 import os
+import re
+import sys
+import glob
+import gzip
 import json
+import queue
+import atexit
+import hashlib
+import threading
 from datetime import datetime
 
+try:
+    import zstandard
+except ImportError:  # optional: pip install zstandard
+    zstandard = None
+
+# Rotate a session's log once it passes this size; keep this many rotated segments
+MAX_BYTES = int(float(os.environ.get("PROMPT_LOG_MAX_MB", 10)) * 1024 * 1024)
+BACKUPS = int(os.environ.get("PROMPT_LOG_BACKUPS", 20))
+# auto (zstd when installed, else gzip), zstd, gzip or off
+COMPRESSION = os.environ.get("PROMPT_LOG_COMPRESSION", "auto")
+# Payloads at least this long are written once per log segment and referenced by hash once they repeat
+DEDUP_MIN_CHARS = int(os.environ.get("PROMPT_LOG_DEDUP_CHARS", 512))
+QUEUE_SIZE = 10000
+BATCH_SIZE = 500
+
 _loggers = {}
+_loggers_lock = threading.Lock()
+
+
+def _compression():
+    if COMPRESSION == "auto":
+        return "zstd" if zstandard is not None else "gzip"
+    if COMPRESSION == "zstd" and zstandard is None:
+        return "gzip"
+    return COMPRESSION
+
+
+def _blob_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# -----------------------------
+# Class: Background Writer (one thread for every session log)
+# -----------------------------
+class _LogWriter:
+    """
+    log_prompt() only puts the entry on a queue; this thread serialises,
+    de-duplicates and writes entries in batches, and rotates and compresses
+    full segments, so logging stays off the request path.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.thread = threading.Thread(target=self._run, name="prompt-log-writer", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            touched = {}
+            for log, item in batch:
+                if isinstance(item, threading.Event):
+                    # A flush/close request: everything queued before it is written first
+                    for pending in touched.values():
+                        pending.flush()
+                    touched.clear()
+                    log.flush()
+                    item.set()
+                    continue
+                try:
+                    log.write(*item)
+                    touched[id(log)] = log
+                except Exception as e:
+                    print(f"Prompt log write failed for {log.path}: {e}", file=sys.stderr)
+            for log in touched.values():
+                log.flush()
+
+    def submit(self, log, item):
+        self.queue.put((log, item))
+
+    def wait(self, log, close=False):
+        done = threading.Event()
+        self.submit(log, done)
+        done.wait()
+        if close:
+            log.close()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = _LogWriter()
+            atexit.register(_flush_all)
+        return _writer
+
+
+# -----------------------------
+# Class: One Session's Prompt Log
+# -----------------------------
+class PromptLog:
+    """
+    JSONL log for one session, written by the background writer. A large
+    payload stays inline the first time it appears in a segment; when it
+    appears again it becomes a {"blob": sha256, "content": ...} record, and
+    that entry and later ones carry "content_parts" that point to it.
+    Full segments are renamed to <path>.<n> (oldest first) and compressed;
+    each segment holds the blobs it references.
+    """
+
+    def __init__(self, session_id, path, max_bytes=MAX_BYTES, backups=BACKUPS, compression=None, append=False):
+        self.session_id = session_id
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.compression = compression or _compression()
+        # Numbering continues after existing segments (e.g. a resumed session's)
+        existing = _numbered_segments(path)
+        self.segments = existing[-1][0] if existing else 0
+        self._seen = set()       # hashes written as blobs in this segment
+        self._seen_once = set()  # hashes so far only written inline
+        self._file = open(path, "a" if append else "w", encoding="utf-8")
+        self._writer = _get_writer()
+
+    def put(self, entry, payloads=()):
+        self._writer.submit(self, (entry, payloads))
 
-def setup_prompt_logger(session_id=None):
+    def write(self, entry, payloads=()):
+        # Runs on the writer thread
+        lines = []
+        content = entry.get("content")
+        if isinstance(content, str):
+            parts = self._split(content, payloads)
+            if parts is not None:
+                parts = [self._dedup(part, lines) for part in parts]
+            if parts is not None and any(isinstance(part, dict) for part in parts):
+                entry = {key: value for key, value in entry.items() if key != "content"}
+                entry["content_parts"] = parts
+        lines.append(json.dumps(entry, ensure_ascii=False))
+        self._file.write("\n".join(lines) + "\n")
+        if self._file.tell() >= self.max_bytes:
+            self.rotate()
+
+    def _dedup(self, part, lines):
+        # A payload seen for the first time stays inline: a blob only saves space once it repeats
+        if isinstance(part, str):
+            return part
+        blob = part["blob"]
+        if blob not in self._seen:
+            if blob not in self._seen_once:
+                self._seen_once.add(blob)
+                return part["text"]
+            self._seen.add(blob)
+            lines.append(json.dumps({"blob": blob, "content": part["text"]}, ensure_ascii=False))
+        return {"blob": blob}
+
+    def _split(self, content, payloads):
+        """
+        Returns content as [text | {"blob", "text"}] parts, or None to keep
+        it inline. Each payload found in content becomes a blob; without a
+        match, content that is long enough becomes one blob as a whole.
+        """
+        spans = []
+        for payload in payloads:
+            if len(payload) >= DEDUP_MIN_CHARS:
+                start = content.find(payload)
+                if start >= 0:
+                    spans.append((start, start + len(payload)))
+        if not spans:
+            if len(content) < DEDUP_MIN_CHARS:
+                return None
+            spans = [(0, len(content))]
+
+        parts = []
+        position = 0
+        for start, end in sorted(spans):
+            if start < position:
+                continue  # overlaps a payload already taken
+            if start > position:
+                parts.append(content[position:start])
+            text = content[start:end]
+            parts.append({"blob": _blob_hash(text), "text": text})
+            position = end
+        if position < len(content):
+            parts.append(content[position:])
+        return parts
+
+    def rotate(self):
+        self._file.close()
+        self.segments += 1
+        segment = f"{self.path}.{self.segments}"
+        os.replace(self.path, segment)
+        compress_segment(segment, self.compression)
+        if self.backups:
+            for old in rotated_segments(self.path)[:-self.backups]:
+                os.remove(old)
+        # Every segment is self-contained, so old ones can be deleted safely
+        self._seen.clear()
+        self._seen_once.clear()
+        self._file = open(self.path, "w", encoding="utf-8")
+
+    def flush(self):
+        if not self._file.closed:
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+# -----------------------------
+# Function: Compress a Rotated Segment
+# -----------------------------
+def compress_segment(path, compression):
+    if compression == "off":
+        return path
+    target = path + (".zst" if compression == "zstd" else ".gz")
+    with open(path, "rb") as source:
+        if compression == "zstd":
+            with open(target, "wb") as f:
+                zstandard.ZstdCompressor().copy_stream(source, f)
+        else:
+            with gzip.open(target, "wb") as f:
+                while chunk := source.read(1 << 20):
+                    f.write(chunk)
+    os.remove(path)
+    return target
+
+
+def rotated_segments(path):
+    """Rotated segments of a log, oldest first."""
+    return [segment for _, segment in _numbered_segments(path)]
+
+
+def _numbered_segments(path):
+    pattern = re.compile(re.escape(os.path.basename(path)) + r"\.(\d+)(\.gz|\.zst)?$")
+    found = []
+    for candidate in glob.glob(glob.escape(path) + ".*"):
+        match = pattern.match(os.path.basename(candidate))
+        if match:
+            found.append((int(match.group(1)), candidate))
+    return sorted(found)
+
+
+def _open_segment(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"{path} is zstd-compressed; pip install zstandard to read it")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb")), encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+# -----------------------------
+# Function: Read a Prompt Log Back
+# -----------------------------
+def read_prompt_log(path):
+    """
+    Yields the entries of a session log (rotated segments first) with
+    de-duplicated payloads put back into "content".
+    """
+    for segment in rotated_segments(path) + ([path] if os.path.exists(path) else []):
+        blobs = {}
+        with _open_segment(segment) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if "blob" in entry:
+                    blobs[entry["blob"]] = entry["content"]
+                    continue
+                if "content_parts" in entry:
+                    parts = entry.pop("content_parts")
+                    entry["content"] = "".join(part if isinstance(part, str) else blobs[part["blob"]] for part in parts)
+                yield entry
+
+
+def setup_prompt_logger(session_id=None, append=False):
     """
     Initializes and returns a logger for capturing prompts.
     Reuses existing logger if already initialized for this session.
+    With append (a resumed session) the existing log is continued.
     """
-    if session_id in _loggers:
-        return _loggers[session_id]
-
-    os.makedirs("logs", exist_ok=True)
-    session_id = session_id or datetime.utcnow().strftime("%Y-%m-%dT%H-%M-%SZ")
-    log_file = f"logs/prompts_{session_id}.log"
+    with _loggers_lock:
+        if session_id in _loggers:
+            return _loggers[session_id]
 
-    logger = logging.getLogger(f"prompt_logger_{session_id}")
-    logger.setLevel(logging.INFO)
+        os.makedirs("logs", exist_ok=True)
+        session_id = session_id or datetime.utcnow().strftime("%Y-%m-%dT%H-%M-%SZ")
+        logger = PromptLog(session_id, f"logs/prompts_{session_id}.log", append=append)
+        _loggers[session_id] = logger
+        return logger
 
-    # Avoid adding multiple handlers if the logger already exists
-    if not logger.handlers:
-        handler = logging.FileHandler(log_file, mode="w", encoding="utf-8")
-        formatter = logging.Formatter('%(message)s')
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
+def close_prompt_logger(session_id):
+    """
+    Waits for the session's queued entries to be written, then closes its
+    file so long batch runs don't keep one open file per finished session.
+    """
+    with _loggers_lock:
+        logger = _loggers.pop(session_id, None)
+    if not logger:
+        return
+    logger._writer.wait(logger, close=True)
 
-    _loggers[session_id] = logger
-    return logger
+def _flush_all():
+    with _loggers_lock:
+        loggers = list(_loggers.values())
+    for logger in loggers:
+        logger._writer.wait(logger)
 
-def log_prompt(logger, persona, role, content):
+def log_prompt(logger, persona, role, content, payloads=()):
     """
-    Logs a single prompt entry to the file.
+    Queues a single prompt entry for the background writer.
+    `payloads` (e.g. reference texts inside content) that repeat are
+    stored once per log and referenced by hash.
     """
     entry = {
         "timestamp": datetime.utcnow().isoformat() + "Z",
@@ -40,4 +333,13 @@ def log_prompt(logger, persona, role, content):
         "role": role,
         "content": content
     }
-    logger.info(json.dumps(entry, ensure_ascii=False))
+    logger.put(entry, payloads)
+
+
+# -----------------------------
+# CLI: print a log with payloads restored
+# -----------------------------
+if __name__ == '__main__':
+    for log_path in sys.argv[1:]:
+        for log_entry in read_prompt_log(log_path):
+            print(json.dumps(log_entry, ensure_ascii=False))
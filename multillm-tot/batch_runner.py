@@ -0,0 +1,222 @@
+import os
+import json
+import copy
+import time
+import threading
+import click
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from rich import print
+from init import get_engine, load_persona_schema
+from llm_cache import CACHE_MODES, DEFAULT_CACHE_PATH
+from main import OUTPUT_FORMATS, OUTPUT_EXTENSIONS, GOAL_ROUNDS, SUMMARY_MODES, BACKENDS, load_personas, run_session, build_cli_command
+from checkpoint import checkpoint_path, load_checkpoint
+
+# Session metric totals copied into results.jsonl
+METRIC_TOTALS = ("calls", "errors", "retries", "cache_hits", "call_seconds", "prompt_tokens", "completion_tokens",
+                 "cached_tokens", "cost_usd")
+
+
+# -----------------------------
+# Function: Read the JSONL Manifest
+# -----------------------------
+def read_manifest(manifest_path):
+    """
+    One session per line: {"prompt", "personas_file", "rounds", "goal_round",
+    "output", "id", "seed", "summary_mode"}. Only prompt and personas_file are required.
+    "output" is a format or a list of formats, each saved as <id>.<extension>.
+    """
+    entries = []
+    id_lines = {}  # ids name the output files, checkpoints and prompt logs, so each must be unique
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise click.BadParameter(f"Manifest line {line_no} is not valid JSON: {e}")
+            missing = [key for key in ("prompt", "personas_file") if not entry.get(key)]
+            if missing:
+                raise click.BadParameter(f"Manifest line {line_no} is missing: {', '.join(missing)}")
+
+            entry.setdefault("id", f"session-{line_no:04d}")
+            if entry["id"] in id_lines:
+                raise click.BadParameter(
+                    f"Manifest line {line_no}: duplicate id '{entry['id']}' (already used on line {id_lines[entry['id']]})")
+            id_lines[entry["id"]] = line_no
+            entry.setdefault("rounds", 3)
+            entry.setdefault("goal_round", "optional")
+            entry.setdefault("output", "markdown")
+            entry.setdefault("summary_mode", "full")
+            formats = entry["output"] if isinstance(entry["output"], list) else [entry["output"]]
+            for output in formats:
+                if output not in OUTPUT_FORMATS:
+                    raise click.BadParameter(f"Manifest line {line_no}: unsupported output '{output}'")
+            if not formats or len(set(formats)) != len(formats):
+                raise click.BadParameter(f"Manifest line {line_no}: list each output format once")
+            if entry["goal_round"] not in GOAL_ROUNDS:
+                raise click.BadParameter(f"Manifest line {line_no}: unsupported goal_round '{entry['goal_round']}'")
+            if entry["summary_mode"] not in SUMMARY_MODES:
+                raise click.BadParameter(f"Manifest line {line_no}: unsupported summary_mode '{entry['summary_mode']}'")
+            entries.append(entry)
+    return entries
+
+
+# -----------------------------
+# Function: Load Each Personas File Once
+# -----------------------------
+def preload_personas(entries, schema, engine):
+    """
+    Parses, validates and enriches every distinct personas file a single time.
+    Sessions get a deep copy, so enrichment (file reads, Qdrant lookups) is
+    not repeated per prompt. Failures are kept per file and reported per session.
+    """
+    personas_by_file = {}
+    for entry in entries:
+        path = entry["personas_file"]
+        if path in personas_by_file:
+            continue
+        try:
+            personas_by_file[path] = load_personas(path, schema, engine)
+        except (Exception, SystemExit) as e:
+            personas_by_file[path] = e
+    return personas_by_file
+
+
+# -----------------------------
+# Function: Sessions Already Finished in a Batch
+# -----------------------------
+def finished_entries(results_path):
+    # Later lines win, so a session that failed and then succeeded counts as done
+    status = {}
+    if results_path.exists():
+        with open(results_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    result = json.loads(line)
+                    status[result["id"]] = result["status"]
+    return {entry_id for entry_id, value in status.items() if value == "ok"}
+
+
+# -----------------------------
+# Function: Run One Manifest Entry
+# -----------------------------
+def run_entry(entry, personas, engine, output_dir, batch_id, concurrency, context_budget=None, backend='live'):
+    started = time.perf_counter()
+    session_id = f"{batch_id}_{entry['id']}"
+    # A checkpoint from an interrupted run of this batch: continue it instead of starting over
+    resume_from = load_checkpoint(session_id) if os.path.exists(checkpoint_path(session_id)) else None
+    # One file per format, all written from a single render of the session
+    formats = entry["output"] if isinstance(entry["output"], list) else [entry["output"]]
+    outputs = [(output, str(output_dir / f"{entry['id']}.{OUTPUT_EXTENSIONS[output]}")) for output in formats]
+    cli_command = build_cli_command(
+        entry["prompt"], entry["rounds"], entry["personas_file"], [f"{output}={path}" for output, path in outputs],
+        concurrency=concurrency,
+        goal_round=entry["goal_round"], seed=entry.get("seed"), summary_mode=entry["summary_mode"], backend=backend
+    )
+
+    state, _ = run_session(
+        entry["prompt"], entry["rounds"], copy.deepcopy(personas), engine,
+        output=formats[0],
+        goal_round=entry["goal_round"],
+        concurrency=concurrency,
+        cli_command=cli_command,
+        session_id=session_id,
+        seed=entry.get("seed"),
+        echo=False,
+        context_budget=context_budget,
+        summary_mode=entry["summary_mode"],
+        resume_from=resume_from,
+        outputs=outputs
+    )
+
+    return {
+        "id": entry["id"],
+        "status": "ok",
+        "output": outputs[0][1] if isinstance(entry["output"], str) else [path for _, path in outputs],
+        "messages": len(state["conversationHistory"]),
+        "errors": sum(1 for m in state["conversationHistory"] if m["text"].startswith("[ERROR]")),
+        "seconds": round(time.perf_counter() - started, 2),
+        "resumed": resume_from is not None,
+        "metrics": {key: state["metrics"][key] for key in METRIC_TOTALS}
+    }
+
+
+# -----------------------------
+# CLI Entrypoint
+# -----------------------------
+@click.command()
+@click.option('--manifest', required=True, type=click.Path(exists=True), help='JSONL file, one session per line')
+@click.option('--output-dir', required=True, help='Folder for per-session outputs and results.jsonl')
+@click.option('--workers', default=4, type=click.IntRange(min=1), help='Sessions running at the same time')
+@click.option('--concurrency', default=1, type=click.IntRange(min=1), help='Max persona replies in parallel within a round')
+@click.option('--max-connections', default=None, type=click.IntRange(min=1), help='Size of the shared HTTP connection pool')
+@click.option('--max-in-flight', default=None, type=click.IntRange(min=1), help='Global cap on LLM requests in flight across all sessions')
+@click.option('--cache', 'cache_mode', default='off', type=click.Choice(CACHE_MODES), help='LLM response cache mode (read, write, off)')
+@click.option('--cache-path', default=DEFAULT_CACHE_PATH, help='SQLite file for the LLM response cache')
+@click.option('--context-budget', default=None, type=click.IntRange(min=256), help='Cap on user-prompt tokens per reply')
+@click.option('--backend', default='live', type=click.Choice(BACKENDS), help='live providers, or the offline mock backend')
+@click.option('--resume', 'resume_batch', default=None, metavar='BATCH_ID',
+              help='Continue an interrupted batch: skip sessions already ok in results.jsonl, resume the rest from their checkpoints')
+
+def run_batch(manifest, output_dir, workers, concurrency, max_connections, max_in_flight, cache_mode, cache_path, context_budget,
+              backend, resume_batch):
+    entries = read_manifest(manifest)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    batch_id = resume_batch or datetime.now().strftime("%Y-%m-%dT%H-%M-%S")
+    results_path = output_dir / "results.jsonl"
+    results_lock = threading.Lock()
+    if resume_batch:
+        done = finished_entries(results_path)
+        entries = [entry for entry in entries if entry["id"] not in done]
+        print(f"[bold]Resuming batch {batch_id}:[/bold] {len(done)} sessions already finished")
+
+    schema = load_persona_schema()
+    engine = get_engine(
+        backend,
+        max_connections=max_connections,
+        max_in_flight=max_in_flight,
+        cache_mode=cache_mode,
+        cache_path=cache_path
+    )
+    personas_by_file = preload_personas(entries, schema, engine)
+    print(f"[bold]Batch {batch_id}:[/bold] {len(entries)} sessions, {workers} workers")
+
+    def record(result):
+        # Stream one line per finished session so partial batches stay usable
+        with results_lock, open(results_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        color = "green" if result["status"] == "ok" else "red"
+        print(f"[{color}]{result['id']}[/{color}] {result['status']} {result.get('output') or result.get('error')}")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for entry in entries:
+            personas = personas_by_file[entry["personas_file"]]
+            if isinstance(personas, BaseException):
+                record({"id": entry["id"], "status": "error", "error": f"Personas file: {personas}"})
+                continue
+            future = pool.submit(run_entry, entry, personas, engine, output_dir, batch_id, concurrency, context_budget,
+                                 backend)
+            futures[future] = entry
+
+        for future in as_completed(futures):
+            entry = futures[future]
+            try:
+                record(future.result())
+            except Exception as e:
+                record({"id": entry["id"], "status": "error", "error": str(e)})
+
+    print(f"[bold green]Results written to:[/bold green] {results_path}")
+
+
+# -----------------------------
+# Run
+# -----------------------------
+if __name__ == '__main__':
+    run_batch()
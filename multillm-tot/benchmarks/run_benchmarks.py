@@ -0,0 +1,268 @@
+import os
+import sys
+import json
+import time
+import platform
+import statistics
+import tracemalloc
+from datetime import datetime
+import click
+from rich import print
+
+# Run from anywhere: the modules under test live one folder up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import (build_thread_tree, get_thread_context, flatten_conversation_history_with_threads,
+                  summarize_engagement, score_rag_effectiveness, assign_colors_to_personas)
+from exporter_markdown import generate_markdown_from_tree
+from exporter_json import generate_json_from_tree
+from exporter_html import generate_html_with_styles
+from exporter_tree import generate_tree_from_tree
+from synthetic import SHAPES, generate_conversation, synthetic_personas
+
+DEFAULT_SIZES = "10,100,1000,10000,100000"
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+CONTEXT_LOOKUPS = 500
+# Timings below this are too noisy to call a regression
+NOISE_FLOOR_SECONDS = 0.002
+
+
+# -----------------------------
+# Benchmarks: name -> setup(data) returning the zero-argument call to time
+# -----------------------------
+def bench_build_thread_tree(data):
+    return lambda: build_thread_tree(data["messages"])
+
+
+def bench_get_thread_context(data):
+    # CONTEXT_LOOKUPS replies spread over the history, on a freshly indexed store
+    messages = data["messages"]
+    sample = messages[::max(1, len(messages) // CONTEXT_LOOKUPS)]
+
+    def run():
+        state = {"conversationHistory": messages}
+        for message in sample:
+            get_thread_context(state, message)
+    return run
+
+
+def bench_flatten_history(data):
+    return lambda: flatten_conversation_history_with_threads({"conversationHistory": data["messages"]})
+
+
+def bench_summarize_engagement(data):
+    return lambda: summarize_engagement(data["messages"], data["personas"], data["rounds"])
+
+
+def bench_score_rag_effectiveness(data):
+    persona = data["personas"][0]
+    return lambda: [score_rag_effectiveness(m["text"], persona) for m in data["messages"]]
+
+
+def bench_export_markdown(data):
+    return lambda: generate_markdown_from_tree(data["tree"], "Benchmark discussion")
+
+
+def bench_export_json(data):
+    return lambda: generate_json_from_tree(data["tree"])
+
+
+def bench_export_tree(data):
+    return lambda: generate_tree_from_tree(data["tree"])
+
+
+def bench_export_html(data):
+    round_summary, persona_summary = summarize_engagement(data["messages"], data["personas"], data["rounds"])
+    return lambda: generate_html_with_styles(
+        tree=data["tree"],
+        title="Benchmark discussion",
+        timestamp="2026-01-01 00:00:00",
+        summary_lines=round_summary + persona_summary,
+        persona_colors=data["persona_colors"],
+        engagement_score=0.7,
+        total_comments=len(data["messages"]),
+        cli_command="python main.py ...",
+        runtime_log=[f"{m['persona']} replied → {m['id']}" for m in data["messages"]],
+        discussion_summary="Synthetic benchmark conversation."
+    )
+
+
+BENCHMARKS = {
+    "build_thread_tree": bench_build_thread_tree,
+    "get_thread_context": bench_get_thread_context,
+    "flatten_history": bench_flatten_history,
+    "summarize_engagement": bench_summarize_engagement,
+    "score_rag_effectiveness": bench_score_rag_effectiveness,
+    "export_markdown": bench_export_markdown,
+    "export_json": bench_export_json,
+    "export_tree": bench_export_tree,
+    "export_html": bench_export_html
+}
+
+
+# -----------------------------
+# Function: Build the Inputs for One (shape, size)
+# -----------------------------
+def prepare(shape, size, seed):
+    messages = generate_conversation(size, shape, seed)
+    personas = synthetic_personas()
+    return {
+        "messages": messages,
+        "tree": build_thread_tree(messages),
+        "personas": personas,
+        "persona_colors": assign_colors_to_personas(personas),
+        "rounds": max(m["round"] for m in messages)
+    }
+
+
+# -----------------------------
+# Function: Time and Measure One Benchmark
+# -----------------------------
+def measure(call, repeat, memory=True):
+    """
+    Times `repeat` runs (median and best), then one more run under
+    tracemalloc for the peak Python allocation. Errors such as
+    RecursionError are recorded instead of aborting the suite.
+    """
+    timings = []
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            call()
+            timings.append(time.perf_counter() - started)
+
+        peak = None
+        if memory:
+            tracemalloc.start()
+            call()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    except RecursionError as e:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        return {"status": "error", "error": f"RecursionError: {e}"}
+
+    return {
+        "status": "ok",
+        "median_seconds": round(statistics.median(timings), 6),
+        "best_seconds": round(min(timings), 6),
+        "peak_kb": round(peak / 1024, 1) if peak is not None else None
+    }
+
+
+def run_suite(names, shapes, sizes, repeat, seed, skip_after, memory=True):
+    results = []
+    too_slow = set()
+    for shape in shapes:
+        for size in sizes:
+            data = prepare(shape, size, seed)
+            for name in names:
+                key = {"benchmark": name, "shape": shape, "size": size}
+                if (name, shape) in too_slow:
+                    results.append(dict(key, status="skipped"))
+                    continue
+                result = dict(key, **measure(BENCHMARKS[name](data), repeat, memory))
+                results.append(result)
+                print_result(result)
+                if result.get("median_seconds", 0) > skip_after:
+                    too_slow.add((name, shape))
+    return results
+
+
+def print_result(result):
+    label = f"{result['benchmark']:<24} {result['shape']:<9} {result['size']:>7}"
+    if result["status"] != "ok":
+        print(f"{label}  [red]{result.get('error', result['status'])}[/red]")
+        return
+    memory = f"{result['peak_kb']:>10.1f} KB" if result["peak_kb"] is not None else ""
+    print(f"{label}  {result['median_seconds'] * 1000:>10.3f} ms  {memory}")
+
+
+# -----------------------------
+# Function: Compare Against a Saved Baseline
+# -----------------------------
+def compare(results, baseline, threshold):
+    """
+    Returns the results that got slower than baseline * threshold (ignoring
+    anything under NOISE_FLOOR_SECONDS), each with its ratio.
+    """
+    previous = {
+        (r["benchmark"], r["shape"], r["size"]): r
+        for r in baseline["results"] if r["status"] == "ok"
+    }
+    regressions = []
+    for result in results:
+        before = previous.get((result["benchmark"], result["shape"], result["size"]))
+        if result["status"] != "ok" or before is None:
+            continue
+        ratio = result["median_seconds"] / max(before["median_seconds"], 1e-9)
+        result["baseline_ratio"] = round(ratio, 2)
+        if ratio > threshold and result["median_seconds"] > NOISE_FLOOR_SECONDS:
+            regressions.append(result)
+    return regressions
+
+
+# -----------------------------
+# CLI Entrypoint
+# -----------------------------
+@click.command()
+@click.option('--sizes', default=DEFAULT_SIZES, help='Comma-separated conversation sizes (messages)')
+@click.option('--shapes', default=",".join(SHAPES), help=f"Comma-separated thread shapes ({', '.join(SHAPES)})")
+@click.option('--only', default=None, help=f"Comma-separated benchmarks to run ({', '.join(BENCHMARKS)})")
+@click.option('--repeat', default=3, type=click.IntRange(min=1), help='Timed runs per benchmark (median reported)')
+@click.option('--seed', default=0, type=int, help='Seed for the synthetic conversations')
+@click.option('--skip-after', default=30.0, type=float, help='Skip larger sizes once a benchmark takes longer than this (seconds)')
+@click.option('--no-memory', is_flag=True, default=False, help='Skip the tracemalloc pass')
+@click.option('--output', default=None, help='Write this run\'s results as JSON')
+@click.option('--save-baseline', is_flag=True, default=False, help='Store this run as the baseline')
+@click.option('--compare', 'compare_baseline', is_flag=True, default=False, help='Compare against the baseline; exit 1 on regressions')
+@click.option('--baseline', default=DEFAULT_BASELINE, help='Baseline file')
+@click.option('--threshold', default=1.5, type=float, help='Slowdown ratio that counts as a regression')
+
+def run_benchmarks(sizes, shapes, only, repeat, seed, skip_after, no_memory, output, save_baseline, compare_baseline,
+                   baseline, threshold):
+    names = only.split(",") if only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise click.BadParameter(f"Unknown benchmark(s): {', '.join(unknown)}")
+    if compare_baseline and not os.path.exists(baseline):
+        raise click.UsageError(f"No baseline at {baseline}; record one on this machine with --save-baseline")
+
+    results = run_suite(
+        names,
+        shapes.split(","),
+        [int(size) for size in sizes.split(",")],
+        repeat, seed, skip_after, memory=not no_memory
+    )
+    report = {
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "seed": seed,
+        "results": results
+    }
+
+    exit_code = 0
+    if compare_baseline:
+        with open(baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), threshold)
+        for result in regressions:
+            print(f"[red]Regression:[/red] {result['benchmark']} {result['shape']} {result['size']} "
+                  f"is {result['baseline_ratio']}x the baseline")
+        if not regressions:
+            print(f"[bold green]No regressions beyond {threshold}x the baseline[/bold green]")
+        exit_code = 1 if regressions else 0
+
+    for path in filter(None, [output, baseline if save_baseline else None]):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[bold green]Results saved to:[/bold green] {path}")
+    sys.exit(exit_code)
+
+
+# -----------------------------
+# Run
+# -----------------------------
+if __name__ == '__main__':
+    run_benchmarks()
@@ -0,0 +1,77 @@
+import sys
+import random
+
+BENCH_WORDS = (
+    "the applicant vehicle claim deductible surcharge premium coverage risk review policy rate "
+    "history loss discount decision agent underwriter recommend approve decline evidence $500 15% "
+    "patient plan recovery therapy follow-up safety budget timeline scope"
+).split()
+
+# depth:      rounds, so the longest possible thread (replies target earlier rounds);
+#             fewer rounds means more messages per round, i.e. more fan-out
+# chain_bias: chance a reply targets the previous round, growing threads deeper
+# "chain" threads run past Python's recursion limit (given size > the limit), so
+# any recursive walk over them fails instead of just getting slower
+SHAPES = {
+    "wide": {"depth": 3, "chain_bias": 0.0},
+    "balanced": {"depth": 10, "chain_bias": 0.5},
+    "deep": {"depth": 200, "chain_bias": 0.95},
+    "chain": {"depth": 2 * sys.getrecursionlimit(), "chain_bias": 1.0}
+}
+
+
+# -----------------------------
+# Function: Synthetic Conversation History
+# -----------------------------
+def generate_conversation(size, shape="balanced", seed=0, persona_count=6):
+    """
+    Returns `size` message dicts shaped like commit_reply() output. Messages
+    are spread over `depth` rounds; every reply targets a message from an
+    earlier round, like plan_round(), so thread depth is at most `depth`.
+    """
+    config = SHAPES[shape]
+    rng = random.Random(f"{seed}:{shape}:{size}")
+    rounds = max(1, min(config["depth"], size))
+    per_round = -(-size // rounds)  # ceil
+    personas = [f"Persona {i + 1}" for i in range(persona_count)]
+
+    messages = []
+    previous_round = []
+    for i in range(size):
+        round_num = i // per_round + 1
+        if i % per_round == 0 and i:
+            previous_round = messages[-per_round:]
+
+        if round_num == 1:
+            parent = None
+        elif rng.random() < config["chain_bias"]:
+            parent = rng.choice(previous_round)
+        else:
+            parent = messages[rng.randrange(len(messages) - (i % per_round))]
+
+        persona = personas[i % persona_count]
+        words = rng.randint(40, 120)
+        messages.append({
+            "id": f"msg-{round_num}-{persona}-{i}",
+            "round": round_num,
+            "persona": persona,
+            "llm": "ChatGPT",
+            "parentId": parent["id"] if parent else None,
+            "timestamp": "2026-01-01 00:00:00",
+            "text": " ".join(rng.choice(BENCH_WORDS) for _ in range(words)),
+            "rag_score": None
+        })
+    return messages
+
+
+def synthetic_personas(persona_count=6):
+    return [
+        {
+            "name": f"Persona {i + 1}",
+            "llm": "ChatGPT",
+            "model": "gpt-3.5-turbo",
+            "engagement": 0.7,
+            "resolved_qdrant_titles": [f"[Qdrant match: Manual – Section {i + 1}]"]
+        }
+        for i in range(persona_count)
+    ]
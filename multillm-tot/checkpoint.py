@@ -0,0 +1,142 @@
+import os
+import json
+import threading
+
+CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR", "checkpoints")
+
+
+def checkpoint_path(session_id, directory=None):
+    return os.path.join(directory or CHECKPOINT_DIR, f"{session_id}.jsonl")
+
+
+def _repair_tail(path):
+    # Drops a line torn by a crash mid-write, so appends start on a fresh line
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        if not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+def _rng_state(rng):
+    version, internal, gauss_next = rng.getstate()
+    return [version, list(internal), gauss_next]
+
+
+# -----------------------------
+# Class: Session Checkpoint (append-only JSONL)
+# -----------------------------
+class Checkpoint:
+    """
+    Durable record of a session, one JSON line per event:
+
+      session          prompt, rounds, enriched personas and settings
+      round            round number and the RNG state before it was planned
+      reply            a reply text as soon as it arrives, before its round commits
+      message          every committed message
+      rolling_summary  RollingSummary state after each round's update
+      done             the conversation finished
+
+    Lines are flushed and fsynced as they are written, so a crash only loses
+    the replies still in flight. Reopening an existing checkpoint appends to it.
+    """
+
+    def __init__(self, session_id, directory=None):
+        self.session_id = session_id
+        self.path = checkpoint_path(session_id, directory)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        _repair_tail(self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def _write(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def start(self, state, settings):
+        self._write({
+            "type": "session",
+            "session_id": self.session_id,
+            "prompt": state["prompt"],
+            "rounds": state["rounds"],
+            "personas": state["personas"],
+            "generatedAt": state["generatedAt"],
+            "cli_command": state["cli_command"],
+            "settings": settings
+        })
+
+    def round_started(self, state):
+        self._write({"type": "round", "round": state["currentRound"], "rng_state": _rng_state(state["rng"])})
+
+    def reply(self, message_id, text):
+        self._write({"type": "reply", "id": message_id, "text": text})
+
+    def message(self, round_num, message):
+        self._write({"type": "message", "round": round_num, "message": message})
+
+    def rolling_summary(self, state):
+        self._write({"type": "rolling_summary", "round": state["currentRound"], "state": state["rollingSummary"].to_dict()})
+
+    def finished(self):
+        self._write({"type": "done"})
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+# -----------------------------
+# Function: Load a Checkpoint
+# -----------------------------
+def load_checkpoint(session_id, directory=None):
+    """
+    Returns {"session", "round", "rng_state", "replies", "messages",
+    "rolling_summary", "done"} for the last round that was started.
+    "replies" maps message id -> reply text received. "messages" holds every
+    committed message as {"round", "message"} in commit order; a message
+    re-committed on resume (e.g. an [ERROR] reply that was retried) replaces
+    the earlier one.
+    "rolling_summary" is the latest state saved before that round.
+    A torn last line (crash mid-write) is ignored.
+    """
+    path = checkpoint_path(session_id, directory)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No checkpoint for session '{session_id}' at {path}")
+
+    saved = {"session": None, "round": None, "rng_state": None, "replies": {}, "messages": {}, "rolling_summary": None,
+             "done": False}
+    summaries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record["type"] == "session":
+                saved["session"] = saved["session"] or record
+            elif record["type"] == "round":
+                saved["round"] = record["round"]
+                saved["rng_state"] = record["rng_state"]
+            elif record["type"] == "reply":
+                saved["replies"][record["id"]] = record["text"]
+            elif record["type"] == "message":
+                saved["messages"][record["message"]["id"]] = record
+            elif record["type"] == "rolling_summary":
+                summaries.append(record)
+            elif record["type"] == "done":
+                saved["done"] = True
+
+    if saved["session"] is None:
+        raise ValueError(f"Checkpoint {path} has no session record")
+    saved["messages"] = list(saved["messages"].values())
+    before = [s for s in summaries if saved["round"] is None or s["round"] < saved["round"]]
+    saved["rolling_summary"] = before[-1]["state"] if before else None
+    return saved
+
+
+def restore_rng(rng, rng_state):
+    version, internal, gauss_next = rng_state
+    rng.setstate((version, tuple(internal), gauss_next))
@@ -0,0 +1,222 @@
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Context windows (input + output) per model; unknown models fall back to DEFAULT_CONTEXT_WINDOW
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4.1": 1047576,
+    "gpt-4.1-mini": 1047576,
+    "gemini-2.0-flash": 1048576,
+    "deepseek-chat": 65536
+}
+DEFAULT_CONTEXT_WINDOW = 16385
+RESERVED_COMPLETION_TOKENS = 1024
+MIN_REFERENCE_TOKENS = 200
+# Share of the budget the target may always claim, even if references then get trimmed
+TARGET_SHARE = 0.6
+
+REFERENCE_HEADER = (
+    "The following content is provided as reference for your persona. "
+    "Use it to inform your response:\n\n"
+)
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+# Token counts are memoised, keyed by the text itself only when it is short
+# (headers, persona prompts); longer texts by a digest, so the cache never
+# keeps prompts or transcripts alive
+TOKEN_COUNT_CACHE_SIZE = 8192
+SHORT_TEXT_CHARS = 256
+_token_counts = OrderedDict()
+_token_counts_lock = threading.Lock()
+
+
+# -----------------------------
+# Tokenizer (tiktoken when available, ~4 chars/token otherwise)
+# -----------------------------
+def get_encoding(model):
+    """
+    Returns the tiktoken encoding for a model, or None when tiktoken (or its
+    BPE files) isn't available; counts then use the 4-chars-per-token estimate.
+    """
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                import tiktoken
+                try:
+                    _encodings[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    _encodings[model] = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                _encodings[model] = None
+        return _encodings[model]
+
+
+def count_tokens(text, model="gpt-3.5-turbo"):
+    encoding = get_encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+
+    if len(text) <= SHORT_TEXT_CHARS:
+        key = (model, text)
+    else:
+        key = (model, hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest())
+    with _token_counts_lock:
+        count = _token_counts.get(key)
+        if count is not None:
+            _token_counts.move_to_end(key)
+            return count
+
+    count = len(encoding.encode(text, disallowed_special=()))
+    with _token_counts_lock:
+        _token_counts[key] = count
+        if len(_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+    return count
+
+
+def truncate_to_tokens(text, max_tokens, model="gpt-3.5-turbo"):
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    return encoding.decode(tokens[:max_tokens])
+
+
+def token_budget(model, system_prompt, override=None):
+    """
+    Tokens available for the user prompt: the model's window minus the system
+    prompt and room for the reply, optionally capped lower by `override`.
+    """
+    window = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+    budget = window - RESERVED_COMPLETION_TOKENS - count_tokens(system_prompt, model)
+    if override:
+        budget = min(budget, override)
+    return max(budget, 0)
+
+
+# -----------------------------
+# Relevance: word overlap between a reference and the current query
+# -----------------------------
+def _words(text):
+    return set(re.findall(r"[a-z0-9$%]{4,}", text.lower()))
+
+
+def relevance_score(query_words, text):
+    words = _words(text)
+    if not words:
+        return 0.0
+    return len(query_words & words) / (len(words) ** 0.5)
+
+
+# -----------------------------
+# Keep the head line and the most recent lines of a long target
+# -----------------------------
+def fit_target(target_text, budget, model):
+    """
+    Thread contexts and goal-round transcripts are oldest-first, and the goal
+    instruction is last, so when the target is over budget we keep its first
+    line plus as many of the most recent lines as fit.
+    """
+    if count_tokens(target_text, model) <= budget:
+        return target_text, "full"
+
+    lines = target_text.split("\n")
+    marker = "[... {} earlier lines omitted to fit the context budget ...]"
+    head = lines[0]
+    used = count_tokens(head, model) + count_tokens(marker, model) + 2
+    kept = []
+    for line in reversed(lines[1:]):
+        cost = count_tokens(line, model) + 1
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    kept.reverse()
+
+    omitted = len(lines) - 1 - len(kept)
+    if not kept:
+        return truncate_to_tokens(target_text, budget, model), "truncated"
+    return "\n".join([head, marker.format(omitted)] + kept), "truncated"
+
+
+# -----------------------------
+# Function: Build a Token-budgeted User Prompt
+# -----------------------------
+def build_user_prompt(model, system_prompt, target_text, references, query_text="", budget_override=None):
+    """
+    Assembles the user prompt from the persona's references and the target.
+
+    The target (thread context or goal transcript) gets whatever the
+    references leave, but never less than TARGET_SHARE of the budget; past
+    that it is trimmed to its most recent lines. References then fill what
+    is left in order of relevance to the target, each included whole,
+    truncated, or dropped. Included references keep their original order so
+    prompts stay stable between rounds.
+
+    Returns (user_prompt, report) where report lists every section with its
+    token count and whether it was kept full, truncated or dropped.
+    """
+    budget = token_budget(model, system_prompt, budget_override)
+    report = [{"section": "system", "tokens": count_tokens(system_prompt, model), "status": "full"}]
+
+    blocks = [f"[File: {ref['path']}]\n\n{ref['content']}" for ref in references]
+    reference_tokens = sum(count_tokens(block, model) + 1 for block in blocks)
+    if blocks:
+        reference_tokens += count_tokens(REFERENCE_HEADER, model)
+
+    target_budget = max(budget - reference_tokens, int(budget * TARGET_SHARE))
+    target, target_status = fit_target(target_text, target_budget, model)
+    target_tokens = count_tokens(target, model)
+    remaining = budget - target_tokens
+
+    query_words = _words(query_text + "\n" + target_text)
+    ranked = sorted(
+        range(len(references)),
+        key=lambda i: relevance_score(query_words, references[i]["content"]),
+        reverse=True
+    )
+
+    chosen = {}
+    if references:
+        remaining -= count_tokens(REFERENCE_HEADER, model)
+    for i in ranked:
+        block = blocks[i]
+        tokens = count_tokens(block, model) + 1
+        if tokens <= remaining:
+            chosen[i] = (block, "full")
+            remaining -= tokens
+        elif remaining >= MIN_REFERENCE_TOKENS:
+            block = truncate_to_tokens(block, remaining - 1, model)
+            chosen[i] = (block, "truncated")
+            remaining = 0
+        else:
+            chosen[i] = (None, "dropped")
+
+    ref_texts = []
+    for i, ref in enumerate(references):
+        block, status = chosen[i]
+        report.append({
+            "section": f"reference:{ref['path']}",
+            "tokens": count_tokens(block, model) if block else 0,
+            "status": status
+        })
+        if block:
+            ref_texts.append(block)
+
+    report.append({"section": "target", "tokens": target_tokens, "status": target_status})
+
+    user_prompt = target
+    if ref_texts:
+        user_prompt = REFERENCE_HEADER + "\n\n".join(ref_texts) + "\n\n" + target
+    report.append({"section": "user_total", "tokens": count_tokens(user_prompt, model), "budget": budget})
+    return user_prompt, report
@@ -0,0 +1,111 @@
+from collections import defaultdict
+
+
+# -----------------------------
+# Class: Conversation Store (indexed, append-only history)
+# -----------------------------
+class ConversationStore:
+    """
+    Wraps state["conversationHistory"] (the same list object, so exporters
+    keep working on plain dicts) with indexes that are updated on append:
+
+      by_id      message id -> message (with parentId, the parent links)
+      children   parent id -> replies, in commit order (None = top level)
+      roots      message id -> thread root, memoised
+
+    Thread chains are rebuilt from the parent links when asked for, so a
+    context lookup is O(depth) per reply and memory stays O(n) however
+    deep threads grow, instead of rebuilding an id map from the full
+    history every time.
+    """
+
+    def __init__(self, messages=None):
+        self.messages = messages if messages is not None else []
+        self.by_id = {}
+        self.children = defaultdict(list)
+        self._roots = {}
+        self._lines = {}
+        self._indexed = 0
+        self._sync()
+
+    def __len__(self):
+        return len(self.messages)
+
+    def _sync(self):
+        # Index anything appended to the list directly (e.g. loaded history)
+        while self._indexed < len(self.messages):
+            message = self.messages[self._indexed]
+            self.by_id[message["id"]] = message
+            self.children[message.get("parentId")].append(message)
+            self._indexed += 1
+
+    def append(self, message):
+        self.messages.append(message)
+        self._sync()
+        return message
+
+    def get(self, message_id):
+        self._sync()
+        return self.by_id.get(message_id)
+
+    def parent(self, message):
+        return self.get(message.get("parentId"))
+
+    def replies_to(self, parent_id=None):
+        self._sync()
+        return self.children.get(parent_id, [])
+
+    def ancestry(self, message):
+        """
+        Returns the chain from the thread root down to `message` (inclusive).
+        Unknown parents end the chain, like a missing parent did before.
+        """
+        self._sync()
+        chain = []
+        seen_ids = set()
+        node = message
+        while node is not None and node["id"] not in seen_ids:
+            chain.append(node)
+            seen_ids.add(node["id"])  # guards against a parentId cycle in hand-edited history
+            node = self.by_id.get(node.get("parentId"))
+        chain.reverse()
+        return chain
+
+    def root(self, message):
+        """The first message of `message`'s chain, as ancestry() would give it."""
+        self._sync()
+        # Walk up to the nearest memoised ancestor, then record its root on the way
+        pending = []
+        seen_ids = set()
+        node = message
+        root = None
+        while node is not None and node["id"] not in seen_ids:
+            known = self._roots.get(node["id"])
+            if known is not None and self.by_id.get(node["id"]) is node:
+                root = known
+                break
+            pending.append(node)
+            seen_ids.add(node["id"])
+            node = self.by_id.get(node.get("parentId"))
+        if root is None and node is not None:
+            return pending[-1]  # a parentId cycle: its "root" depends on where the walk started
+
+        root = root or pending[-1]
+        for node in pending:
+            if self.by_id.get(node["id"]) is node:
+                self._roots[node["id"]] = root
+        return root
+
+    def thread_context(self, message):
+        lines = []
+        for node in self.ancestry(message):
+            line = self._lines.get(node["id"])
+            if line is None:
+                line = f"{node['persona']}: {node['text']}"
+                if self.by_id.get(node["id"]) is node:
+                    self._lines[node["id"]] = line
+            lines.append(line)
+        return "\n".join(lines)
+
+    def random_message(self, rng):
+        return rng.choice(self.messages)
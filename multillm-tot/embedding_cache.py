@@ -0,0 +1,91 @@
+import os
+import sys
+import json
+import hashlib
+import threading
+from array import array
+from pathlib import Path
+
+DEFAULT_EMBEDDING_CACHE_DIR = "cache/embeddings"
+
+
+# -----------------------------
+# Function: Cache Key for an Embedding
+# -----------------------------
+def embedding_key(model, text):
+    return model + ":" + hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# -----------------------------
+# Class: Persistent Embedding Cache (float32 array store)
+# -----------------------------
+class EmbeddingCache:
+    """
+    Maps (model, sha256(text)) to an embedding vector.
+
+    Vectors are appended as raw little-endian float32 rows to vectors.f32
+    (6 KB for a 1536-dim vector instead of ~30 KB of JSON floats), and
+    index.jsonl records key -> byte offset and dimension, one line per vector.
+    Both files are append-only, so a crashed run never corrupts earlier entries.
+    """
+
+    def __init__(self, folder=DEFAULT_EMBEDDING_CACHE_DIR):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.folder / "vectors.f32"
+        self.index_path = self.folder / "index.jsonl"
+        self.hits = 0
+        self.misses = 0
+        self._index = {}
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+        if self.index_path.exists():
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn last line from an interrupted write
+                    self._index[entry["key"]] = (entry["offset"], entry["dim"])
+
+    def __len__(self):
+        return len(self._index)
+
+    def get(self, model, text):
+        key = embedding_key(model, text)
+        with self._lock:
+            if key in self._loaded:
+                self.hits += 1
+                return self._loaded[key]
+            location = self._index.get(key)
+            if location is None:
+                self.misses += 1
+                return None
+            offset, dim = location
+            vector = array("f")
+            with open(self.vectors_path, "rb") as f:
+                f.seek(offset)
+                vector.fromfile(f, dim)
+            if sys.byteorder == "big":
+                vector.byteswap()
+            self._loaded[key] = vector.tolist()
+            self.hits += 1
+            return self._loaded[key]
+
+    def put(self, model, text, vector):
+        key = embedding_key(model, text)
+        row = array("f", vector)
+        stored = row.tolist()
+        if sys.byteorder == "big":
+            row.byteswap()
+        with self._lock:
+            if key in self._index:
+                return
+            with open(self.vectors_path, "ab") as f:
+                offset = f.seek(0, os.SEEK_END)
+                row.tofile(f)
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "offset": offset, "dim": len(vector)}) + "\n")
+            self._index[key] = (offset, len(vector))
+            self._loaded[key] = stored
@@ -1,5 +1,6 @@
 from datetime import datetime
 from collections import defaultdict
+from tree_walk import TreeVisitor, iter_visit
 
 def get_round_class(round_value):
     base = "round-badge"
@@ -12,9 +13,9 @@ def format_round_label(round_value):
         return f"🟣 {round_value}"
     return f"Round {round_value}"
 
-def render_node(node, persona_colors):
+def render_node_open(node, persona_colors):
     color = persona_colors.get(node["persona"], "#000")
-    content = f"""
+    return f"""
         <details open>
             <summary>
                 <span class="persona" style="color: {color};">{node['persona']}</span>
@@ -26,128 +27,118 @@ def render_node(node, persona_colors):
                 {"<div style='font-size: 0.8em; color: #6b7280; margin-top: 0.5em;'>RAG Score: " + (str(node['rag_score']) if node['rag_score'] is not None else "Not Applicable") + "</div>" if "rag_score" in node else ""}
             </div>
     """
-    for child in node.get("children", []):
-        content += f'<div class="thread">{render_node(child, persona_colors)}</div>\n'
-    content += "</details>\n"
-    return content
 
-# -----------------------------
-# Function: HTML Template with Styles
-# -----------------------------
-def generate_html_with_styles(
-        tree, 
-        title, 
-        timestamp, 
-        summary_lines, 
-        persona_colors, 
-        engagement_score, 
-        total_comments, 
-        cli_command,
-        runtime_log,
-        discussion_summary=None):
-    #     state):
-    # cli_command = state["cli_command"]
-    # runtime_log = state["runtime_log"]
-
-    html = f"""<!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>{title}</title>
-            <style>
-                body {{
+def is_goal_node(node):
+    return isinstance(node["round"], str) and node["round"].lower().startswith("goal")
+
+def render_metrics_bar(metrics_summary):
+    # Session totals from metrics.SessionMetrics.summary()
+    if not metrics_summary:
+        return ""
+    tokens = metrics_summary["prompt_tokens"] + metrics_summary["completion_tokens"]
+    return f"""
+            <span>📞 Calls: {metrics_summary['calls']} ({metrics_summary['errors']} failed, {metrics_summary['retries']} retries)</span>
+            <span>⏱️ Call Time: {metrics_summary['call_seconds']}s</span>
+            <span>🪙 Tokens: {tokens} ({metrics_summary['cached_tokens']} cached)</span>
+            <span>♻️ Cache Hits: {metrics_summary['cache_hits']}</span>
+            <span>💲 Est. Cost: ${metrics_summary['cost_usd']:.4f}</span>"""
+
+# Page-level CSS shared by the HTML exporters
+PAGE_STYLES = """
+                body {
                     font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
                     background-color: #f9f9f9;
                     color: #333;
                     margin: 2em;
-                }}
-                h1 {{ color: #222; }}
-                .timestamp {{
+                }
+                h1 { color: #222; }
+                .timestamp {
                     font-size: 0.9em;
                     color: #555;
                     margin-bottom: 1em;
-                }}
-                .meta-bar {{
+                }
+                .meta-bar {
                     background-color: #0f172a;
                     color: white;
                     padding: 12px 16px;
                     border-radius: 8px;
                     display: flex;
+                    flex-wrap: wrap;
                     gap: 1.5em;
                     font-size: 0.9em;
                     margin-bottom: 1.5em;
-                }}
-                .meta-bar span {{
+                }
+                .meta-bar span {
                     display: flex;
                     align-items: center;
                     gap: 0.4em;
-                }}
-                .message {{
+                }
+                .message {
                     background-color: white;
                     line-height: 1.45;
                     border: 1px solid #ccc;
                     border-radius: 8px;
                     padding: 0.50em 1em;
                     margin: 0.5em 0;
-                }}
-                .persona {{
+                }
+                .persona {
                     font-weight: bold;
                     padding: 2px 6px;
                     border-radius: 6px;
                     background-color: rgba(255, 255, 255, 0.15);
                     color: white;
-                }}
-                .round-badge {{
+                }
+                .round-badge {
                     background-color: #334155;
                     color: #f1f5f9;
                     border-radius: 12px;
                     padding: 2px 8px;
                     font-size: 0.8em;
                     margin-left: 10px;
-                }}
-                .goal-badge {{
+                }
+                .goal-badge {
                     background-color: #9333ea;
                     color: white;
-                }}
-                .timestamp-badge {{
+                }
+                .timestamp-badge {
                     font-size: 0.75em;
                     color: #cbd5e1;
                     margin-left: 12px;
-                }}
-                .thread {{
+                }
+                .thread {
                     margin-left: 1em;
                     border-left: 2px solid #ccc;
                     padding-left: .5em;
-                }}
-                details {{
+                }
+                details {
                     margin: 0.25em 0;
                     background: linear-gradient(to right, #1e1b4b, #312e81);
                     padding: 1em;
                     border-radius: 8px;
-                }}
-                summary {{
+                }
+                summary {
                     font-weight: bold;
                     cursor: pointer;
                     color: white;
-                }}
-                .extra-meta {{
+                }
+                .extra-meta {
                     margin-top: 2em;
-                }}
-                .extra-meta details {{
+                }
+                .extra-meta details {
                     background: #0f172a;
                     color: #f8fafc;
                     padding: 1em;
                     margin-bottom: 1em;
                     border-radius: 8px;
                     font-family: 'Fira Mono', monospace;
-                }}
-                .extra-meta summary {{
+                }
+                .extra-meta summary {
                     font-weight: bold;
                     font-size: 1em;
                     cursor: pointer;
                     color: #f8fafc;
-                }}
-                .extra-meta pre {{
+                }
+                .extra-meta pre {
                     background-color: #1e293b;
                     color: #f1f5f9;
                     padding: 0.75em;
@@ -155,49 +146,95 @@ def generate_html_with_styles(
                     border-radius: 6px;
                     overflow-x: auto;
                     font-size: 0.9em;
-                }}
+                }"""
+
+# -----------------------------
+# Class: HTML Exporter (tree visitor)
+# -----------------------------
+class HtmlVisitor(TreeVisitor):
+    """
+    Renders the thread explorer page. Goal-round roots come last in the
+    tree (they are the last messages committed) and get their own heading.
+    """
+
+    # CSS added after PAGE_STYLES by subclasses
+    extra_styles = ""
+
+    def __init__(
+            self,
+            title,
+            timestamp,
+            summary_lines,
+            persona_colors,
+            engagement_score,
+            total_comments,
+            cli_command,
+            runtime_log,
+            discussion_summary=None,
+            metrics_summary=None):
+        self.title = title
+        self.timestamp = timestamp
+        self.summary_lines = summary_lines
+        self.persona_colors = persona_colors
+        self.engagement_score = engagement_score
+        self.total_comments = total_comments
+        self.cli_command = cli_command
+        self.runtime_log = runtime_log
+        self.discussion_summary = discussion_summary
+        self.metrics_summary = metrics_summary
+        self._in_goal_round = False
+
+    def header(self):
+        return f"""<!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="UTF-8">
+            <title>{self.title}</title>
+            <style>{PAGE_STYLES}{self.extra_styles}
             </style>
         </head>
         <body>
-        <h1>Discussion: {title}</h1>
-        <div class="timestamp">Generated on <em>{timestamp}</em></div>
+        <h1>Discussion: {self.title}</h1>
+        <div class="timestamp">Generated on <em>{self.timestamp}</em></div>
 
         <div class="meta-bar">
-            <span>🔥 Engagement Level: {engagement_score:.0%}</span>
-            <span>💬 Comments: {total_comments}</span>
+            <span>🔥 Engagement Level: {self.engagement_score:.0%}</span>
+            <span>💬 Comments: {self.total_comments}</span>
+            {render_metrics_bar(self.metrics_summary)}
         </div>
         """
 
-    # Split discussion vs goal round nodes
-    normal_nodes = [n for n in tree if not (isinstance(n["round"], str) and n["round"].lower().startswith("goal"))]
-    goal_nodes = [n for n in tree if isinstance(n["round"], str) and n["round"].lower().startswith("goal")]
+    def enter(self, node, depth):
+        chunk = render_node_open(node, self.persona_colors)
+        if depth:
+            return '<div class="thread">' + chunk
+        if is_goal_node(node) and not self._in_goal_round:
+            self._in_goal_round = True
+            return "<h2 style='margin-top: 2em; color: #9333ea;'>🟣 Goal Round</h2>\n" + chunk
+        return chunk
 
-    for node in normal_nodes:
-        html += render_node(node, persona_colors)
+    def leave(self, node, depth):
+        return "</details>\n" + ('</div>\n' if depth else "")
 
-    if goal_nodes:
-        html += "<h2 style='margin-top: 2em; color: #9333ea;'>🟣 Goal Round</h2>\n"
-        for node in goal_nodes:
-            html += render_node(node, persona_colors)
-
-    html += """
+    def footer(self):
+        chunks = ["""
     <details open>
     <summary>📝 Discussion Summary</summary>
-    """
+    """]
 
-    if discussion_summary:
-        html += f"""
+        if self.discussion_summary:
+            chunks.append(f"""
         <div style='margin-bottom: 1em; color: white;'>
-            <p><strong>Case Summary:</strong> {discussion_summary}</p>
+            <p><strong>Case Summary:</strong> {self.discussion_summary}</p>
         </div>
-        """
+        """)
 
-    html += "<ul>\n"
-    for line in summary_lines:
-        html += f"<li style='color: white'>{line}</li>\n"
-    html += "</ul></details>"
+        chunks.append("<ul>\n")
+        for line in self.summary_lines:
+            chunks.append(f"<li style='color: white'>{line}</li>\n")
+        chunks.append("</ul></details>")
 
-    html += f"""
+        chunks.append(f"""
         <div class="extra-meta">
         <details open>
         <summary>💻 CLI Command</summary>
@@ -206,13 +243,13 @@ def generate_html_with_styles(
                 <span style="color: #f1f5f9; font-size: 0.9em;">Copy this command:</span>
                 <button onclick="copyToClipboard('cli-command')" style="background-color: #334155; color: white; border: none; padding: 4px 10px; border-radius: 4px; cursor: pointer;">📋 Copy</button>
             </div>
-            <pre style="margin: 0;"><code id="cli-command" style="color: #f1f5f9;">{cli_command}</code></pre>
+            <pre style="margin: 0;"><code id="cli-command" style="color: #f1f5f9;">{self.cli_command}</code></pre>
         </div>
         </details>
 
         <details>
         <summary>📜 Run Log</summary>
-        <pre><code>{chr(10).join(runtime_log)}</code></pre>
+        <pre><code>{chr(10).join(self.runtime_log)}</code></pre>
         </details>
         </div>
 
@@ -234,8 +271,18 @@ def generate_html_with_styles(
         }}
         </script>
 
-        """
+        """)
+
+        chunks.append("</body></html>")
+        return "".join(chunks)
+
+
+# -----------------------------
+# Function: HTML Template with Styles
+# -----------------------------
+def iter_html_with_styles(tree, *args, **kwargs):
+    return iter_visit(tree, HtmlVisitor(*args, **kwargs))
 
-    html += "</body></html>"
 
-    return html
+def generate_html_with_styles(*args, **kwargs):
+    return "".join(iter_html_with_styles(*args, **kwargs))
@@ -0,0 +1,269 @@
+import os
+import json
+import zlib
+import base64
+from exporter_html import HtmlVisitor
+from file_utils import ChunkWriter
+
+# embedded: JSON in the page; gzip: gzip + base64 in the page; sidecar: <page>.data.js next to it
+LAZY_DATA_MODES = ["embedded", "gzip", "sidecar"]
+
+LAZY_STYLES = """
+                details.node {
+                    background: #1e1b4b;
+                    padding: 0.5em 1em;
+                    content-visibility: auto;
+                    contain-intrinsic-size: auto 3em;
+                }
+                .node > .message {
+                    white-space: pre-wrap;
+                }
+                .snippet {
+                    font-weight: normal;
+                    font-size: 0.85em;
+                    color: #cbd5e1;
+                    margin-top: 0.25em;
+                    white-space: nowrap;
+                    overflow: hidden;
+                    text-overflow: ellipsis;
+                }
+                details[open] > summary .snippet {
+                    display: none;
+                }
+                .reply-count {
+                    font-size: 0.75em;
+                    color: #a5b4fc;
+                    margin-left: 12px;
+                }
+                .rag-score {
+                    font-size: 0.8em;
+                    color: #6b7280;
+                    margin-top: 0.5em;
+                    white-space: normal;
+                }
+                .more {
+                    margin: 0.5em 0;
+                    background-color: #334155;
+                    color: white;
+                    border: none;
+                    padding: 4px 10px;
+                    border-radius: 4px;
+                    cursor: pointer;
+                }
+                .goal-heading {
+                    margin-top: 2em;
+                    color: #9333ea;
+                }"""
+
+VIEWER_SCRIPT = """
+        <script>
+        (function () {
+            // Messages rendered per step, for top-level threads and for long reply lists
+            const PAGE_SIZE = 200;
+            const container = document.getElementById("threads");
+
+            async function loadData() {
+                if (window.DISCUSSION_DATA) {
+                    return window.DISCUSSION_DATA;
+                }
+                const source = document.getElementById("discussion-data");
+                if (source.dataset.encoding !== "gzip") {
+                    return JSON.parse(source.textContent);
+                }
+                const bytes = Uint8Array.from(atob(source.textContent), c => c.charCodeAt(0));
+                const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("gzip"));
+                return JSON.parse(await new Response(stream).text());
+            }
+
+            function isGoal(round) {
+                return typeof round === "string" && round.toLowerCase().startsWith("goal");
+            }
+
+            function el(tag, className, text) {
+                const node = document.createElement(tag);
+                if (className) node.className = className;
+                if (text !== undefined) node.textContent = text;
+                return node;
+            }
+
+            loadData().then(data => {
+                // Rows: [parent index or -1, persona index, round, timestamp, text(, rag score)], in reading order
+                const rows = data.nodes;
+                const replies = new Array(rows.length);
+                const roots = [];
+                const goalRoots = [];
+                rows.forEach((row, i) => {
+                    if (row[0] < 0) {
+                        (isGoal(row[2]) ? goalRoots : roots).push(i);
+                    } else {
+                        (replies[row[0]] || (replies[row[0]] = [])).push(i);
+                    }
+                });
+
+                const observer = new IntersectionObserver(entries => {
+                    entries.forEach(entry => {
+                        if (entry.isIntersecting) entry.target.loadMore();
+                    });
+                }, { rootMargin: "800px" });
+
+                function renderMessage(i) {
+                    const row = rows[i];
+                    const persona = data.personas[row[1]];
+                    const count = replies[i] ? replies[i].length : 0;
+                    const details = el("details", "node");
+                    const summary = el("summary");
+                    const name = el("span", "persona", persona);
+                    name.style.color = data.colors[persona] || "#000";
+                    summary.append(
+                        name,
+                        el("span", isGoal(row[2]) ? "round-badge goal-badge" : "round-badge",
+                           isGoal(row[2]) ? "🟣 " + row[2] : "Round " + row[2]),
+                        el("span", "timestamp-badge", row[3])
+                    );
+                    if (count) summary.append(el("span", "reply-count", count + (count === 1 ? " reply" : " replies")));
+                    summary.append(el("div", "snippet", row[4].slice(0, 200)));
+                    details.append(summary);
+
+                    // The message body and replies are built the first time the node is opened
+                    details.addEventListener("toggle", () => {
+                        if (!details.open || details.dataset.rendered) return;
+                        details.dataset.rendered = "1";
+                        const message = el("div", "message", row[4]);
+                        if (row.length > 5) {
+                            message.append(el("div", "rag-score", "RAG Score: " + (row[5] === null ? "Not Applicable" : row[5])));
+                        }
+                        details.append(message);
+                        if (count) {
+                            const thread = el("div", "thread");
+                            details.append(thread);
+                            appendPage(thread, replies[i], 0);
+                        }
+                    });
+                    return details;
+                }
+
+                // Renders one page of items; the rest follow as the "more" button scrolls into view
+                function appendPage(parent, items, start) {
+                    const end = Math.min(start + PAGE_SIZE, items.length);
+                    const fragment = document.createDocumentFragment();
+                    for (let k = start; k < end; k++) {
+                        fragment.append(renderMessage(items[k]));
+                    }
+                    parent.append(fragment);
+                    if (end < items.length) {
+                        const more = el("button", "more", "Show more (" + (items.length - end) + " left)");
+                        more.loadMore = () => {
+                            observer.unobserve(more);
+                            more.remove();
+                            appendPage(parent, items, end);
+                        };
+                        more.onclick = more.loadMore;
+                        parent.append(more);
+                        observer.observe(more);
+                    }
+                }
+
+                const discussion = el("div");
+                container.append(discussion);
+                appendPage(discussion, roots, 0);
+                if (goalRoots.length) {
+                    const goal = el("div");
+                    container.append(el("h2", "goal-heading", "🟣 Goal Round"), goal);
+                    appendPage(goal, goalRoots, 0);
+                }
+            });
+        })();
+        </script>
+"""
+
+
+def _compact(value):
+    # "<" escaped so no message can close the <script> it is embedded in
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).replace("<", "\\u003c")
+
+
+# -----------------------------
+# Class: Lazy HTML Exporter (tree visitor)
+# -----------------------------
+class LazyHtmlVisitor(HtmlVisitor):
+    """
+    Thread explorer for very large sessions. Messages are written once as
+    compact JSON rows and rendered by the page on demand: threads start
+    collapsed, top-level threads are added as the page scrolls, and a
+    message's text and replies are only built when it is expanded.
+
+    `data` is one of LAZY_DATA_MODES. A sidecar needs the page's path and
+    falls back to embedded without one (e.g. console output).
+    """
+
+    extra_styles = LAZY_STYLES
+
+    def __init__(self, *args, data="embedded", path=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.data = data if data != "sidecar" or path else "embedded"
+        self.sidecar_path = f"{os.path.splitext(path)[0]}.data.js" if self.data == "sidecar" else None
+        self._ancestors = []  # row index of each open ancestor
+        self._rows = 0
+        self._personas = {}
+        self._gzip = None
+        self._pending = b""
+        self._sidecar = None
+
+    def header(self):
+        page = super().header() + '\n        <div id="threads"></div>\n'
+        if self.data == "sidecar":
+            self._sidecar = ChunkWriter(open(self.sidecar_path, "w", encoding="utf-8"))
+            self._sidecar.write("window.DISCUSSION_DATA = ")
+            page += f'        <script src="{os.path.basename(self.sidecar_path)}"></script>\n'
+        else:
+            if self.data == "gzip":
+                self._gzip = zlib.compressobj(wbits=31)
+            page += f'        <script id="discussion-data" type="application/json" data-encoding="{self.data}">'
+        return page + self._data('{"nodes":[')
+
+    def enter(self, node, depth):
+        parent = self._ancestors[-1] if depth else -1
+        persona = self._personas.setdefault(node["persona"], len(self._personas))
+        row = [parent, persona, node["round"], node["timestamp"], node["text"]]
+        if "rag_score" in node:
+            row.append(node["rag_score"])
+        chunk = self._data(("," if self._rows else "") + _compact(row))
+        self._ancestors.append(self._rows)
+        self._rows += 1
+        return chunk
+
+    def leave(self, node, depth):
+        self._ancestors.pop()
+        return ""
+
+    def footer(self):
+        tail = self._data(
+            '],"personas":' + _compact(list(self._personas)) +
+            ',"colors":' + _compact(self.persona_colors) + '}'
+        )
+        if self._sidecar:
+            self._sidecar.write(";\n")
+            self._sidecar.flush()
+            for handle in self._sidecar.handles:
+                handle.close()
+        else:
+            if self._gzip:
+                self._pending += self._gzip.flush()
+                tail += self._encode(final=True)
+            tail += "</script>\n"
+        return tail + VIEWER_SCRIPT + super().footer()
+
+    def _data(self, text):
+        if self._sidecar:
+            self._sidecar.write(text)
+            return ""
+        if self._gzip is None:
+            return text
+        self._pending += self._gzip.compress(text.encode("utf-8"))
+        return self._encode()
+
+    def _encode(self, final=False):
+        # base64 in whole 3-byte groups, so the pieces concatenate into one valid string
+        cut = len(self._pending) if final else len(self._pending) // 3 * 3
+        chunk, self._pending = self._pending[:cut], self._pending[cut:]
+        return base64.b64encode(chunk).decode("ascii")
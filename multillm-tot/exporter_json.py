@@ -1,4 +1,63 @@
 import json
+from tree_walk import TreeVisitor, iter_visit
+
+# -----------------------------
+# Class: JSON Exporter (tree visitor)
+# -----------------------------
+class JsonVisitor(TreeVisitor):
+    """
+    Writes the same text as json.dumps(tree, indent=2), one node at a time.
+    json's own encoder recurses per nesting level, which deep threads
+    overflow. A node's "children" list is opened in enter() and closed,
+    with any keys after it, in leave().
+    """
+
+    def __init__(self):
+        # Nodes written so far in each open list, outermost first
+        self._written = [0]
+
+    def header(self):
+        return "["
+
+    def enter(self, node, depth):
+        pad = "  " * (2 * depth + 1)
+        chunks = ["," if self._written[depth] else "", "\n", pad, "{"]
+        self._written[depth] += 1
+        keys = list(node)
+        for position, key in enumerate(keys):
+            if key == "children" and node[key]:
+                chunks.append(self._member(position, key, "[", depth, raw=True))
+                self._written.append(0)
+                return "".join(chunks)
+            chunks.append(self._member(position, key, node[key], depth))
+        chunks.append(f"\n{pad}}}")
+        return "".join(chunks)
+
+    def leave(self, node, depth):
+        if not node.get("children"):
+            return ""  # closed in enter()
+        self._written.pop()
+        pad = "  " * (2 * depth + 1)
+        keys = list(node)
+        chunks = [f"\n{pad}  ]"]
+        for position in range(keys.index("children") + 1, len(keys)):
+            chunks.append(self._member(position, keys[position], node[keys[position]], depth))
+        chunks.append(f"\n{pad}}}")
+        return "".join(chunks)
+
+    def footer(self):
+        return "\n]" if self._written[0] else "]"
+
+    def _member(self, position, key, value, depth, raw=False):
+        pad = "  " * (2 * depth + 2)
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value, indent=2).replace("\n", "\n" + pad)
+        elif not raw:
+            value = json.dumps(value)
+        return f"{',' if position else ''}\n{pad}{json.dumps(key)}: {value}"
+
+def iter_json_from_tree(messages):
+    return iter_visit(messages, JsonVisitor())
 
 def generate_json_from_tree(messages):
-    return json.dumps(messages, indent=2)
+    return "".join(iter_json_from_tree(messages))
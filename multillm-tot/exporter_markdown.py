@@ -1,20 +1,25 @@
+from tree_walk import TreeVisitor, iter_visit
+
 # -----------------------------
-# Function: Format Markdown Recursively
+# Class: Markdown Exporter (tree visitor)
 # -----------------------------
+class MarkdownVisitor(TreeVisitor):
+    def __init__(self, title):
+        self.title = title
 
-def generate_markdown_from_tree(messages, title):
-    def recurse(msgs, level=0):
-        md = ""
-        indent = ">" * level
-        for msg in msgs:
-            persona = msg["persona"]
-            text = msg["text"].strip()
-            if indent:
-                md += f"{indent} **{persona}**:\n\n{indent} {text}\n\n"
-            else:
-                md += f"**{persona}**:\n\n{text}\n\n"
-            if msg.get("children"):
-                md += recurse(msg["children"], level + 1)
-        return md
+    def header(self):
+        return f"## Discussion: {self.title}\n\n"
+
+    def enter(self, msg, depth):
+        indent = ">" * depth
+        persona = msg["persona"]
+        text = msg["text"].strip()
+        if indent:
+            return f"{indent} **{persona}**:\n\n{indent} {text}\n\n"
+        return f"**{persona}**:\n\n{text}\n\n"
 
-    return f"## Discussion: {title}\n\n" + recurse(messages)
+def iter_markdown_from_tree(messages, title):
+    return iter_visit(messages, MarkdownVisitor(title))
+
+def generate_markdown_from_tree(messages, title):
+    return "".join(iter_markdown_from_tree(messages, title))
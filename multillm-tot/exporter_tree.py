@@ -1,16 +1,16 @@
+from tree_walk import TreeVisitor, iter_visit
+
 # -----------------------------
-# Function: Format JSON tree Pretty
+# Class: Indented Tree Exporter (tree visitor)
 # -----------------------------
+class TreeTextVisitor(TreeVisitor):
+    def enter(self, msg, depth):
+        indent = "  " * depth
+        snippet = msg["text"][:60].replace('\n', ' ') + "..."
+        return f"{indent}- {msg['persona']} (Round {msg['round']}): {snippet}\n"
 
-def generate_tree_from_tree(messages):
-    def recurse(msgs, level=0):
-        tree = ""
-        indent = "  " * level
-        for msg in msgs:
-            snippet = msg["text"][:60].replace('\n', ' ') + "..."
-            tree += f"{indent}- {msg['persona']} (Round {msg['round']}): {snippet}\n"
-            if msg.get("children"):
-                tree += recurse(msg["children"], level + 1)
-        return tree
+def iter_tree_from_tree(messages):
+    return iter_visit(messages, TreeTextVisitor())
 
-    return recurse(messages)
+def generate_tree_from_tree(messages):
+    return "".join(iter_tree_from_tree(messages))
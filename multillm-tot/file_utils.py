@@ -8,3 +8,41 @@ def load_file_reference(path, max_chars=3000):
         raise FileNotFoundError(f"Reference file not found: {path}")
     with open(path, "r", encoding="utf-8") as f:
         return f.read()[:max_chars]
+
+
+# -----------------------------
+# Writing exporter chunks to files / stdout
+# -----------------------------
+WRITE_BUFFER_CHARS = 1 << 16
+
+class ChunkWriter:
+    """
+    Buffers an exporter's chunks and writes them to every handle in blocks
+    of about WRITE_BUFFER_CHARS, so no full copy of the document is built.
+    """
+
+    def __init__(self, *handles):
+        self.handles = handles
+        self.written = 0
+        self._buffer = []
+        self._buffered = 0
+
+    def write(self, chunk):
+        self._buffer.append(chunk)
+        self._buffered += len(chunk)
+        if self._buffered >= WRITE_BUFFER_CHARS:
+            self._drain()
+
+    def _drain(self):
+        block = "".join(self._buffer)
+        for handle in self.handles:
+            handle.write(block)
+        self.written += self._buffered
+        self._buffer = []
+        self._buffered = 0
+
+    def flush(self):
+        self._drain()
+        for handle in self.handles:
+            handle.flush()
+        return self.written
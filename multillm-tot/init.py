@@ -1,10 +1,38 @@
 
+import os
 import json
-from openai import OpenAI
 from pathlib import Path
+from providers import get_router
+from llm_cache import ResponseCache, DEFAULT_CACHE_PATH
+from embedding_cache import EmbeddingCache, DEFAULT_EMBEDDING_CACHE_DIR
 
-def get_openai_client():
-    return OpenAI()
+def get_response_cache(cache_mode="off", cache_path=DEFAULT_CACHE_PATH):
+    return ResponseCache(cache_path, mode=cache_mode) if cache_mode != "off" else None
+
+def get_openai_client(max_connections=None, max_in_flight=None, cache_mode="off", cache_path=DEFAULT_CACHE_PATH):
+    # Shared async engine behind a provider router: one client and pooled connection set per provider
+    cache = get_response_cache(cache_mode, cache_path)
+    # Embeddings are cached by default; set EMBEDDING_CACHE_DIR=off to disable
+    embedding_cache_dir = os.environ.get("EMBEDDING_CACHE_DIR", DEFAULT_EMBEDDING_CACHE_DIR)
+    embedding_cache = EmbeddingCache(embedding_cache_dir) if embedding_cache_dir != "off" else None
+    return get_router(
+        max_connections=max_connections,
+        max_in_flight=max_in_flight,
+        cache=cache,
+        embedding_cache=embedding_cache
+    )
+
+def get_engine(backend="live", max_connections=None, max_in_flight=None, cache_mode="off", cache_path=DEFAULT_CACHE_PATH):
+    # "mock" swaps in the offline fake LLM + Qdrant backend (see mock_backend.py);
+    # the response cache and in-flight cap apply to it the same way
+    if backend == "mock":
+        from mock_backend import create_mock_backend
+        return create_mock_backend(
+            max_connections=max_connections,
+            max_in_flight=max_in_flight,
+            cache=get_response_cache(cache_mode, cache_path)
+        )
+    return get_openai_client(max_connections, max_in_flight, cache_mode, cache_path)
 
 def load_persona_schema(schema_path: str = "persona.schema.json"):
     path = Path(schema_path)
@@ -0,0 +1,73 @@
+import sys
+import time
+from agent_log import log_prompt
+
+
+# -----------------------------
+# Class: Streamed Tokens to the Terminal
+# -----------------------------
+class TerminalStream:
+    """
+    Writes streamed tokens to stdout as they arrive. Replies streaming
+    concurrently interleave, so the persona name is printed again whenever
+    the speaker changes.
+    """
+
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+        self.current = None
+
+    def write(self, persona, text):
+        if persona != self.current:
+            self.out.write(("\n" if self.current else "") + f"[{persona}] ")
+            self.current = persona
+        self.out.write(text)
+        self.out.flush()
+
+    def reset(self, persona):
+        # A retried stream starts over; what was printed can't be taken back, so mark it
+        self.write(persona, " [retrying, discard the above]")
+        self.end(persona)
+
+    def end(self, persona):
+        # Finishes the open line even if another persona holds it, so the
+        # caller's status line never lands inside someone else's stream
+        if self.current is not None:
+            self.out.write("\n")
+            self.out.flush()
+            self.current = None
+
+
+# -----------------------------
+# Class: Streamed Tokens to the Prompt Log
+# -----------------------------
+class LogStream:
+    """
+    Buffers deltas and writes them to the prompt log as "assistant_delta"
+    entries at most every `interval` seconds, so the log shows progress
+    without one JSON line per token.
+    """
+
+    def __init__(self, logger, persona, interval=0.25):
+        self.logger = logger
+        self.persona = persona
+        self.interval = interval
+        self.buffer = []
+        self.last_flush = time.monotonic()
+
+    def write(self, text):
+        self.buffer.append(text)
+        if time.monotonic() - self.last_flush >= self.interval:
+            self.flush()
+
+    def reset(self):
+        # Deltas already logged can't be taken back; readers drop those before this entry
+        self.buffer = []
+        log_prompt(self.logger, self.persona, "assistant_reset", "")
+        self.last_flush = time.monotonic()
+
+    def flush(self):
+        if self.buffer:
+            log_prompt(self.logger, self.persona, "assistant_delta", "".join(self.buffer))
+            self.buffer = []
+        self.last_flush = time.monotonic()
@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+
+CACHE_MODES = ["read", "write", "off"]
+DEFAULT_CACHE_PATH = "cache/llm_responses.sqlite"
+
+
+# -----------------------------
+# Function: Content-addressed Cache Key
+# -----------------------------
+def make_cache_key(model, messages, **params):
+    """
+    sha256 over the model, the exact messages and the sampling parameters
+    (temperature, ...). Any change to a prompt gives a different key.
+    """
+    payload = json.dumps(
+        {"model": model, "messages": messages, "params": params},
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# -----------------------------
+# Class: On-disk LLM Response Cache (SQLite)
+# -----------------------------
+class ResponseCache:
+    """
+    Stores chat completion results keyed by make_cache_key().
+
+    Modes:
+      read  - serve hits from disk, call the API and store on a miss
+      write - always call the API and overwrite the stored entry (refresh)
+      off   - bypass the cache entirely
+    Entries older than ttl_seconds are ignored and purged; once the file holds
+    more than max_bytes of responses the least recently used ones are evicted.
+
+    get() runs on the engine's event loop, so a hit only notes its access
+    time in memory; those are written in one batch every FLUSH_ACCESS_EVERY
+    hits, before eviction and on close.
+    """
+
+    EVICT_EVERY = 100
+    FLUSH_ACCESS_EVERY = 100
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, mode="read", ttl_seconds=None, max_bytes=None):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode: {mode} (expected one of {', '.join(CACHE_MODES)})")
+        self.mode = mode
+        self.path = path
+        self.ttl_seconds = ttl_seconds or float(os.environ.get("LLM_CACHE_TTL_DAYS", 30)) * 86400
+        self.max_bytes = max_bytes or int(float(os.environ.get("LLM_CACHE_MAX_MB", 256)) * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._accessed = {}  # key -> last access time not yet written
+        self._lock = threading.Lock()
+        self._db = None
+
+        if mode != "off":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT,"
+                " response TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+            self._db.commit()
+            self.evict()
+
+    def get(self, key):
+        if self.mode != "read":
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._accessed[key] = now
+            if len(self._accessed) >= self.FLUSH_ACCESS_EVERY:
+                self._flush_access()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def _flush_access(self):
+        # Caller holds the lock
+        if self._accessed:
+            self._db.executemany("UPDATE responses SET last_access = ? WHERE key = ?",
+                                 [(when, key) for key, when in self._accessed.items()])
+            self._db.commit()
+            self._accessed = {}
+
+    def put(self, key, model, response):
+        if self.mode == "off":
+            return
+        body = json.dumps(response, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._accessed.pop(key, None)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, body, len(body.encode("utf-8")), now, now)
+            )
+            self._db.commit()
+            self._puts += 1
+        if self._puts % self.EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """
+        Drops expired entries, then the least recently used ones until the
+        stored responses fit in max_bytes.
+        """
+        with self._lock:
+            self._flush_access()
+            self._db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                excess = total - self.max_bytes
+                stale_keys = []
+                for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY last_access"):
+                    if excess <= 0:
+                        break
+                    stale_keys.append((key,))
+                    excess -= size
+                self._db.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+            self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._flush_access()
+                self._db.close()
+                self._db = None
@@ -0,0 +1,260 @@
+import asyncio
+import atexit
+import os
+import threading
+import functools
+import httpx
+import metrics
+from openai import AsyncOpenAI
+from llm_cache import make_cache_key
+from context_builder import count_tokens
+from scheduler import get_scheduler, DEFAULT_COMPLETION_ESTIMATE
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+# -----------------------------
+# HTTP/2 needs the optional "h2" package (pip install "httpx[http2]")
+# -----------------------------
+def http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+# -----------------------------
+# Function: Usage Dict from an API Usage Object
+# -----------------------------
+def usage_dict(usage):
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0),
+        "completion_tokens": getattr(usage, "completion_tokens", 0),
+        # Prompt tokens served from the provider's prefix cache
+        "cached_tokens": getattr(details, "cached_tokens", 0) or 0
+    }
+
+
+# -----------------------------
+# Class: Async LLM Engine
+# -----------------------------
+class LLMEngine:
+    """
+    Owns a single AsyncOpenAI client backed by one pooled httpx.AsyncClient,
+    plus a background event loop that every caller shares.
+
+    Async code awaits chat()/embed() directly on the engine loop; sync code
+    goes through run(), so connections stay warm across rounds, summaries,
+    retrieval and whole batches of sessions.
+
+    Passing `host` (another engine) makes this engine run on the host's loop
+    with its own client and pool, e.g. one engine per provider. `transport`
+    replaces the network below httpx (mock_backend.py serves a fake API).
+    """
+
+    def __init__(self,
+                 max_connections=None,
+                 max_keepalive_connections=None,
+                 keepalive_expiry=None,
+                 timeout=None,
+                 max_in_flight=None,
+                 scheduler=None,
+                 provider="openai",
+                 cache=None,
+                 embedding_cache=None,
+                 host=None,
+                 transport=None,
+                 **client_kwargs):
+        self.max_connections = max_connections or int(os.environ.get("LLM_MAX_CONNECTIONS", 20))
+        self.max_keepalive_connections = max_keepalive_connections or int(os.environ.get("LLM_MAX_KEEPALIVE", 10))
+        self.keepalive_expiry = keepalive_expiry or float(os.environ.get("LLM_KEEPALIVE_EXPIRY", 30.0))
+        self.timeout = timeout or float(os.environ.get("LLM_HTTP_TIMEOUT", 60.0))
+        self.max_in_flight = max_in_flight or int(os.environ.get("LLM_MAX_IN_FLIGHT", self.max_connections))
+        # Pacing, retries, deadlines and circuit breaking (shared process-wide by default)
+        self.scheduler = scheduler or get_scheduler()
+        self.provider = provider
+        self.cache = cache
+        self.embedding_cache = embedding_cache
+        self.http2 = http2_available()
+
+        self._owns_loop = host is None
+        if self._owns_loop:
+            self.loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self.loop.run_forever, name="llm-engine", daemon=True)
+            self._thread.start()
+        else:
+            self.loop = host.loop
+            self._thread = host._thread
+
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry
+            ),
+            http2=self.http2,
+            timeout=self.timeout,
+            transport=transport
+        )
+        # Retries are the scheduler's job; the SDK's own would multiply them
+        client_kwargs.setdefault("max_retries", 0)
+        self.client = AsyncOpenAI(http_client=self.http_client, **client_kwargs)
+        self._closed = False
+
+        # Shared by every session in the process: a global cap on in-flight requests (per engine)
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+
+    def run(self, coro, timeout=None):
+        """
+        Runs a coroutine on the engine loop and blocks until it finishes.
+        Must not be called from the engine loop itself.
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("LLMEngine.run() cannot be called from the engine loop; await the coroutine instead.")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    async def _send(self, request, model, estimated_tokens=0, **kwargs):
+        """
+        Sends one request through the scheduler: paced by the model's rate
+        limits, retried with backoff on transient errors, bounded by the call
+        deadline and the provider's circuit breaker, within the in-flight cap.
+        """
+        return await self.scheduler.submit(
+            functools.partial(request, model=model, **kwargs),
+            model=model,
+            provider=self.provider,
+            estimated_tokens=estimated_tokens,
+            slots=self._slots
+        )
+
+    async def chat(self, model, messages, on_token=None, llm=None, **kwargs):
+        """
+        Returns {"content", "usage", "cached", "timing"}. With on_token the
+        completion is streamed: on_token(text) is called for every delta as it
+        arrives and timing also records time to first token ("ttft"). If a
+        stream fails partway and is retried, on_token(None) is called before
+        the retry's first delta: the reply starts over, drop what was shown.
+        The returned dict (and what gets cached) is the same either way.
+        `llm` is a routing hint for providers.ProviderRouter; ignored here.
+        Every call is recorded in the current session's metrics.
+        """
+        with metrics.track("chat", self.provider, model) as call:
+            response = await self._chat(model, messages, on_token, **kwargs)
+            metrics.observe_chat(call, response)
+            return response
+
+    async def _chat(self, model, messages, on_token=None, **kwargs):
+        started = self.loop.time()
+        cache_key = None
+        if self.cache is not None and self.cache.mode != "off":
+            cache_key = make_cache_key(model, messages, **kwargs)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                if on_token:
+                    on_token(cached["content"])
+                return dict(cached, cached=True, timing={"ttft": 0.0, "total": 0.0})
+
+        estimated = sum(count_tokens(m["content"], model) + 4 for m in messages)
+        estimated += kwargs.get("max_tokens") or DEFAULT_COMPLETION_ESTIMATE
+        timing = {"ttft": None, "total": None}
+        if on_token:
+            result = await self._send(self._stream_chat, model, estimated, messages=messages,
+                                      on_token=on_token, started=started, timing=timing, **kwargs)
+        else:
+            response = await self._send(self.client.chat.completions.create, model, estimated,
+                                        messages=messages, **kwargs)
+            result = {
+                "content": response.choices[0].message.content or "",
+                "usage": usage_dict(response.usage)
+            }
+        timing["total"] = round(self.loop.time() - started, 3)
+        used = result["usage"]["prompt_tokens"] + result["usage"]["completion_tokens"]
+        if used:
+            self.scheduler.settle(model, estimated, used)
+
+        if cache_key:
+            self.cache.put(cache_key, model, result)
+        return dict(result, cached=False, timing=timing)
+
+    async def _stream_chat(self, on_token, started, timing, **kwargs):
+        # Consumed inside _send so the request keeps its in-flight slot until the last chunk
+        if timing["ttft"] is not None:
+            # A retry after a partial stream: the listener discards the deltas it already has
+            on_token(None)
+            timing["ttft"] = None
+        stream = await self.client.chat.completions.create(
+            stream=True, stream_options={"include_usage": True}, **kwargs)
+        parts = []
+        usage = None
+        async for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if text:
+                if timing["ttft"] is None:
+                    timing["ttft"] = round(self.loop.time() - started, 3)
+                parts.append(text)
+                on_token(text)
+        return {"content": "".join(parts), "usage": usage_dict(usage)}
+
+    async def embed(self, model, inputs):
+        """
+        Returns one vector per input. With an embedding cache attached, only
+        texts not seen before are sent, together in a single request.
+        """
+        texts = [inputs] if isinstance(inputs, str) else list(inputs)
+        vectors = [None] * len(texts)
+        if self.embedding_cache is not None:
+            vectors = [self.embedding_cache.get(model, text) for text in texts]
+
+        missing = list(dict.fromkeys(texts[i] for i, vector in enumerate(vectors) if vector is None))
+        with metrics.track("embedding", self.provider, model) as call:
+            call["cache_hit"] = not missing
+            if missing:
+                estimated = sum(count_tokens(text, model) for text in missing)
+                response = await self._send(self.client.embeddings.create, model, estimated, input=missing)
+                call["prompt_tokens"] = getattr(response.usage, "prompt_tokens", None) or estimated
+                fetched = {}
+                for text, item in zip(missing, sorted(response.data, key=lambda d: d.index)):
+                    fetched[text] = item.embedding
+                    if self.embedding_cache is not None:
+                        self.embedding_cache.put(model, text, item.embedding)
+                vectors = [vector if vector is not None else fetched[text] for text, vector in zip(texts, vectors)]
+        return vectors
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if not self._owns_loop:
+            # Hosted engines share the host's loop and caches; the host closes those
+            self.run(self.client.close(), timeout=10)
+            return
+        try:
+            self.run(self.client.close(), timeout=10)
+            if self.cache is not None:
+                self.cache.close()
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=10)
+
+
+# -----------------------------
+# Function: Process-wide Engine
+# -----------------------------
+def get_llm_engine(**engine_kwargs):
+    """
+    Returns the shared LLMEngine, creating it on first use. Keyword arguments
+    only apply to that first call (e.g. max_connections from the CLI).
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = LLMEngine(**engine_kwargs)
+            atexit.register(_engine.close)
+        return _engine
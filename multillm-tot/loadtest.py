@@ -0,0 +1,179 @@
+import json
+import time
+import tracemalloc
+import click
+from concurrent.futures import ThreadPoolExecutor
+from rich import print
+from init import load_persona_schema
+from mock_backend import create_mock_backend
+from main import OUTPUT_FORMATS, BINARY_OUTPUTS, GOAL_ROUNDS, SUMMARY_MODES, load_personas, run_session
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# -----------------------------
+# Function: Percentile of a List
+# -----------------------------
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if peak > 1 << 32 else 1024), 1)
+
+
+def synthetic_personas(count):
+    return [
+        {"name": f"Persona {i + 1}", "llm": "ChatGPT", "model": "gpt-4o-mini", "engagement": 0.8}
+        for i in range(count)
+    ]
+
+
+# -----------------------------
+# Function: Run the Load Test
+# -----------------------------
+def run_load(engine, personas, sessions, workers, rounds, concurrency, goal_round, output, summary_mode, seed):
+    """
+    Runs `sessions` full sessions (`workers` at a time) against the mock
+    backend. Returns per-session records plus process wall and CPU time.
+    """
+    def one(i):
+        started = time.perf_counter()
+        state, _ = run_session(
+            f"Load-test prompt {i}", rounds, personas, engine,
+            output=output,
+            goal_round=goal_round,
+            concurrency=concurrency,
+            session_id=f"loadtest-{i}",
+            seed=seed + i,
+            echo=False,
+            summary_mode=summary_mode,
+            log_prompts=False,
+            checkpoints=False
+        )
+        history = state["conversationHistory"]
+        return {
+            "seconds": time.perf_counter() - started,
+            "messages": len(history),
+            "errors": sum(1 for m in history if m["text"].startswith("[ERROR]"))
+        }
+
+    wall_started = time.perf_counter()
+    cpu_started = time.process_time()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        records = list(pool.map(one, range(sessions)))
+    return records, time.perf_counter() - wall_started, time.process_time() - cpu_started
+
+
+# -----------------------------
+# Function: Summarise a Load-test Run
+# -----------------------------
+def build_report(records, wall, cpu, engine, traced_peak=None):
+    """
+    Keeps orchestrator cost (CPU, memory, throughput) apart from the model
+    latency the mock backend simulated, so our own overhead is visible.
+    """
+    messages = sum(r["messages"] for r in records)
+    latencies = engine.stats["latencies"]
+    session_seconds = [r["seconds"] for r in records]
+    return {
+        "sessions": len(records),
+        "messages": messages,
+        "reply_errors": sum(r["errors"] for r in records),
+        "throughput": {
+            "wall_seconds": round(wall, 3),
+            "sessions_per_second": round(len(records) / wall, 2) if wall else None,
+            "messages_per_second": round(messages / wall, 2) if wall else None,
+            "session_seconds_p50": round(percentile(session_seconds, 50), 3),
+            "session_seconds_p95": round(percentile(session_seconds, 95), 3)
+        },
+        "orchestrator": {
+            "cpu_seconds": round(cpu, 3),
+            "cpu_ms_per_message": round(cpu * 1000 / messages, 3) if messages else None,
+            "cpu_utilisation": round(cpu / wall, 3) if wall else None,
+            "peak_rss_mb": peak_rss_mb(),
+            "traced_peak_mb": round(traced_peak / (1024 * 1024), 1) if traced_peak is not None else None
+        },
+        "simulated_model": {
+            "calls": engine.stats["calls"],
+            "injected_errors": engine.stats["errors"],
+            "retries": engine.scheduler.retries,
+            "embedding_inputs": engine.stats["embeddings"],
+            "latency_seconds_total": round(sum(latencies), 3),
+            "latency_seconds_p50": round(percentile(latencies, 50), 3),
+            "latency_seconds_p95": round(percentile(latencies, 95), 3)
+        }
+    }
+
+
+def print_report(report):
+    print(f"[bold]Load test:[/bold] {report['sessions']} sessions, {report['messages']} messages, "
+          f"{report['reply_errors']} error replies")
+    for section in ("throughput", "orchestrator", "simulated_model"):
+        print(f"[bold cyan]{section}[/bold cyan]")
+        for key, value in report[section].items():
+            if value is not None:
+                print(f"  {key}: {value}")
+
+
+# -----------------------------
+# CLI Entrypoint
+# -----------------------------
+@click.command()
+@click.option('--sessions', default=1000, type=click.IntRange(min=1), help='Simulated sessions to run')
+@click.option('--workers', default=16, type=click.IntRange(min=1), help='Sessions running at the same time')
+@click.option('--rounds', default=3, type=click.IntRange(min=1), help='Rounds per session')
+@click.option('--personas', 'persona_count', default=5, type=click.IntRange(min=1), help='Synthetic personas per session')
+@click.option('--personas-file', default=None, type=click.Path(exists=True), help='Use a real personas file instead (enriched via the mock Qdrant)')
+@click.option('--concurrency', default=3, type=click.IntRange(min=1), help='Max persona replies in parallel within a round')
+@click.option('--goal-round', default='decision', type=click.Choice(GOAL_ROUNDS), help='Goal round type')
+@click.option('--output', default='markdown', type=click.Choice([f for f in OUTPUT_FORMATS if f not in BINARY_OUTPUTS]),
+              help='Output rendered for every session')
+@click.option('--summary-mode', default='full', type=click.Choice(SUMMARY_MODES), help='Goal round / Case Summary input')
+@click.option('--latency', default='lognormal:-1.5,0.5', help='Mock latency distribution, e.g. fixed:0.2, uniform:0.1,0.5, exponential:0.3')
+@click.option('--reply-words', default='uniform:40,120', help='Mock reply length distribution (words)')
+@click.option('--error-rate', default=0.0, type=click.FloatRange(0, 1), help='Share of mock calls failing with 429/5xx')
+@click.option('--seed', default=0, type=int, help='Seed for the mock backend and the sessions')
+@click.option('--trace-memory', is_flag=True, default=False, help='Also track Python allocations with tracemalloc (slower)')
+@click.option('--json-report', default=None, help='Write the report as JSON to this file')
+
+def run_loadtest(sessions, workers, rounds, persona_count, personas_file, concurrency, goal_round, output, summary_mode,
+                 latency, reply_words, error_rate, seed, trace_memory, json_report):
+    engine = create_mock_backend(seed=seed, latency=latency, reply_words=reply_words, error_rate=error_rate)
+    if personas_file:
+        personas = load_personas(personas_file, load_persona_schema(), engine)
+    else:
+        personas = synthetic_personas(persona_count)
+
+    if trace_memory:
+        tracemalloc.start()
+    records, wall, cpu = run_load(engine, personas, sessions, workers, rounds, concurrency, goal_round, output,
+                                  summary_mode, seed)
+    traced_peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    if trace_memory:
+        tracemalloc.stop()
+
+    report = build_report(records, wall, cpu, engine, traced_peak)
+    print_report(report)
+    if json_report:
+        with open(json_report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[bold green]Report saved to:[/bold green] {json_report}")
+    engine.close()
+
+
+# -----------------------------
+# Run
+# -----------------------------
+if __name__ == '__main__':
+    run_loadtest()
@@ -0,0 +1,148 @@
+import json
+import time
+import hashlib
+import threading
+import click
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from rich import print
+
+
+# -----------------------------
+# Function: Deterministic Stub Reply / Embedding
+# -----------------------------
+def stub_reply(messages):
+    """
+    The same messages always give the same reply, so sessions against the
+    stub are reproducible. The reply names the persona and echoes the tail of
+    the last prompt, enough to follow threads in the output.
+    """
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    speaker = system.split(".")[0].replace("You are a ", "").strip() or "assistant"
+    last = messages[-1]["content"].strip().replace("\n", " ")
+    digest = hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+    return f"[local stub {digest}] As {speaker}, responding to: \"{last[-160:]}\""
+
+
+def stub_embedding(text, dim):
+    seed = hashlib.sha256(text.encode("utf-8")).digest()
+    return [(seed[i % len(seed)] - 127.5) / 127.5 for i in range(dim)]
+
+
+def approx_tokens(text):
+    return (len(text) + 3) // 4
+
+
+# -----------------------------
+# Class: OpenAI-compatible Request Handler
+# -----------------------------
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    dim = 1536
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_event(self, payload):
+        data = f"data: {payload}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self.send_json(200, {"object": "list", "data": [{"id": "local-model", "object": "model", "owned_by": "local"}]})
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(self.latency)
+
+        if self.path.endswith("/embeddings"):
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            self.send_json(200, {
+                "object": "list",
+                "model": body["model"],
+                "data": [{"object": "embedding", "index": i, "embedding": stub_embedding(text, self.dim)}
+                         for i, text in enumerate(inputs)],
+                "usage": {"prompt_tokens": sum(approx_tokens(t) for t in inputs), "total_tokens": sum(approx_tokens(t) for t in inputs)}
+            })
+            return
+
+        if not self.path.endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        reply = stub_reply(body["messages"])
+        usage = {
+            "prompt_tokens": sum(approx_tokens(m["content"]) for m in body["messages"]),
+            "completion_tokens": approx_tokens(reply)
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": "chatcmpl-local", "created": int(time.time()), "model": body["model"]}
+
+        if not body.get("stream"):
+            self.send_json(200, dict(base, object="chat.completion", usage=usage, choices=[
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": reply}}]))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for start in range(0, len(reply), 16):
+            self.send_event(json.dumps(dict(base, object="chat.completion.chunk", choices=[
+                {"index": 0, "delta": {"content": reply[start:start + 16]}, "finish_reason": None}])))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self.send_event(json.dumps(dict(base, object="chat.completion.chunk", choices=[], usage=usage)))
+        self.send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+# -----------------------------
+# Function: Create / Start the Stub Server
+# -----------------------------
+def make_stub_server(host="127.0.0.1", port=8000, latency=0.0, dim=1536):
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"latency": latency, "dim": dim})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def start_stub(host="127.0.0.1", port=8000, latency=0.0, dim=1536):
+    """Serves in a background thread; point LOCAL_LLM_BASE_URL at http://host:port/v1."""
+    server = make_stub_server(host, port, latency, dim)
+    threading.Thread(target=server.serve_forever, name="local-llm-stub", daemon=True).start()
+    return server
+
+
+# -----------------------------
+# CLI Entrypoint
+# -----------------------------
+@click.command()
+@click.option('--host', default='127.0.0.1', help='Interface to listen on')
+@click.option('--port', default=8000, type=int, help='Port to listen on')
+@click.option('--latency', default=0.0, type=float, help='Seconds to wait before every response')
+@click.option('--dim', default=1536, type=int, help='Embedding dimension')
+
+def run_stub(host, port, latency, dim):
+    server = make_stub_server(host, port, latency, dim)
+    print(f"[bold green]Local OpenAI-compatible stub on[/bold green] http://{host}:{port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+# -----------------------------
+# Run
+# -----------------------------
+if __name__ == '__main__':
+    run_stub()
@@ -1,19 +1,54 @@
+import os
+import sys
 import json
 import random
+import asyncio
 import click
 from rich import print
 from datetime import datetime
 from collections import defaultdict
+from contextlib import ExitStack
 from jsonschema import validate, ValidationError
-from init import get_openai_client, load_persona_schema
-from persona_utils import enrich_personas_with_file_references, summarize_discussion
-from exporter_html import generate_html_with_styles
-from exporter_markdown import generate_markdown_from_tree
-from exporter_json import generate_json_from_tree
-from exporter_tree import generate_tree_from_tree
+from init import get_engine, load_persona_schema
+from llm_cache import CACHE_MODES, DEFAULT_CACHE_PATH
+from persona_utils import enrich_personas_with_file_references, summarize_discussion, summarize_transcript
+from exporter_html import HtmlVisitor
+from exporter_html_lazy import LazyHtmlVisitor, LAZY_DATA_MODES
+from exporter_markdown import MarkdownVisitor
+from exporter_json import JsonVisitor
+from exporter_tree import TreeTextVisitor
+from session_archive import ArchiveVisitor
+from file_utils import ChunkWriter
+from tree_walk import preorder, visit_tree, iter_visit
 import re
-from agent_log import setup_prompt_logger, log_prompt
-
+from agent_log import setup_prompt_logger, close_prompt_logger, log_prompt
+from conversation_store import ConversationStore
+from rolling_summary import RollingSummary, SUMMARY_MODES
+from live_stream import TerminalStream, LogStream
+from mock_backend import BACKENDS
+from metrics import METRIC_FORMATS, session_metrics, current_metrics, labels
+from checkpoint import Checkpoint, load_checkpoint, restore_rng
+from context_builder import build_user_prompt, fit_target, token_budget, count_tokens, TARGET_SHARE
+
+
+OUTPUT_FORMATS = ['markdown', 'json', 'html', 'html-lazy', 'tree', 'archive']
+OUTPUT_EXTENSIONS = {
+    "markdown": "md",
+    "json": "json",
+    "html": "html",
+    "html-lazy": "lazy.html",
+    "tree": "txt",
+    "archive": "archive"
+}
+# Formats that write their own binary file (always need a path, never printed)
+BINARY_OUTPUTS = ['archive']
+GOAL_ROUNDS = ['optional', 'consensus', 'decision', 'summary', 'rebuttal', 'reflection']
+
+# Identical for every persona, so it opens the shared (provider-cacheable) goal-round prefix
+GOAL_ROUND_SYSTEM_PROMPT = (
+    "You are one of several personas in a multi-agent discussion that has reached its goal round. "
+    "The conversation so far and the goal come first; your persona and instructions follow."
+)
 
 COLOR_PALETTE = [
     "#f97316",  # vibrant orange
@@ -60,15 +95,61 @@ def parse_personas(personas: list, schema):
 # -----------------------------
 # Function: Initialize State
 # -----------------------------
-def initialize_state(prompt: str, rounds: int, personas: list):
+def initialize_state(prompt: str, rounds: int, personas: list, seed=None):
+    history = []
     return {
         "prompt": prompt,
         "rounds": rounds,
         "currentRound": 1,
-        "conversationHistory": [],
+        "conversationHistory": history,
+        # Indexed view over the same list: id lookups, replies, memoised thread chains
+        "store": ConversationStore(history),
         "personas": personas,
-        "personaColors": assign_colors_to_personas(personas)
+        "personaColors": assign_colors_to_personas(personas),
+        # Per-session RNG so concurrent sessions don't interleave draws
+        "rng": random.Random(seed)
+    }
+
+# -----------------------------
+# Function: Restore State from a Checkpoint
+# -----------------------------
+def restore_state(saved):
+    """
+    Rebuilds a session from checkpoint.load_checkpoint(): the history before
+    the last started round, the RNG as it was when that round was planned,
+    and the round's committed messages and received replies (kept in
+    state["resume"] so run_jobs reuses them instead of asking again).
+    """
+    session = saved["session"]
+    settings = session["settings"]
+    state = initialize_state(session["prompt"], session["rounds"], session["personas"], settings.get("seed"))
+    state["generatedAt"] = session["generatedAt"]
+    state["cli_command"] = session["cli_command"]
+
+    round_num = saved["round"] or 1
+    state["currentRound"] = round_num
+    if saved["rng_state"] is not None:
+        restore_rng(state["rng"], saved["rng_state"])
+    for record in saved["messages"]:
+        if record["round"] < round_num:
+            get_store(state).append(record["message"])
+    state["resume"] = {
+        "messages": {r["message"]["id"]: r["message"] for r in saved["messages"] if r["round"] == round_num},
+        "replies": saved["replies"]
     }
+    if settings.get("summary_mode") == "rolling" and saved["rolling_summary"]:
+        state["rollingSummary"] = RollingSummary.from_dict(saved["rolling_summary"])
+    return state
+
+
+# -----------------------------
+# Function: Conversation Store for a State
+# -----------------------------
+def get_store(state):
+    # States built by hand (or loaded from disk) get their index on first use
+    if "store" not in state:
+        state["store"] = ConversationStore(state["conversationHistory"])
+    return state["store"]
 
 # -----------------------------
 # Function: Pick Random Message to Reply To
@@ -76,26 +157,20 @@ def initialize_state(prompt: str, rounds: int, personas: list):
 def pick_random_message(state):
     if not state["conversationHistory"]:
         return state["prompt"]
-    return random.choice(state["conversationHistory"])
+    return get_store(state).random_message(state["rng"])
 
 
 # -----------------------------
 # Function: Get Thread Context (Parent, Grant Parent, Great-Grandparent, etc.)
 # -----------------------------
 def get_thread_context(state, message):
-    context = []
-    msg_map = {m["id"]: m for m in state["conversationHistory"]}
-    while message:
-        context.insert(0, f"{message['persona']}: {message['text']}")
-        parent_id = message.get("parentId")
-        message = msg_map.get(parent_id)
-    return "\n".join(context)
+    return get_store(state).thread_context(message)
 
 
 # -----------------------------
-# Function: Get Real LLM Reply (OpenAI)
+# Function: Build System + User Prompts for a Reply
 # -----------------------------
-def agent_reply(persona, target_text, round_num, client, prompt_logger):
+def build_reply_prompts(persona, target_text, round_num, context_budget=None, model=None):
 
     is_goal_round = str(round_num).lower().startswith("goal")
     is_decision_round = is_goal_round and "decision" in round_num.lower()
@@ -118,136 +193,368 @@ def agent_reply(persona, target_text, round_num, client, prompt_logger):
     else:
         system_prompt += " Provide thoughtful insights on the following:"
 
-    user_prompt = target_text
+    # Fit references + target into the model's token budget (most relevant references first)
+    user_prompt, context_report = build_user_prompt(
+        model=model or persona.get("model", "gpt-3.5-turbo"),
+        system_prompt=system_prompt,
+        target_text=target_text,
+        references=persona.get("resolved_file_references", []),
+        query_text=system_prompt,
+        budget_override=context_budget
+    )
+
+    return system_prompt, user_prompt, context_report
+
+
+# -----------------------------
+# Function: Build Goal-Round Messages (shared prefix first)
+# -----------------------------
+def build_goal_messages(persona, shared_text, round_num, context_budget=None, model=None):
+    """
+    Every persona in the goal round sees the same transcript and goal prompt,
+    so they go first, after a persona-neutral system prompt, as a prefix that
+    is byte-identical across the N calls and can be served from the
+    provider's prompt cache. Persona identity, goal_prompt and references
+    come last. `model` is the model the call is sent to (see reply_target),
+    default the persona's.
+    """
+    model = model or persona.get("model", "gpt-3.5-turbo")
+    goal_label = round_num.split("-")[-1].strip().capitalize()  # e.g., "decision"
+
+    # Trimmed against the model's budget only (not per persona) so the prefix stays identical
+    budget = token_budget(model, GOAL_ROUND_SYSTEM_PROMPT, context_budget)
+    shared, shared_status = fit_target(shared_text, int(budget * TARGET_SHARE), model)
+    shared_tokens = count_tokens(shared, model)
+
+    instructions = f"You are a {persona['name']}. You are now in the round labeled: Goal - {goal_label}. "
+    instructions += persona.get("goal_prompt", "Provide thoughtful insights on the following:")
+
+    persona_prompt, context_report = build_user_prompt(
+        model=model,
+        system_prompt=GOAL_ROUND_SYSTEM_PROMPT + "\n" + shared,
+        target_text=instructions,
+        references=persona.get("resolved_file_references", []),
+        query_text=shared,
+        budget_override=max(context_budget - shared_tokens, 256) if context_budget else None
+    )
+    context_report[0] = {"section": "system", "tokens": count_tokens(GOAL_ROUND_SYSTEM_PROMPT, model), "status": "full"}
+    context_report.insert(1, {"section": "shared_prefix", "tokens": shared_tokens, "status": shared_status})
+
+    messages = [
+        {"role": "system", "content": GOAL_ROUND_SYSTEM_PROMPT},
+        {"role": "user", "content": shared},
+        {"role": "user", "content": persona_prompt}
+    ]
+    return messages, context_report
+
 
-    # Inject preloaded file references if available
-    preloaded_refs = persona.get("resolved_file_references", [])
-    if preloaded_refs:
-        ref_texts = [
-            f"[File: {ref['path']}]\n\n{ref['content']}" for ref in preloaded_refs
+# -----------------------------
+# Function: Where a Persona's Call Goes
+# -----------------------------
+def reply_target(engine, persona):
+    """
+    (provider, model) the persona's call is sent to first. Behind the
+    provider router that is after llm-label routing and slow-provider
+    reordering, so the model can differ from persona["model"].
+    """
+    model = persona.get("model", "gpt-3.5-turbo")
+    if hasattr(engine, "route"):
+        return engine.route(model, persona.get("llm"))[0]
+    return getattr(engine, "provider", "openai"), model
+
+
+# -----------------------------
+# Function: Get Real LLM Reply (async engine, any provider)
+# -----------------------------
+async def agent_reply_async(persona, target_text, round_num, engine, prompt_logger, context_budget=None,
+                            stream=False, terminal=None):
+    provider, model = reply_target(engine, persona)
+    if str(round_num).lower().startswith("goal"):
+        messages, context_report = build_goal_messages(persona, target_text, round_num, context_budget, model)
+    else:
+        system_prompt, user_prompt, context_report = build_reply_prompts(persona, target_text, round_num, context_budget,
+                                                                         model)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
         ]
-        if ref_texts:
-            user_prompt = (
-                "The following content is provided as reference for your persona. "
-                "Use it to inform your response:\n\n"
-                + "\n\n".join(ref_texts)
-                + "\n\n"
-                + user_prompt
-            )
-        # user_prompt = "\n\n".join(ref_texts) + "\n\n" + user_prompt
+
+    trimmed = [section["section"] for section in context_report if section.get("status") in ("truncated", "dropped")]
+    if trimmed:
+        print(f"[dim]{persona['name']}: trimmed to fit context budget → {', '.join(trimmed)}[/dim]")
 
     try:
         if prompt_logger:
-            # Log system and user prompts
-            log_prompt(prompt_logger, persona['name'], "system", system_prompt)
-            log_prompt(prompt_logger, persona['name'], "user", user_prompt)
-        response = client.chat.completions.create(
-            # model="gpt-3.5-turbo",
-            model=persona.get("model", "gpt-3.5-turbo"),
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.7
-        )
-        reply = response.choices[0].message.content.strip()
+            # Log system and user prompts, plus the token count of every context section;
+            # reference texts are written once per log and referenced by hash afterwards
+            references = [ref["content"] for ref in persona.get("resolved_file_references", [])]
+            for message in messages:
+                log_prompt(prompt_logger, persona['name'], message["role"], message["content"], payloads=references)
+            log_prompt(prompt_logger, persona['name'], "context", context_report)
+
+        # Streaming: tokens go to the terminal and the prompt log as they arrive
+        log_stream = LogStream(prompt_logger, persona['name']) if stream and prompt_logger else None
+
+        def on_token(text):
+            if text is None:  # the call is retried and streams again from the start
+                if terminal:
+                    terminal.reset(persona['name'])
+                if log_stream:
+                    log_stream.reset()
+                return
+            if terminal:
+                terminal.write(persona['name'], text)
+            if log_stream:
+                log_stream.write(text)
+
+        purpose = "goal" if str(round_num).lower().startswith("goal") else "reply"
+        with labels(purpose=purpose, persona=persona['name'], round=round_num):
+            response = await engine.chat(
+                # model="gpt-3.5-turbo",
+                model=persona.get("model", "gpt-3.5-turbo"),
+                messages=messages,
+                llm=persona.get("llm"),
+                on_token=on_token if stream else None,
+                temperature=0.7
+            )
+        reply = response["content"].strip()
+        if log_stream:
+            log_stream.flush()
+        if terminal:
+            terminal.end(persona['name'])
+            print(f"[dim]{persona['name']}: first token {response['timing']['ttft']}s, total {response['timing']['total']}s[/dim]")
 
         # ✅ Suggestion #2: Log the assistant reply
         if prompt_logger:
             log_prompt(prompt_logger, persona['name'], "assistant", reply)
+            # Token usage (incl. prompt tokens served from the provider's prefix cache) and latency
+            log_prompt(prompt_logger, persona['name'], "usage", dict(
+                response["usage"], response_cache_hit=response["cached"], timing=response["timing"],
+                provider=response.get("provider"), served_model=response.get("model")))
 
         return reply
 
     except Exception as e:
-        print(f"[red]Failed to get response from OpenAI for {persona['name']}[/red]")
+        if terminal:
+            terminal.end(persona['name'])
+        print(f"[red]Failed to get response from {provider} ({model}) for {persona['name']}[/red]")
         print(f"[dim]{str(e)}[/dim]")
         return f"[ERROR] Round {round_num}: Unable to generate reply."
 
+
+# -----------------------------
+# Function: Plan a Round (who replies to what)
+# -----------------------------
+def plan_round(state, log_line):
+    """
+    Decides, in persona order, who takes part in the current round and which
+    message each persona replies to. Targets only come from messages committed
+    in earlier rounds, so the plan never depends on reply completion order.
+    """
+    jobs = []
+    for persona in state["personas"]:
+        supplied_engagement_rate = persona.get("engagement", 0.7)
+        engagement_rate = supplied_engagement_rate
+        will_reply = state["rng"].random() < engagement_rate
+        if not will_reply:
+            log_line(f"{persona['name']} chose to sit out this round.")
+            continue
+
+        if "resolved_qdrant_titles" in persona:
+            log_line(f"[dim]{persona['name']} Qdrant matches:[/dim] {persona['resolved_qdrant_titles']}")
+
+        target = state["prompt"] if state["currentRound"] == 1 else pick_random_message(state)
+        target_text = target if isinstance(target, str) else get_thread_context(state, target)
+
+        jobs.append({
+            "id": f"msg-{state['currentRound']}-{persona['name']}",
+            "persona": persona,
+            "target_text": target_text,
+            "round_label": state["currentRound"],
+            "round": state["currentRound"],
+            "parentId": None if isinstance(target, str) else target["id"]
+        })
+    return jobs
+
+
+# -----------------------------
+# Function: Collect Replies (on the shared async engine)
+# -----------------------------
+def collect_replies(jobs, engine, prompt_logger, concurrency=1, context_budget=None, warm_first=False,
+                    stream=False, echo=True, on_reply=None):
+    """
+    Fires every planned job's completion on the engine loop, at most
+    `concurrency` at a time; replies come back in job order.
+    With warm_first the first job runs alone, so the provider has cached the
+    shared prompt prefix before the remaining jobs go out together.
+    With stream, tokens are shown (when echoing) and logged as they arrive.
+    on_reply(job, text) runs (in a worker thread) as each good reply arrives.
+    """
+    terminal = TerminalStream() if stream and echo else None
+
+    async def gather_replies():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def reply_for(job):
+            async with semaphore:
+                reply = await agent_reply_async(
+                    job["persona"], job["target_text"], job["round_label"], engine, prompt_logger, context_budget,
+                    stream, terminal)
+            if on_reply and not reply.startswith("[ERROR]"):
+                await asyncio.to_thread(on_reply, job, reply)
+            return reply
+
+        if warm_first and concurrency > 1 and len(jobs) > 1:
+            first = await reply_for(jobs[0])
+            return [first] + list(await asyncio.gather(*(reply_for(job) for job in jobs[1:])))
+        return await asyncio.gather(*(reply_for(job) for job in jobs))
+
+    if not jobs:
+        return []
+    return engine.run(gather_replies())
+
+
+# -----------------------------
+# Function: Commit a Reply to the History
+# -----------------------------
+def commit_reply(state, job, reply_text, log_line):
+    persona = job["persona"]
+    message_id = job["id"]
+
+    message = get_store(state).append({
+        "id": message_id,
+        "round": job["round"],
+        "persona": persona["name"],
+        "llm": persona["llm"],
+        "parentId": job["parentId"],
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "text": reply_text,
+        "rag_score": score_rag_effectiveness(reply_text, persona)
+    })
+
+    if state.get("checkpoint"):
+        state["checkpoint"].message(state["currentRound"], message)
+
+    log_line(f"{persona['name']} replied → {message_id}")
+    return message
+
+
+# -----------------------------
+# Function: Request and Commit a Round's Replies
+# -----------------------------
+def run_jobs(state, jobs, engine, prompt_logger, concurrency, context_budget, log_line, warm_first=False, stream=False,
+             echo=True):
+    """
+    Collects every job's reply and commits them in job order. Replies are
+    checkpointed as they arrive. When resuming, jobs whose message or reply
+    is already in the checkpoint are not sent again ([ERROR] replies are).
+    """
+    resume = state.pop("resume", {"messages": {}, "replies": {}})
+    saved = {}
+    for job in jobs:
+        message = resume["messages"].get(job["id"])
+        if message and not message["text"].startswith("[ERROR]"):
+            saved[job["id"]] = message
+        elif job["id"] in resume["replies"]:
+            saved[job["id"]] = resume["replies"][job["id"]]
+
+    checkpoint = state.get("checkpoint")
+    on_reply = (lambda job, text: checkpoint.reply(job["id"], text)) if checkpoint else None
+    pending = [job for job in jobs if job["id"] not in saved]
+    replies = iter(collect_replies(pending, engine, prompt_logger, concurrency, context_budget, warm_first, stream, echo,
+                                   on_reply))
+
+    committed = []
+    for job in jobs:
+        restored = saved.get(job["id"])
+        if isinstance(restored, dict):
+            committed.append(get_store(state).append(restored))
+            log_line(f"{job['persona']['name']} restored from checkpoint → {job['id']}")
+        else:
+            committed.append(commit_reply(state, job, restored if restored is not None else next(replies), log_line))
+    return committed
+
+
+# -----------------------------
+# Function: Update Rolling Summaries with a Round's Messages
+# -----------------------------
+def update_rolling_summary(state, messages, engine, concurrency, log_line):
+    summary = state.get("rollingSummary")
+    if summary is None or not messages:
+        return
+    updated = summary.update(get_store(state), messages, engine, concurrency)
+    log_line(f"[dim]Rolling summaries updated: {updated}[/dim]")
+    if state.get("checkpoint"):
+        state["checkpoint"].rolling_summary(state)
+
+
 # -----------------------------
 # Function: Run the Conversation
 # -----------------------------
-def run_conversation(state, client, prompt_logger, goal_round="optional"):
+def run_conversation(state, engine, prompt_logger, goal_round="optional", concurrency=1, echo=True, context_budget=None,
+                     summary_mode="full", stream=False):
     state["runtime_log"] = []
+    if summary_mode == "rolling":
+        state.setdefault("rollingSummary", RollingSummary())
 
     def log_line(line):
         state["runtime_log"].append(line)
-        print(line)
+        if echo:
+            print(line)
 
     while state["currentRound"] <= state["rounds"]:
         log_line(f"\n--- Round {state['currentRound']} ---")
+        if state.get("checkpoint"):
+            state["checkpoint"].round_started(state)
 
-        for persona in state["personas"]:
-            supplied_engagement_rate = persona.get("engagement", 0.7)
-            engagement_rate = supplied_engagement_rate
-            will_reply = random.random() < engagement_rate
-            if not will_reply:
-                log_line(f"{persona['name']} chose to sit out this round.")
-                continue
-
-            if "resolved_qdrant_titles" in persona:
-                log_line(f"[dim]{persona['name']} Qdrant matches:[/dim] {persona['resolved_qdrant_titles']}")
-
-            target = state["prompt"] if state["currentRound"] == 1 else pick_random_message(state)
-            target_text = target if isinstance(target, str) else get_thread_context(state, target)
-
-            parent_id = None if isinstance(target, str) else target["id"]
-
-            reply_text = agent_reply(persona, target_text, state["currentRound"], client, prompt_logger)
-            message_id = f"msg-{state['currentRound']}-{persona['name']}"
-
-            state["conversationHistory"].append({
-                "id": message_id,
-                "round": state["currentRound"],
-                "persona": persona["name"],
-                "llm": persona["llm"],
-                "parentId": parent_id,
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "text": reply_text,
-                "rag_score": score_rag_effectiveness(reply_text, persona) 
-            })
-
-            log_line(f"{persona['name']} replied → {message_id}")
+        jobs = plan_round(state, log_line)
+        committed = run_jobs(state, jobs, engine, prompt_logger, concurrency, context_budget, log_line, stream=stream, echo=echo)
+        update_rolling_summary(state, committed, engine, concurrency, log_line)
 
         state["currentRound"] += 1
 
     # Goal round handling (only once, after all normal rounds)
     if goal_round != "optional":
         log_line(f"\n[bold magenta]--- Goal Round: {goal_round.upper()} ---[/bold magenta]")
+        if state.get("checkpoint"):
+            state["checkpoint"].round_started(state)
 
         # target_text = build_goal_prompt(goal_round, state)
-        full_history = flatten_conversation_history_with_threads(state)
-        target_text = (
-            "Here is the full conversation so far:\n\n"
-            + full_history
-            + "\n\n"
-            + build_goal_prompt(goal_round, state)
-        )
-
-        parent_id = None
+        if state.get("rollingSummary"):
+            # Bounded: round/thread summaries plus the latest round, not the whole log
+            history_text = state["rollingSummary"].goal_context()
+        else:
+            history_text = "Here is the full conversation so far:\n\n" + flatten_conversation_history_with_threads(state)
+        target_text = history_text + "\n\n" + build_goal_prompt(goal_round, state)
 
+        jobs = []
         for persona in state["personas"]:
             log_line(f"{persona['name']} is participating in the goal round.")
-
-            goal_label = f"Goal - {goal_round.capitalize()}"
-            reply_text = agent_reply(persona, target_text, goal_label, client, prompt_logger)
-            # reply_text = agent_reply(persona, target_text, state["currentRound"], client, prompt_logger)
-            message_id = f"msg-{state['currentRound']}-{persona['name']}"
-
-            state["conversationHistory"].append({
-                "id": message_id,
+            jobs.append({
+                "id": f"msg-{state['currentRound']}-{persona['name']}",
+                "persona": persona,
+                "target_text": target_text,
+                "round_label": f"Goal - {goal_round.capitalize()}",
                 "round": "Goal - " + goal_round,
-                "persona": persona["name"],
-                "llm": persona["llm"],
-                "parentId": parent_id,
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "text": reply_text,
-                "rag_score": score_rag_effectiveness(reply_text, persona) 
+                "parentId": None
             })
 
-            log_line(f"{persona['name']} replied → {message_id}")
+        committed = run_jobs(state, jobs, engine, prompt_logger, concurrency, context_budget, log_line, warm_first=True,
+                             stream=stream, echo=echo)
+        update_rolling_summary(state, committed, engine, concurrency, log_line)
 
         state["currentRound"] += 1
 
+    if state.get("checkpoint"):
+        state["checkpoint"].finished()
+
+    # Latency, tokens and cost per persona / reference so far
+    metrics = current_metrics()
+    if metrics is not None:
+        log_line("\n--- Call Metrics ---")
+        for line in metrics.summary_lines():
+            log_line(line)
+
 # -----------------------------
 # Function: Rag Effectiveness Score
 # -----------------------------
@@ -394,107 +701,363 @@ def flatten_conversation_history_with_threads(state):
         text = node["text"].strip()
         return f"{indent}- {label}:\n{indent}  {text}"
 
-    id_to_msg = {msg["id"]: msg for msg in state["conversationHistory"]}
-    parent_to_children = defaultdict(list)
-
-    for msg in state["conversationHistory"]:
-        parent_to_children[msg.get("parentId")].append(msg)
+    store = get_store(state)
 
-    def walk_thread(parent_id=None, depth=0):
-        lines = []
-        for msg in parent_to_children.get(parent_id, []):
-            lines.append(render_node(msg, depth))
-            lines.extend(walk_thread(msg["id"], depth + 1))
-        return lines
+    def walk_thread():
+        replies = lambda msg: store.replies_to(msg["id"])
+        for msg, depth in preorder(store.replies_to(None), replies):
+            yield render_node(msg, depth)
 
     return "\n".join(walk_thread())
 
 
 
 # -----------------------------
-# CLI Entrypoint
+# Function: Load, Validate and Enrich a Personas File
 # -----------------------------
-@click.command()
-@click.option('--prompt', required=True, help='The central discussion prompt')
-@click.option('--rounds', default=3, help='Number of conversation rounds')
-@click.option('--personas-file', required=True, type=click.Path(exists=True), help='Path to a JSON file containing persona definitions')
-@click.option('--save-to', default=None, help='Optional filename to save the final output')
-@click.option('--output', default='markdown', type=click.Choice(['markdown', 'json', 'html', 'tree']), help='Output format')
-@click.option('--goal-round', default='optional', type=click.Choice(['optional', 'consensus', 'decision' , 'summary', 'rebuttal', 'reflection']),
-              help='Type of final round behavior (optional, consensus, summary, etc.)')
-
-def run_cli(prompt, rounds, personas_file, output, save_to, goal_round):
-    schema = load_persona_schema()
-    client = get_openai_client()
+def load_personas(personas_file, schema, engine):
     with open(personas_file, 'r', encoding='utf-8') as f:
         personas = json.load(f)
     parsed_personas = parse_personas(personas, schema)
 
-    parsed_personas = enrich_personas_with_file_references(parsed_personas)
+    return enrich_personas_with_file_references(parsed_personas, engine=engine)
 
-    state = initialize_state(prompt, rounds, parsed_personas)
 
-    state["generatedAt"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    session_id = state["generatedAt"].replace(" ", "T").replace(":", "-")
-    prompt_logger = setup_prompt_logger(session_id)
+# -----------------------------
+# Function: Parse --output FORMAT[=PATH]
+# -----------------------------
+def parse_output_spec(value):
+    """Returns (format, path or None) for an --output value such as "html" or "html=out.html"."""
+    output, _, path = value.partition("=")
+    output = output.strip().lower()
+    if output not in OUTPUT_FORMATS:
+        raise ValueError(f"unsupported output format '{output}' (choose from {', '.join(OUTPUT_FORMATS)})")
+    return output, path.strip() or None
+
+
+def resolve_outputs(specs, save_to=None):
+    """
+    Fills in paths for outputs given without one. A single such output
+    goes to --save-to (or the console when it is not set); with several,
+    each gets --save-to with its format's extension.
+    """
+    pathless = [output for output, path in specs if not path]
+    if len(pathless) > 1 and not save_to:
+        raise ValueError("give each --output its own path (e.g. --output html=out.html) or set --save-to")
+    if len(pathless) != len(set(pathless)):
+        raise ValueError("an output format without a path can only be requested once")
+
+    resolved = []
+    for output, path in specs:
+        if not path and len(pathless) > 1:
+            path = f"{os.path.splitext(save_to)[0]}.{OUTPUT_EXTENSIONS[output]}"
+        resolved.append((output, path or save_to))
+    if any(output in BINARY_OUTPUTS and not path for output, path in resolved):
+        raise ValueError("archive output needs a file: --output archive=PATH or --save-to")
+    paths = [path for _, path in resolved if path]
+    if len(paths) != len(set(paths)):
+        raise ValueError("two outputs would be written to the same file")
+    return resolved
 
 
-    cli_command = f"python main.py --prompt \"{prompt}\" --rounds {rounds} --personas-file '{personas_file}' --output {output}"
+# -----------------------------
+# Function: Exporters for the Requested Formats
+# -----------------------------
+def output_visitors(state, outputs, engine, html_data="embedded"):
+    """
+    Returns one tree visitor per requested (format, path). Work shared
+    between formats (engagement summary, the LLM Case Summary) runs once
+    here, before anything is written.
+    """
+    visitors = []
+    report = None
+    for output, path in outputs:
+        if output == 'markdown':
+            visitors.append(MarkdownVisitor(state["prompt"]))
+        elif output == 'json':
+            visitors.append(JsonVisitor())
+        elif output == 'tree':
+            visitors.append(TreeTextVisitor())
+        elif output == 'html':
+            report = report or html_report_fields(state, engine)
+            visitors.append(HtmlVisitor(**report))
+        elif output == 'html-lazy':
+            report = report or html_report_fields(state, engine)
+            visitors.append(LazyHtmlVisitor(**report, data=html_data, path=path))
+        elif output == 'archive':
+            if not path:
+                raise ValueError("archive output needs a file path")
+            visitors.append(ArchiveVisitor(path, session=archive_metadata(state)))
+        else:
+            raise ValueError(f"Unsupported output format: {output}")
+    return visitors
 
-    if save_to:
-        cli_command += f" --save-to \"{save_to}\""
-    state["cli_command"] = cli_command
 
-    run_conversation(state, client, prompt_logger ,goal_round)
-    thread_tree = build_thread_tree(state["conversationHistory"])
+def archive_metadata(state):
+    return {
+        "session_id": state.get("sessionId"),
+        "prompt": state["prompt"],
+        "rounds": state["rounds"],
+        "generatedAt": state["generatedAt"],
+        "cli_command": state["cli_command"],
+        "personas": [{key: persona.get(key) for key in ("name", "llm", "model")} for persona in state["personas"]]
+    }
 
-    if output == 'markdown':
-        # result = f"## Discussion: {state['prompt']}\n\n"
-        # result += format_markdown_from_tree(thread_tree)
-        result = generate_markdown_from_tree(thread_tree, state["prompt"])
-    elif output == 'json':
-        # result = json.dumps(thread_tree, indent=2)
-        result = generate_json_from_tree(thread_tree)
-    elif output == 'html':
-        round_summary, persona_summary = summarize_engagement(
-            state["conversationHistory"], 
-            state["personas"],
-            state["rounds"])
-        summary_lines = round_summary + persona_summary
-
-        # NEW calculations for top bar
-        max_possible = state["rounds"] * len(state["personas"])
-        actual_total = len(state["conversationHistory"])
-        engagement_score = actual_total / max_possible if max_possible else 0
-        total_comments = actual_total
 
-        state["discussionSummary"] = summarize_discussion(
-            state["conversationHistory"], client, model="gpt-4o")
-
-        result = generate_html_with_styles(
-            tree=thread_tree,
-            title=state["prompt"],
-            timestamp=state["generatedAt"],
-            summary_lines=summary_lines,
-            persona_colors=state["personaColors"],
-            engagement_score=engagement_score,
-            total_comments=total_comments,
-            cli_command=state["cli_command"],
-            runtime_log=state["runtime_log"],
-            discussion_summary=state["discussionSummary"]
-        )
-    elif output == 'tree':
-        # result = format_json_tree_pretty(thread_tree)
-        result = generate_tree_from_tree(thread_tree)
+def html_report_fields(state, engine):
+    round_summary, persona_summary = summarize_engagement(
+        state["conversationHistory"], 
+        state["personas"],
+        state["rounds"])
+    summary_lines = round_summary + persona_summary
+
+    # NEW calculations for top bar
+    max_possible = state["rounds"] * len(state["personas"])
+    actual_total = len(state["conversationHistory"])
+    engagement_score = actual_total / max_possible if max_possible else 0
+    total_comments = actual_total
+
+    if state.get("rollingSummary"):
+        state["discussionSummary"] = summarize_transcript(
+            state["rollingSummary"].digest(), engine, model="gpt-4o")
     else:
-        result = "[ERROR] Unsupported output format."
+        state["discussionSummary"] = summarize_discussion(
+            state["conversationHistory"], engine, model="gpt-4o")
+
+    metrics = current_metrics()
+    return dict(
+        title=state["prompt"],
+        timestamp=state["generatedAt"],
+        summary_lines=summary_lines,
+        persona_colors=state["personaColors"],
+        engagement_score=engagement_score,
+        total_comments=total_comments,
+        cli_command=state["cli_command"],
+        runtime_log=state["runtime_log"],
+        discussion_summary=state["discussionSummary"],
+        metrics_summary=metrics.summary() if metrics is not None else None
+    )
+
+
+# -----------------------------
+# Function: Render the Thread Tree in the Requested Format
+# -----------------------------
+def iter_output(state, output, engine):
+    """
+    Returns an iterator over the rendered document's chunks. Anything that
+    needs the LLM (the HTML Case Summary) is done before this returns.
+    """
+    thread_tree = build_thread_tree(state["conversationHistory"])
+    visitor, = output_visitors(state, [(output, None)], engine)
+    return iter_visit(thread_tree, visitor)
+
 
-    print(result)
+def render_output(state, output, engine):
+    return "".join(iter_output(state, output, engine))
+
+
+# -----------------------------
+# Function: Write Every Requested Output in One Walk
+# -----------------------------
+def write_outputs(state, outputs, engine, echo=False, html_data="embedded"):
+    """
+    `outputs` is a list of (format, path); a None path means the console.
+    The thread tree is built and walked once and each step's text goes to
+    every format's writer. With echo the first text output is also
+    printed, unless one already goes to the console.
+    """
+    thread_tree = build_thread_tree(state["conversationHistory"])
+    visitors = output_visitors(state, outputs, engine, html_data)
+
+    console = [position for position, (_, path) in enumerate(outputs) if not path]
+    if echo and not console:
+        console = [position for position, (output, _) in enumerate(outputs) if output not in BINARY_OUTPUTS][:1]
+
+    with ExitStack() as files:
+        writers = []
+        for position, (output, path) in enumerate(outputs):
+            handles = [files.enter_context(open(path, "w", encoding="utf-8"))] if path and output not in BINARY_OUTPUTS else []
+            if position in console:
+                handles.append(sys.stdout)
+            writers.append(ChunkWriter(*handles))
+
+        for chunks in visit_tree(thread_tree, visitors):
+            for writer, chunk in zip(writers, chunks):
+                if chunk:
+                    writer.write(chunk)
+        for writer in writers:
+            writer.flush()
+    if console:
+        sys.stdout.write("\n")
+
+
+# -----------------------------
+# Function: Build the Reproducible CLI Command
+# -----------------------------
+def build_cli_command(prompt, rounds, personas_file, output, save_to=None, concurrency=1,
+                      goal_round='optional', seed=None, summary_mode='full', stream=False, backend='live',
+                      html_data='embedded'):
+    # output: one format, or the --output values as given (e.g. ["html=out.html", "json=out.json"])
+    cli_command = f"python main.py --prompt \"{prompt}\" --rounds {rounds} --personas-file '{personas_file}'"
+    for value in ([output] if isinstance(output, str) else output):
+        cli_command += f" --output \"{value}\"" if "=" in value else f" --output {value}"
 
     if save_to:
-        with open(save_to, 'w', encoding='utf-8') as f:
-            f.write(result)
-        print(f"[bold green]Output saved to:[/bold green] {save_to}")
+        cli_command += f" --save-to \"{save_to}\""
+    if goal_round != 'optional':
+        cli_command += f" --goal-round {goal_round}"
+    if concurrency > 1:
+        cli_command += f" --concurrency {concurrency}"
+    if seed is not None:
+        cli_command += f" --seed {seed}"
+    if summary_mode != 'full':
+        cli_command += f" --summary-mode {summary_mode}"
+    if stream:
+        cli_command += " --stream"
+    if backend != 'live':
+        cli_command += f" --backend {backend}"
+    if html_data != 'embedded':
+        cli_command += f" --html-data {html_data}"
+    return cli_command
+
+
+# -----------------------------
+# Function: Run One Session (conversation + rendered output)
+# -----------------------------
+def run_session(prompt, rounds, personas, engine, output='markdown', goal_round='optional',
+                concurrency=1, cli_command="", session_id=None, seed=None, echo=True, context_budget=None,
+                summary_mode="full", stream=False, log_prompts=True, metrics_out=None, metrics_format="json",
+                checkpoints=True, resume_from=None, outputs=None, echo_output=False, html_data="embedded"):
+    """
+    Runs a full discussion for already-parsed personas and renders it.
+    Returns (state, result). Shared by the CLI and the batch runner.
+    With outputs (a list of (format, path), see write_outputs) and/or
+    echo_output, every format is streamed to its file and/or stdout from
+    one walk of the thread tree, and result is None.
+    Per-call metrics end up in state["metrics"] (and metrics_out, if given).
+
+    With checkpoints, every reply and committed message is saved to
+    checkpoints/<session_id>.jsonl. resume_from (a loaded checkpoint)
+    continues that session with its own prompt, personas and settings.
+    """
+    if resume_from:
+        state = restore_state(resume_from)
+        session_id = resume_from["session"]["session_id"]
+        settings = resume_from["session"]["settings"]
+        goal_round, summary_mode = settings["goal_round"], settings["summary_mode"]
+    else:
+        state = initialize_state(prompt, rounds, personas, seed)
+        state["generatedAt"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        session_id = session_id or state["generatedAt"].replace(" ", "T").replace(":", "-")
+        state["cli_command"] = cli_command
+    state["sessionId"] = session_id
+    prompt_logger = setup_prompt_logger(session_id, append=resume_from is not None) if log_prompts else None
+
+    if checkpoints:
+        state["checkpoint"] = Checkpoint(session_id)
+        if resume_from:
+            if echo:
+                print(f"[bold]Resuming {session_id} from round {state['currentRound']} "
+                      f"({len(state['conversationHistory'])} earlier messages restored)[/bold]")
+        else:
+            state["checkpoint"].start(state, {"goal_round": goal_round, "summary_mode": summary_mode, "seed": seed})
+
+    try:
+        with session_metrics(session_id) as metrics:
+            run_conversation(state, engine, prompt_logger, goal_round, concurrency, echo, context_budget, summary_mode, stream)
+            if outputs or echo_output:
+                result = None
+                write_outputs(state, outputs or [(output, None)], engine, echo_output, html_data)
+            else:
+                result = render_output(state, output, engine)
+            state["metrics"] = metrics.summary()
+            if metrics_out:
+                metrics.export(metrics_out, metrics_format)
+    finally:
+        close_prompt_logger(session_id)
+        if state.get("checkpoint"):
+            state.pop("checkpoint").close()
+
+    return state, result
+
+
+# -----------------------------
+# CLI Entrypoint
+# -----------------------------
+@click.command()
+@click.option('--prompt', default=None, help='The central discussion prompt')
+@click.option('--rounds', default=3, help='Number of conversation rounds')
+@click.option('--personas-file', default=None, type=click.Path(exists=True), help='Path to a JSON file containing persona definitions')
+@click.option('--save-to', default=None, help='Optional filename to save the final output')
+@click.option('--echo', is_flag=True, default=False,
+              help='Also print the (first) output to the console when it is saved to a file')
+@click.option('--output', multiple=True, metavar='FORMAT[=PATH]',
+              help=f"Output format ({', '.join(OUTPUT_FORMATS)}); repeat for several, e.g. --output html=out.html --output json=out.json")
+@click.option('--html-data', default='embedded', type=click.Choice(LAZY_DATA_MODES),
+              help='How html-lazy stores messages: embedded JSON, gzip (smaller, needs a current browser) or a sidecar <name>.data.js file')
+@click.option('--goal-round', default='optional', type=click.Choice(GOAL_ROUNDS),
+              help='Type of final round behavior (optional, consensus, summary, etc.)')
+@click.option('--concurrency', default=1, type=click.IntRange(min=1), help='Max persona replies requested in parallel within a round')
+@click.option('--max-connections', default=None, type=click.IntRange(min=1), help='Size of the shared HTTP connection pool (default: $LLM_MAX_CONNECTIONS or 20)')
+@click.option('--seed', default=None, type=int, help='Seed for engagement and reply-target randomness')
+@click.option('--cache', 'cache_mode', default='off', type=click.Choice(CACHE_MODES),
+              help='LLM response cache: read (serve hits, store misses), write (refresh entries), off')
+@click.option('--cache-path', default=DEFAULT_CACHE_PATH, help='SQLite file for the LLM response cache')
+@click.option('--context-budget', default=None, type=click.IntRange(min=256),
+              help='Cap on user-prompt tokens per reply (default: the model context window minus room for the reply)')
+@click.option('--summary-mode', default='full', type=click.Choice(SUMMARY_MODES),
+              help='full: goal round and Case Summary read the whole log; rolling: bounded per-thread/per-round summaries updated each round')
+@click.option('--stream', is_flag=True, default=False,
+              help='Stream reply tokens to the terminal and prompt log as they arrive (records time to first token)')
+@click.option('--backend', default='live', type=click.Choice(BACKENDS),
+              help='live: real providers; mock: offline seeded fake LLM and Qdrant (MOCK_LATENCY, MOCK_ERROR_RATE, ...)')
+@click.option('--metrics-out', default=None, help='Write per-call latency, token and cost metrics to this file')
+@click.option('--metrics-format', default='json', type=click.Choice(METRIC_FORMATS), help='Format for --metrics-out')
+@click.option('--resume', default=None, metavar='SESSION_ID',
+              help='Continue a crashed or interrupted session from checkpoints/<SESSION_ID>.jsonl (prompt, personas and settings come from the checkpoint)')
+
+def run_cli(prompt, rounds, personas_file, output, save_to, echo, html_data, goal_round, concurrency, max_connections, seed, cache_mode, cache_path, context_budget,
+            summary_mode, stream, backend, metrics_out, metrics_format, resume):
+    output = output or ('markdown',)
+    try:
+        outputs = resolve_outputs([parse_output_spec(value) for value in output], save_to)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="'--output'")
+
+    resume_from = load_checkpoint(resume) if resume else None
+    if not resume_from and not (prompt and personas_file):
+        raise click.UsageError("--prompt and --personas-file are required unless --resume is given")
+
+    schema = load_persona_schema()
+    engine = get_engine(backend, max_connections=max_connections, cache_mode=cache_mode, cache_path=cache_path)
+    # Opened here so reference lookups (embeddings, Qdrant) count towards the session
+    with session_metrics():
+        # Resumed sessions keep the enriched personas saved in the checkpoint
+        parsed_personas = load_personas(personas_file, schema, engine) if not resume_from else None
+        cli_command = build_cli_command(prompt, rounds, personas_file, output, save_to, concurrency, goal_round, seed, summary_mode, stream,
+                                        backend, html_data)
+
+        state, result = run_session(
+            prompt, rounds, parsed_personas, engine,
+            output=outputs[0][0],
+            goal_round=goal_round,
+            concurrency=concurrency,
+            cli_command=cli_command,
+            seed=seed,
+            context_budget=context_budget,
+            summary_mode=summary_mode,
+            stream=stream,
+            metrics_out=metrics_out,
+            metrics_format=metrics_format,
+            resume_from=resume_from,
+            outputs=outputs,
+            echo_output=echo,
+            html_data=html_data
+        )
+
+    for _, path in outputs:
+        if path:
+            print(f"[bold green]Output saved to:[/bold green] {path}")
 
 
 
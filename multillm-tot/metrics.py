@@ -0,0 +1,242 @@
+import time
+import json
+import threading
+import contextvars
+from contextlib import contextmanager
+
+METRIC_FORMATS = ["json", "prometheus"]
+# Share of the normal prompt price charged for prefix-cached prompt tokens
+CACHED_TOKEN_PRICE = 0.5
+# Labels every call is grouped by in summaries and Prometheus series
+GROUP_LABELS = ("kind", "purpose", "provider", "model", "persona", "round", "reference")
+
+_session = contextvars.ContextVar("session_metrics", default=None)
+_labels = contextvars.ContextVar("metric_labels", default={})
+_call = contextvars.ContextVar("call_metrics", default=None)
+
+
+# -----------------------------
+# Function: Estimated Cost of a Call
+# -----------------------------
+def estimate_cost(provider, model, prompt_tokens=0, completion_tokens=0, cached_tokens=0):
+    """
+    Rough USD from the provider registry's blended cost_per_1k. Providers
+    outside the registry (e.g. the mock backend) are priced as the provider
+    that would serve the model.
+    """
+    from providers import PROVIDERS, provider_for
+
+    config = PROVIDERS.get(provider) or PROVIDERS[provider_for(model or "")]
+    billed = prompt_tokens - cached_tokens * (1 - CACHED_TOKEN_PRICE) + completion_tokens
+    return billed * config["cost_per_1k"] / 1000
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+# -----------------------------
+# Class: Metrics for One Session
+# -----------------------------
+class SessionMetrics:
+    """
+    Collects one record per LLM, embedding and Qdrant call made while the
+    session is active (see session_metrics), from any thread or task.
+    """
+
+    def __init__(self, session_id=None):
+        self.session_id = session_id
+        self.started = time.monotonic()
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def record(self, call):
+        with self._lock:
+            self.calls.append(call)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.calls)
+
+    def summary(self):
+        """Session totals, plus the same totals per kind, purpose, persona, round, reference and model."""
+        calls = self.snapshot()
+        summary = dict(
+            session_id=self.session_id,
+            elapsed_seconds=round(time.monotonic() - self.started, 3),
+            **_totals(calls)
+        )
+        for label in ("kind", "purpose", "persona", "round", "reference", "model"):
+            groups = {}
+            for call in calls:
+                if call.get(label) is not None:
+                    groups.setdefault(str(call[label]), []).append(call)
+            summary[f"by_{label}"] = {name: _totals(group) for name, group in groups.items()}
+        return summary
+
+    def summary_lines(self):
+        """Short human-readable lines for the runtime log."""
+        summary = self.summary()
+        lines = [
+            f"Calls: {summary['calls']} ({summary['errors']} failed, {summary['retries']} retries, "
+            f"{summary['cache_hits']} cache hits) · call time {summary['call_seconds']}s "
+            f"in {summary['elapsed_seconds']}s elapsed · "
+            f"tokens {summary['prompt_tokens']} in / {summary['completion_tokens']} out "
+            f"({summary['cached_tokens']} cached) · est. ${summary['cost_usd']:.4f}"
+        ]
+        for label in ("purpose", "persona", "reference"):
+            for name, totals in sorted(summary[f"by_{label}"].items(), key=lambda item: -item[1]["call_seconds"]):
+                ttft = f", first token p50 {totals['ttft_p50']}s" if totals["ttft_p50"] is not None else ""
+                lines.append(
+                    f"  {name}: {totals['calls']} calls, {totals['call_seconds']}s (p95 {totals['call_p95']}s{ttft}), "
+                    f"{totals['prompt_tokens'] + totals['completion_tokens']} tokens, ${totals['cost_usd']:.4f}"
+                )
+        return lines
+
+    def to_json(self):
+        return json.dumps({"summary": self.summary(), "calls": self.snapshot()}, indent=2, ensure_ascii=False)
+
+    def to_prometheus(self, prefix="multillm"):
+        """Prometheus text exposition: one series per distinct set of call labels."""
+        groups = {}
+        for call in self.snapshot():
+            key = tuple((label, str(call[label])) for label in GROUP_LABELS if call.get(label) is not None)
+            groups.setdefault(key, []).append(call)
+
+        series = [
+            ("calls_total", "counter", "LLM, embedding and Qdrant calls", lambda t: t["calls"]),
+            ("errors_total", "counter", "Calls that failed", lambda t: t["errors"]),
+            ("retries_total", "counter", "Retries made by the request scheduler", lambda t: t["retries"]),
+            ("cache_hits_total", "counter", "Calls served from the response or embedding cache", lambda t: t["cache_hits"]),
+            ("prompt_tokens_total", "counter", "Prompt tokens", lambda t: t["prompt_tokens"]),
+            ("completion_tokens_total", "counter", "Completion tokens", lambda t: t["completion_tokens"]),
+            ("cached_tokens_total", "counter", "Prompt tokens served from the provider's prefix cache", lambda t: t["cached_tokens"]),
+            ("cost_usd_total", "counter", "Estimated cost in USD", lambda t: t["cost_usd"]),
+            ("call_seconds_total", "counter", "Seconds spent in calls, summed (overlapping calls each count)", lambda t: t["call_seconds"])
+        ]
+        session = [("session", self.session_id)] if self.session_id else []
+        totals = {key: _totals(group) for key, group in groups.items()}
+
+        lines = []
+        for name, metric_type, help_text, value in series:
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+            for key, group_totals in totals.items():
+                labels = ",".join(f'{label}="{_escape(text)}"' for label, text in session + list(key))
+                lines.append(f"{prefix}_{name}{{{labels}}} {value(group_totals)}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path, metric_format="json"):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus() if metric_format == "prometheus" else self.to_json())
+
+
+def _totals(calls):
+    durations = [call["call_seconds"] for call in calls]
+    ttfts = [call["ttft"] for call in calls if call.get("ttft") is not None]
+    return {
+        "calls": len(calls),
+        "errors": sum(1 for call in calls if call.get("error")),
+        "retries": sum(call["retries"] for call in calls),
+        "cache_hits": sum(1 for call in calls if call.get("cache_hit")),
+        "call_seconds": round(sum(durations), 3),
+        "call_p50": round(percentile(durations, 50), 3),
+        "call_p95": round(percentile(durations, 95), 3),
+        "ttft_p50": round(percentile(ttfts, 50), 3) if ttfts else None,
+        "prompt_tokens": sum(call["prompt_tokens"] for call in calls),
+        "completion_tokens": sum(call["completion_tokens"] for call in calls),
+        "cached_tokens": sum(call["cached_tokens"] for call in calls),
+        "cost_usd": round(sum(call["cost_usd"] for call in calls), 6)
+    }
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# -----------------------------
+# Function: Session / Label Scopes
+# -----------------------------
+@contextmanager
+def session_metrics(session_id=None):
+    """
+    Makes a SessionMetrics current for this context, and for every engine
+    call and worker thread started from it. Reuses the current one if a
+    session is already active (e.g. the CLI opens it before loading personas).
+    """
+    metrics = _session.get()
+    if metrics is not None:
+        if metrics.session_id is None:
+            metrics.session_id = session_id
+        yield metrics
+        return
+    metrics = SessionMetrics(session_id)
+    token = _session.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _session.reset(token)
+
+
+def current_metrics():
+    return _session.get()
+
+
+@contextmanager
+def labels(**values):
+    """Tags every call made inside the block, e.g. labels(purpose="reply", persona=..., round=...)."""
+    token = _labels.set(dict(_labels.get(), **values))
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+# -----------------------------
+# Function: Track One Call
+# -----------------------------
+@contextmanager
+def track(kind, provider=None, model=None):
+    """
+    Times the block and records it in the current session, if any. The
+    caller fills in the yielded dict (tokens, ttft, cache_hit); retries are
+    counted by the scheduler through note_retry(). Failures are recorded
+    with the error type and re-raised.
+    """
+    call = dict(_labels.get(), kind=kind, provider=provider, model=model, ttft=None, cache_hit=False,
+                prompt_tokens=0, completion_tokens=0, cached_tokens=0, retries=0, error=None)
+    token = _call.set(call)
+    started = time.perf_counter()
+    try:
+        yield call
+    except BaseException as e:
+        call["error"] = type(e).__name__
+        raise
+    finally:
+        _call.reset(token)
+        call["call_seconds"] = round(time.perf_counter() - started, 4)
+        metrics = _session.get()
+        if metrics is not None:
+            call["cost_usd"] = 0.0 if call["cache_hit"] or kind == "qdrant" else round(estimate_cost(
+                provider, model, call["prompt_tokens"], call["completion_tokens"], call["cached_tokens"]), 8)
+            metrics.record(call)
+
+
+def note_retry():
+    call = _call.get()
+    if call is not None:
+        call["retries"] += 1
+
+
+def observe_chat(call, response):
+    """Copies usage, cache hit and time to first token from a chat() result."""
+    call.update(
+        cache_hit=response["cached"],
+        ttft=response["timing"].get("ttft"),
+        prompt_tokens=response["usage"].get("prompt_tokens", 0),
+        completion_tokens=response["usage"].get("completion_tokens", 0),
+        cached_tokens=response["usage"].get("cached_tokens", 0)
+    )
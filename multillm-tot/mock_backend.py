@@ -0,0 +1,232 @@
+import os
+import json
+import base64
+import random
+import array
+import asyncio
+import hashlib
+import httpx
+from types import SimpleNamespace
+from llm_engine import LLMEngine
+from scheduler import RequestScheduler
+from local_stub import stub_embedding
+
+BACKENDS = ["live", "mock"]
+
+MOCK_BASE_URL = "http://mock.invalid/v1"
+
+MOCK_VOCABULARY = (
+    "risk plan patient cost timeline review evidence quality safety budget scope follow-up "
+    "priority concern option trade-off benefit approach data impact coverage service team "
+    "deadline metric outcome support recovery policy requirement decision feedback"
+).split()
+
+
+# -----------------------------
+# Function: Parse a Distribution Spec
+# -----------------------------
+def parse_distribution(spec):
+    """
+    Returns a sampler rng -> float for specs like "fixed:0.2",
+    "uniform:0.1,0.5", "normal:0.4,0.1", "lognormal:-1.2,0.5" or
+    "exponential:0.3" (mean). Samples are never negative.
+    """
+    name, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v.strip()]
+    samplers = {
+        "fixed": lambda rng: values[0],
+        "uniform": lambda rng: rng.uniform(values[0], values[1]),
+        "normal": lambda rng: rng.gauss(values[0], values[1]),
+        "lognormal": lambda rng: rng.lognormvariate(values[0], values[1]),
+        "exponential": lambda rng: rng.expovariate(1.0 / values[0])
+    }
+    if name not in samplers:
+        raise ValueError(f"Unknown distribution '{name}' (expected one of {', '.join(samplers)})")
+    sampler = samplers[name]
+    return lambda rng: max(sampler(rng), 0.0)
+
+
+def _seeded_rng(*parts):
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+def _sse(payload):
+    return f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+
+
+# -----------------------------
+# Class: Mock OpenAI-compatible API
+# -----------------------------
+class MockProvider:
+    """
+    Serves /chat/completions (plain and SSE-streamed) and /embeddings for
+    an httpx.MockTransport. Latency, reply length and failures are drawn
+    from an RNG seeded by (seed, model, messages, attempt), so a run gives
+    the same replies, timings and errors at any concurrency. Failures are
+    real 429 (with Retry-After) and 500 responses.
+
+    `stats` holds what the fake provider did: calls, injected errors and
+    the simulated seconds of model latency, kept apart from our own CPU time.
+    """
+
+    def __init__(self, seed=0, latency="lognormal:-1.5,0.5", reply_words="uniform:40,120", error_rate=0.0,
+                 ttft_share=0.3, dim=1536):
+        self.seed = seed
+        self.latency = parse_distribution(latency)
+        self.reply_words = parse_distribution(reply_words)
+        self.error_rate = error_rate
+        self.ttft_share = ttft_share
+        self.dim = dim
+        self.stats = {"calls": 0, "errors": 0, "embeddings": 0, "latencies": []}
+        # Failed attempts per request still being retried; runs on the engine loop only
+        self._failures = {}
+
+    async def handle(self, request):
+        body = json.loads(request.content)
+        if request.url.path.endswith("/embeddings"):
+            return await self._embeddings(body)
+        return await self._chat(body)
+
+    async def _chat(self, body):
+        model, messages = body["model"], body["messages"]
+        key = hashlib.blake2b(json.dumps([model, messages]).encode("utf-8"), digest_size=16).digest()
+        attempt = self._failures.get(key, 0)
+        rng = _seeded_rng(self.seed, model, messages, attempt)
+        latency = self.latency(rng)
+        self.stats["calls"] += 1
+        self.stats["latencies"].append(latency)
+        if rng.random() < self.error_rate:
+            self.stats["errors"] += 1
+            self._failures[key] = attempt + 1
+            await asyncio.sleep(latency * rng.random())
+            if rng.random() < 0.5:
+                return httpx.Response(429, headers={"retry-after": "0.05"},
+                                      json={"error": {"message": "Mock rate limit", "type": "rate_limit_error"}})
+            return httpx.Response(500, json={"error": {"message": "Mock server error", "type": "server_error"}})
+        self._failures.pop(key, None)
+
+        words = max(int(self.reply_words(rng)), 1)
+        text = " ".join(rng.choice(MOCK_VOCABULARY) for _ in range(words)).capitalize() + "."
+        usage = {
+            "prompt_tokens": sum(len(m["content"]) for m in messages) // 4,
+            "completion_tokens": words,
+            "total_tokens": sum(len(m["content"]) for m in messages) // 4 + words
+        }
+        if body.get("stream"):
+            return httpx.Response(200, headers={"content-type": "text/event-stream"},
+                                  content=self._stream(model, text, usage, latency))
+
+        await asyncio.sleep(latency)
+        return httpx.Response(200, json={
+            "id": "mock-completion", "object": "chat.completion", "created": 0, "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage
+        })
+
+    async def _stream(self, model, text, usage, latency):
+        chunk = {"id": "mock-completion", "object": "chat.completion.chunk", "created": 0, "model": model}
+        await asyncio.sleep(latency * self.ttft_share)
+        parts = [text[i:i + 24] for i in range(0, len(text), 24)]
+        for part in parts:
+            yield _sse(dict(chunk, choices=[{"index": 0, "delta": {"content": part}, "finish_reason": None}]))
+            await asyncio.sleep(latency * (1 - self.ttft_share) / len(parts))
+        yield _sse(dict(chunk, choices=[], usage=usage))
+        yield b"data: [DONE]\n\n"
+
+    async def _embeddings(self, body):
+        texts = [body["input"]] if isinstance(body["input"], str) else body["input"]
+        self.stats["embeddings"] += len(texts)
+        await asyncio.sleep(self.latency(_seeded_rng(self.seed, body["model"], texts)) / 4)
+        data = []
+        for index, text in enumerate(texts):
+            vector = stub_embedding(text, self.dim)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(array.array("f", vector).tobytes()).decode("ascii")
+            data.append({"object": "embedding", "index": index, "embedding": vector})
+        prompt_tokens = sum(len(text) for text in texts) // 4
+        return httpx.Response(200, json={
+            "object": "list", "model": body["model"], "data": data,
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens}
+        })
+
+
+# -----------------------------
+# Class: Mock LLM Engine
+# -----------------------------
+class MockEngine(LLMEngine):
+    """
+    An LLMEngine whose httpx client talks to a MockProvider instead of the
+    network, so caching, metrics, streaming and the scheduler's retries all
+    run the live code path. `stats` is the provider's; engine_kwargs (cache,
+    max_connections, max_in_flight) go to LLMEngine.
+    """
+
+    def __init__(self, seed=0, latency="lognormal:-1.5,0.5", reply_words="uniform:40,120", error_rate=0.0,
+                 ttft_share=0.3, dim=1536, scheduler=None, **engine_kwargs):
+        self.mock = MockProvider(seed, latency, reply_words, error_rate, ttft_share, dim)
+        super().__init__(
+            scheduler=scheduler or RequestScheduler(
+                rate_limits={}, default_rpm=10 ** 9, default_tpm=10 ** 12, base_delay=0.05, max_delay=1.0),
+            provider="mock",
+            transport=httpx.MockTransport(self.mock.handle),
+            api_key="mock",
+            base_url=MOCK_BASE_URL,
+            **engine_kwargs
+        )
+        self.stats = self.mock.stats
+
+
+# -----------------------------
+# Class: Mock Qdrant Client
+# -----------------------------
+class MockQdrantClient:
+    """
+    Answers search() with synthetic chunks picked deterministically from the
+    query vector and filter, shaped like the points upload_to_qdrant.py
+    writes, so persona enrichment runs without a Qdrant server.
+    """
+
+    def __init__(self, seed=0, documents=40):
+        self.seed = seed
+        self.documents = documents
+        self.searches = 0
+
+    def search(self, collection_name, query_vector, limit=3, query_filter=None, **kwargs):
+        self.searches += 1
+        vector = query_vector["vector"] if isinstance(query_vector, dict) else query_vector
+        rng = _seeded_rng(self.seed, collection_name, [round(v, 4) for v in vector[:16]], str(query_filter))
+        points = []
+        for doc_id in rng.sample(range(self.documents), min(limit, self.documents)):
+            doc_rng = _seeded_rng(self.seed, collection_name, doc_id)
+            content = " ".join(doc_rng.choice(MOCK_VOCABULARY) for _ in range(120))
+            points.append(SimpleNamespace(
+                id=doc_id,
+                score=round(rng.uniform(0.5, 0.95), 4),
+                payload={"title": f"Mock document {doc_id} – Section {doc_id % 5 + 1}", "content": content}
+            ))
+        return sorted(points, key=lambda point: point.score, reverse=True)
+
+
+# -----------------------------
+# Function: Mock Backend from the Environment
+# -----------------------------
+def create_mock_backend(seed=None, latency=None, reply_words=None, error_rate=None, **engine_kwargs):
+    """
+    Builds a MockEngine and registers a MockQdrantClient for the default
+    Qdrant host. Unset arguments come from MOCK_SEED, MOCK_LATENCY,
+    MOCK_REPLY_WORDS and MOCK_ERROR_RATE; engine_kwargs (cache,
+    max_connections, max_in_flight) go to the MockEngine.
+    """
+    from persona_utils import register_qdrant_client
+
+    seed = seed if seed is not None else int(os.environ.get("MOCK_SEED", 0))
+    engine = MockEngine(
+        seed=seed,
+        latency=latency or os.environ.get("MOCK_LATENCY", "lognormal:-1.5,0.5"),
+        reply_words=reply_words or os.environ.get("MOCK_REPLY_WORDS", "uniform:40,120"),
+        error_rate=error_rate if error_rate is not None else float(os.environ.get("MOCK_ERROR_RATE", 0.0)),
+        **engine_kwargs
+    )
+    register_qdrant_client(MockQdrantClient(seed))
+    return engine
@@ -1,105 +1,200 @@
 from file_utils import load_file_reference
+import os
 import sys
+import time
+import asyncio
 import hashlib
+import threading
+import metrics
 from pathlib import Path
-from openai import OpenAI
+from llm_engine import get_llm_engine
 from qdrant_client import QdrantClient
 from qdrant_client.http.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue
 
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+
 # -----------------------------
 # Add referenced files to each personas
 # -----------------------------
-import sys
-from pathlib import Path
+def enrich_personas_with_file_references(personas, max_chars=3000, engine=None, top_k=3):
+    """
+    Resolves every persona reference before the first round. Lookups are
+    collected across all personas and de-duplicated (same file, or same query
+    and Qdrant filter), then resolved concurrently on the engine loop.
+    """
+    engine = engine or get_llm_engine()
+    persona_lookups = collect_reference_lookups(personas, top_k)
 
-def enrich_personas_with_file_references(personas, max_chars=3000):
-    for persona in personas:
+    owners = {}
+    for persona, lookups in persona_lookups:
+        for lookup in lookups:
+            owners.setdefault(lookup, []).append(persona["name"])
+
+    with metrics.labels(purpose="reference"):
+        outcomes = engine.run(resolve_reference_lookups(list(owners), engine, max_chars))
+
+    for lookup, names in owners.items():
+        result, seconds, error = outcomes[lookup]
+        if error is not None:
+            if lookup[0] == "file":
+                print(f"[red]ERROR reading file {lookup[1]} for {names[0]}[/red]: {error}")
+            else:
+                print(f"[red]ERROR querying Qdrant for {names[0]}[/red]: {error}")
+            sys.exit(1)
+        label = lookup[1] if lookup[0] == "file" else f"qdrant {lookup[2]}"
+        print(f"[blue]Resolved {label} in {seconds * 1000:.0f} ms for:[/blue] {', '.join(names)}")
+
+    for persona, lookups in persona_lookups:
         resolved = []
         qdrant_titles = []  # ✅ initialize here
+        timings = []
 
+        for lookup in lookups:
+            result, seconds, _ = outcomes[lookup]
+            if lookup[0] == "file":
+                resolved.append({"path": lookup[1], "content": result})
+            else:
+                resolved += result
+                qdrant_titles += [match["path"] for match in result if match["path"].startswith("[Qdrant match")]
+            timings.append({"reference": lookup[1] if lookup[0] == "file" else lookup[2], "ms": round(seconds * 1000, 1)})
+
+        persona["resolved_file_references"] = resolved
+        persona["reference_timings"] = timings
+        if qdrant_titles:
+            persona["resolved_qdrant_titles"] = qdrant_titles
+
+    return personas
+
+
+# -----------------------------
+# Collect (and validate) each persona's reference lookups
+# -----------------------------
+def collect_reference_lookups(personas, top_k=3):
+    """
+    Returns [(persona, [lookup, ...])] where a lookup is ("file", path) or
+    ("qdrant", query_text, filter_value, top_k). Identical lookups compare
+    equal, so shared references are only resolved once.
+    """
+    persona_lookups = []
+    for persona in personas:
+        lookups = []
         for ref in persona.get("references", []):
             if ref["type"] == "file":
                 file_path = ref["value"]
                 if not Path(file_path).exists():
                     print(f"[red]ERROR: File not found for {persona['name']}[/red]: {file_path}")
                     sys.exit(1)
-                try:
-                    resolved.append({
-                        "path": file_path,
-                        "content": load_file_reference(file_path, max_chars=max_chars)
-                    })
-                    print(f"[blue]Resolved file for {persona['name']}:[/blue] {file_path}")
-                except Exception as e:
-                    print(f"[red]ERROR reading file {file_path} for {persona['name']}[/red]: {e}")
-                    sys.exit(1)
+                lookups.append(("file", file_path))
 
             elif ref["type"].startswith("vector:qdrant"):
-                try:
-                    query_seed = persona.get("regular_prompt")
-                    if not query_seed:
-                        print(f"[yellow]Warning: No regular_prompt found for {persona['name']} — skipping Qdrant lookup.[/yellow]")
-                        continue
-
-                    print(f"[green]Querying Qdrant for {persona['name']} using:[/green] {ref['value']}")
-                    matches = get_qdrant_matches(  
-                        query_text=query_seed,
-                        filter_value=ref["value"].replace("vector:qdrant:", ""),
-                        top_k=3
-                    )
-                    resolved += matches
-                    qdrant_titles += [match["path"] for match in matches if match["path"].startswith("[Qdrant match")]
-
-                except Exception as e:
-                    print(f"[red]ERROR querying Qdrant for {persona['name']}[/red]: {e}")
-                    sys.exit(1)
+                query_seed = persona.get("regular_prompt")
+                if not query_seed:
+                    print(f"[yellow]Warning: No regular_prompt found for {persona['name']} — skipping Qdrant lookup.[/yellow]")
+                    continue
+                lookups.append(("qdrant", query_seed, ref["value"].replace("vector:qdrant:", ""), top_k))
+        persona_lookups.append((persona, lookups))
+    return persona_lookups
 
-        persona["resolved_file_references"] = resolved
-        if qdrant_titles:
-            persona["resolved_qdrant_titles"] = qdrant_titles  
 
-    return personas
+# -----------------------------
+# Resolve unique lookups concurrently (runs on the engine loop)
+# -----------------------------
+async def resolve_reference_lookups(lookups, engine, max_chars=3000):
+    """
+    Files are read in worker threads, every distinct query is embedded in one
+    batched request, and the Qdrant searches run side by side.
+    Returns {lookup: (result, seconds, error)}.
+    """
+    queries = list(dict.fromkeys(lookup[1] for lookup in lookups if lookup[0] == "qdrant"))
+    vectors = {}
+    embed_error = None
+    if queries:
+        started = time.perf_counter()
+        try:
+            vectors = dict(zip(queries, await engine.embed(model=EMBEDDING_MODEL, inputs=queries)))
+            print(f"[green]Embedded {len(queries)} Qdrant quer{'y' if len(queries) == 1 else 'ies'} in {(time.perf_counter() - started) * 1000:.0f} ms[/green]")
+        except Exception as e:
+            embed_error = e
+
+    async def resolve(lookup):
+        started = time.perf_counter()
+        try:
+            if lookup[0] == "file":
+                result = await asyncio.to_thread(load_file_reference, lookup[1], max_chars)
+            elif embed_error is not None:
+                raise embed_error
+            else:
+                _, query_text, filter_value, top_k = lookup
+                with metrics.labels(reference=filter_value):
+                    result = await asyncio.to_thread(search_qdrant, vectors[query_text], filter_value, top_k)
+            return lookup, (result, time.perf_counter() - started, None)
+        except Exception as e:
+            return lookup, (None, time.perf_counter() - started, e)
+
+    return dict(await asyncio.gather(*(resolve(lookup) for lookup in lookups)))
 
 
 
 
 # -----------------------------
-# Retrieve top matching chunks from Qdrant
+# Shared Qdrant client (one per host/port for the whole process)
 # -----------------------------
-def get_qdrant_matches(query_text, filter_value, top_k=3):
-    # field, value = filter_value.split(":", 1)
+_qdrant_clients = {}
+_qdrant_lock = threading.Lock()
 
-    try:
-        # Require and parse both collection and filter key=value pair(s)
-        parts = dict(part.split("=", 1) for part in filter_value.split(","))
-        if "collection" not in parts:
-            raise ValueError("Missing required 'collection=' in filter_value")
-
-        collection_name = parts["collection"]
-        # Only support a single filter field for now (excluding 'collection')
-        filter_fields = [(k, v) for k, v in parts.items() if k != "collection"]
-        if len(filter_fields) != 1:
-            raise ValueError("filter_value must contain exactly one field to filter on (besides 'collection')")
-
-        field, value = filter_fields[0]
-    except Exception as e:
-        print(f"[red]ERROR parsing Qdrant filter_value:[/red] {filter_value} – {e}")
-        sys.exit(1)
+def get_qdrant_client(host=None, port=None):
+    host = host or os.environ.get("QDRANT_HOST", "localhost")
+    port = port or int(os.environ.get("QDRANT_PORT", 6333))
+    with _qdrant_lock:
+        if (host, port) not in _qdrant_clients:
+            _qdrant_clients[(host, port)] = QdrantClient(host=host, port=port)
+        return _qdrant_clients[(host, port)]
+
+
+def register_qdrant_client(client, host=None, port=None):
+    # Lets another client (e.g. mock_backend.MockQdrantClient) serve a host/port
+    host = host or os.environ.get("QDRANT_HOST", "localhost")
+    port = port or int(os.environ.get("QDRANT_PORT", 6333))
+    with _qdrant_lock:
+        _qdrant_clients[(host, port)] = client
+
+
+# -----------------------------
+# Parse "collection=...,field=value" Qdrant filters
+# -----------------------------
+def parse_qdrant_filter(filter_value):
+    # Require and parse both collection and filter key=value pair(s)
+    parts = dict(part.split("=", 1) for part in filter_value.split(","))
+    if "collection" not in parts:
+        raise ValueError("Missing required 'collection=' in filter_value")
+
+    collection_name = parts["collection"]
+    # Only support a single filter field for now (excluding 'collection')
+    filter_fields = [(k, v) for k, v in parts.items() if k != "collection"]
+    if len(filter_fields) != 1:
+        raise ValueError("filter_value must contain exactly one field to filter on (besides 'collection')")
 
-    client = QdrantClient(host="localhost", port=6333)
-    vector = OpenAI().embeddings.create(
-        input=query_text,
-        model="text-embedding-3-small"
-    ).data[0].embedding
-
-    results = client.search(
-        collection_name=collection_name,
-        query_vector={"name": "content_embedding", "vector": vector},
-        limit=top_k,
-        query_filter=Filter(
-            must=[FieldCondition(key=field, match=MatchValue(value=value))]
+    field, value = filter_fields[0]
+    return collection_name, field, value
+
+
+# -----------------------------
+# Search Qdrant with a ready query vector
+# -----------------------------
+def search_qdrant(vector, filter_value, top_k=3):
+    collection_name, field, value = parse_qdrant_filter(filter_value)
+
+    with metrics.track("qdrant", "qdrant", collection_name):
+        results = get_qdrant_client().search(
+            collection_name=collection_name,
+            query_vector={"name": "content_embedding", "vector": vector},
+            limit=top_k,
+            query_filter=Filter(
+                must=[FieldCondition(key=field, match=MatchValue(value=value))]
+            )
         )
-    )
 
     # Deduplicate by title and hash
     seen_titles = set()
@@ -123,22 +218,49 @@ def get_qdrant_matches(query_text, filter_value, top_k=3):
     return unique_matches
 
 
+# -----------------------------
+# Retrieve top matching chunks from Qdrant
+# -----------------------------
+def get_qdrant_matches(query_text, filter_value, top_k=3, engine=None):
+    try:
+        parse_qdrant_filter(filter_value)
+    except Exception as e:
+        print(f"[red]ERROR parsing Qdrant filter_value:[/red] {filter_value} – {e}")
+        sys.exit(1)
+
+    engine = engine or get_llm_engine()
+    vector = engine.run(engine.embed(
+        model=EMBEDDING_MODEL,
+        inputs=query_text
+    ))[0]
+
+    return search_qdrant(vector, filter_value, top_k)
+
+
 # -----------------------------
 # Generate a 2–3 sentence summary of the discussion.
 # -----------------------------
-def summarize_discussion(messages, client, model="gpt-4o"):
+def summarize_discussion(messages, engine, model="gpt-4o"):
+    full_text = "\n\n".join([f"{m['persona']}: {m['text']}" for m in messages if m.get("text")])
+    return summarize_transcript(full_text, engine, model)
+
+
+def summarize_transcript(text, engine, model="gpt-4o"):
+    """
+    Case Summary from any discussion text: the full transcript, or the
+    bounded digest kept by rolling_summary.RollingSummary.
+    """
     summary_prompt = (
         "Summarize this multi-agent discussion in 2–3 sentences. "
         "Focus on the topic, key decisions or arguments, and the overall outcome. "
         "Avoid naming specific personas."
     )
 
-    full_text = "\n\n".join([f"{m['persona']}: {m['text']}" for m in messages if m.get("text")])
-
     messages = [
         {"role": "system", "content": "You are a helpful summarizer of multi-agent conversations."},
-        {"role": "user", "content": summary_prompt + "\n\n" + full_text}
+        {"role": "user", "content": summary_prompt + "\n\n" + text}
     ]
 
-    response = client.chat.completions.create(model=model, messages=messages)
-    return response.choices[0].message.content.strip()
+    with metrics.labels(purpose="case_summary"):
+        response = engine.run(engine.chat(model=model, messages=messages))
+    return response["content"].strip()
@@ -0,0 +1,312 @@
+import os
+import json
+import time
+import atexit
+import threading
+from rich import print
+from openai import APIConnectionError, RateLimitError, InternalServerError
+from llm_engine import LLMEngine, get_llm_engine
+from scheduler import CircuitOpenError, DeadlineExceeded
+
+# Errors left over once the scheduler has given up on a provider
+FAILOVER_ERRORS = (CircuitOpenError, DeadlineExceeded, APIConnectionError, RateLimitError, InternalServerError)
+
+# -----------------------------
+# Provider Registry
+# -----------------------------
+# base_url_env:   environment variable that overrides base_url
+# models:         model-name prefixes served by the provider
+# labels:         persona "llm" values that mean this provider
+# fallback_model: model used when another provider's call fails over here
+# cost_per_1k:    rough blended USD per 1k tokens of the fallback model
+PROVIDERS = {
+    "openai": {
+        "base_url": None,  # the SDK default
+        "base_url_env": "OPENAI_BASE_URL",
+        "api_key_env": "OPENAI_API_KEY",
+        "models": ("gpt-", "o1", "o3", "o4", "text-embedding-"),
+        "labels": ("chatgpt", "openai", "gpt"),
+        "fallback_model": "gpt-4o-mini",
+        "cost_per_1k": 0.0004
+    },
+    "gemini": {
+        "base_url": "https://generativelanguage.googleapis.com/v1beta/openai/",
+        "base_url_env": "GEMINI_BASE_URL",
+        "api_key_env": "GEMINI_API_KEY",
+        "models": ("gemini-",),
+        "labels": ("gemini", "google"),
+        "fallback_model": "gemini-2.0-flash",
+        "cost_per_1k": 0.0002
+    },
+    "deepseek": {
+        "base_url": "https://api.deepseek.com",
+        "base_url_env": "DEEPSEEK_BASE_URL",
+        "api_key_env": "DEEPSEEK_API_KEY",
+        "models": ("deepseek-",),
+        "labels": ("deepseek",),
+        "fallback_model": "deepseek-chat",
+        "cost_per_1k": 0.0007
+    },
+    "local": {
+        "base_url": "http://127.0.0.1:8000/v1",  # python local_stub.py
+        "base_url_env": "LOCAL_LLM_BASE_URL",
+        "api_key_env": "LOCAL_LLM_API_KEY",
+        "models": ("local-",),
+        "labels": ("local",),
+        "fallback_model": "local-model",
+        "cost_per_1k": 0.0
+    }
+}
+DEFAULT_PROVIDER = "openai"
+# Latency assumed for a provider that hasn't answered yet (seconds)
+DEFAULT_LATENCY = 5.0
+EWMA_ALPHA = 0.3
+
+
+# -----------------------------
+# Function: Register or Override a Provider
+# -----------------------------
+def register_provider(name, base_url, api_key_env, models=(), labels=(), fallback_model=None, cost_per_1k=0.0,
+                      base_url_env=None):
+    PROVIDERS[name] = {
+        "base_url": base_url,
+        "base_url_env": base_url_env,
+        "api_key_env": api_key_env,
+        "models": tuple(models),
+        "labels": tuple(label.lower() for label in labels),
+        "fallback_model": fallback_model,
+        "cost_per_1k": cost_per_1k
+    }
+
+
+def load_provider_overrides():
+    """
+    LLM_PROVIDERS may point to a JSON file of {name: {base_url, api_key_env,
+    models, labels, fallback_model, cost_per_1k, base_url_env}} to add or
+    replace providers.
+    """
+    path = os.environ.get("LLM_PROVIDERS")
+    if not path:
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for name, config in json.load(f).items():
+            register_provider(name, **config)
+
+
+def provider_configured(name):
+    # The local stub needs no key, only its URL; everything else needs its API key set
+    if name == "local" and os.environ.get("LOCAL_LLM_BASE_URL"):
+        return True
+    return bool(os.environ.get(PROVIDERS[name]["api_key_env"]))
+
+
+def model_provider(model):
+    """The provider whose model prefix matches ("gemini-1.5-pro" -> gemini), or None."""
+    for name, config in PROVIDERS.items():
+        if any(model.startswith(prefix) for prefix in config["models"]):
+            return name
+    return None
+
+
+def label_provider(llm):
+    """The provider a persona's llm label names ("Gemini" -> gemini), or None."""
+    if llm:
+        for name, config in PROVIDERS.items():
+            if llm.lower() in config["labels"]:
+                return name
+    return None
+
+
+# -----------------------------
+# Function: Provider for a Persona's Model / llm
+# -----------------------------
+def provider_for(model, llm=None):
+    """
+    Personas usually share one default model name, so the llm label is the
+    more deliberate choice of the two: a persona labelled "Gemini" with
+    model "gpt-3.5-turbo" goes to Gemini. The label only wins when its
+    provider is configured and has a fallback model to substitute (see
+    resolve_model); otherwise a label with no key set would send the call
+    nowhere. Without a usable label, the model prefix decides, then the
+    default provider.
+    """
+    by_model = model_provider(model)
+    by_label = label_provider(llm)
+    if by_label and by_label != by_model and provider_configured(by_label):
+        if by_model is None or PROVIDERS[by_label]["fallback_model"]:
+            return by_label
+    return by_model or DEFAULT_PROVIDER
+
+
+_substitutions_logged = set()
+
+
+def resolve_model(model, llm=None):
+    """
+    (provider, model) for a persona. When the label routes the call away
+    from the provider that serves `model`, that provider's fallback model
+    is used instead, and the substitution is logged once per pair.
+    """
+    provider = provider_for(model, llm)
+    by_model = model_provider(model)
+    if by_model is None or by_model == provider:
+        return provider, model
+    substitute = PROVIDERS[provider]["fallback_model"]
+    if (model, llm) not in _substitutions_logged:
+        _substitutions_logged.add((model, llm))
+        print(f"[dim]llm \"{llm}\" routes to {provider}: using {substitute} instead of {model}[/dim]")
+    return provider, substitute
+
+
+# -----------------------------
+# Class: Latency / Failure Stats per Provider
+# -----------------------------
+class ProviderStats:
+    def __init__(self):
+        self.latency = None  # EWMA of seconds per call
+        self.calls = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.calls += 1
+            self.latency = seconds if self.latency is None else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.latency
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+
+
+# -----------------------------
+# Class: Provider Router
+# -----------------------------
+class ProviderRouter:
+    """
+    Drop-in for LLMEngine (run / chat / embed / close) that sends each chat
+    call to the provider of its model or persona llm. Every provider gets its
+    own LLMEngine (client + connection pool) on the primary engine's loop,
+    created on first use; all of them share the scheduler and caches.
+
+    When a provider fails for good (breaker open, deadline, retries used up)
+    the call fails over to the other configured providers, cheapest and
+    fastest first. A provider whose average latency exceeds slow_seconds is
+    routed around while a faster configured one is available.
+    """
+
+    def __init__(self, primary, slow_seconds=None, cost_weight=None):
+        load_provider_overrides()
+        self.primary = primary
+        self.loop = primary.loop
+        self.scheduler = primary.scheduler
+        self.cache = primary.cache
+        self.embedding_cache = primary.embedding_cache
+        self.slow_seconds = slow_seconds or float(os.environ.get("LLM_SLOW_SECONDS", 30.0))
+        # Seconds of latency one USD per 1k tokens is worth when ranking fallbacks
+        self.cost_weight = cost_weight if cost_weight is not None else float(os.environ.get("LLM_COST_WEIGHT", 1000.0))
+        self.engines = {DEFAULT_PROVIDER: primary}
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def engine(self, provider):
+        with self._lock:
+            if provider not in self.engines:
+                config = PROVIDERS[provider]
+                self.engines[provider] = LLMEngine(
+                    host=self.primary,
+                    provider=provider,
+                    scheduler=self.scheduler,
+                    cache=self.cache,
+                    embedding_cache=self.embedding_cache,
+                    max_connections=self.primary.max_connections,
+                    max_in_flight=self.primary.max_in_flight,
+                    base_url=os.environ.get(config.get("base_url_env") or "") or config["base_url"],
+                    api_key=os.environ.get(config["api_key_env"]) or "local"
+                )
+            return self.engines[provider]
+
+    def stats_for(self, provider):
+        with self._lock:
+            return self.stats.setdefault(provider, ProviderStats())
+
+    def score(self, provider):
+        latency = self.stats_for(provider).latency
+        return (DEFAULT_LATENCY if latency is None else latency) + self.cost_weight * PROVIDERS[provider]["cost_per_1k"]
+
+    def route(self, model, llm=None):
+        """Returns [(provider, model), ...]: the primary choice, then fallbacks."""
+        primary, model = resolve_model(model, llm)
+        fallbacks = sorted(
+            (name for name in PROVIDERS
+             if name != primary and PROVIDERS[name]["fallback_model"] and provider_configured(name)),
+            key=self.score
+        )
+        candidates = [(primary, model)] + [(name, PROVIDERS[name]["fallback_model"]) for name in fallbacks]
+
+        latency = self.stats_for(primary).latency
+        if fallbacks and latency is not None and latency > self.slow_seconds and self.score(fallbacks[0]) < self.score(primary):
+            candidates.insert(0, candidates.pop(1))
+        return candidates
+
+    def run(self, coro, timeout=None):
+        return self.primary.run(coro, timeout)
+
+    async def chat(self, model, messages, llm=None, **kwargs):
+        """
+        Like LLMEngine.chat, plus "provider" and "model" in the result to
+        show where the call was served after any failover.
+        """
+        candidates = self.route(model, llm)
+        on_token = kwargs.pop("on_token", None)
+        streamed = False
+
+        def relay(text):
+            nonlocal streamed
+            streamed = text is not None
+            on_token(text)
+
+        for i, (provider, target_model) in enumerate(candidates):
+            if streamed:
+                # The failed provider had started streaming; the fallback's reply starts over
+                on_token(None)
+                streamed = False
+            started = time.monotonic()
+            try:
+                response = await self.engine(provider).chat(target_model, messages, on_token=relay if on_token else None,
+                                                            **kwargs)
+            except FAILOVER_ERRORS as e:
+                self.stats_for(provider).failure()
+                if i == len(candidates) - 1:
+                    raise
+                print(f"[yellow]{provider} failed for {target_model} ({type(e).__name__}); "
+                      f"failing over to {candidates[i + 1][0]}[/yellow]")
+                continue
+            if not response["cached"]:
+                self.stats_for(provider).observe(time.monotonic() - started)
+            return dict(response, provider=provider, model=target_model)
+
+    async def embed(self, model, inputs):
+        return await self.engine(provider_for(model)).embed(model, inputs)
+
+    def close(self):
+        for provider, engine in list(self.engines.items()):
+            if engine is not self.primary:
+                engine.close()
+        self.primary.close()
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+# -----------------------------
+# Function: Process-wide Router
+# -----------------------------
+def get_router(**engine_kwargs):
+    """Wraps the shared engine (see get_llm_engine) in the process-wide router."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ProviderRouter(get_llm_engine(**engine_kwargs))
+            atexit.register(_router.close)  # runs before the primary engine's own atexit close
+        return _router
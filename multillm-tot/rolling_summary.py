@@ -0,0 +1,143 @@
+import os
+import asyncio
+import metrics
+from rich import print
+from context_builder import fit_target, token_budget
+
+SUMMARY_MODES = ["full", "rolling"]
+DEFAULT_SUMMARY_MODEL = os.environ.get("SUMMARY_MODEL", "gpt-4o")
+SUMMARY_MAX_TOKENS = 200
+SUMMARY_SENTENCES = 4
+# Cap on the new-message text sent with one update (older lines are trimmed first)
+NEW_MESSAGES_BUDGET = 6000
+
+SUMMARY_SYSTEM_PROMPT = "You maintain running summaries of a multi-agent discussion."
+
+
+# -----------------------------
+# Class: Rolling Summaries (per thread and per round)
+# -----------------------------
+class RollingSummary:
+    """
+    Keeps one short summary per thread (keyed by the thread's root message)
+    and one per round. After each round only the new messages are sent,
+    together with the previous summary, so every update costs a bounded
+    prompt no matter how long the session has run.
+
+    Goal-round replies each start their own thread, so they only go into
+    that round's summary: one update for the whole round.
+
+    Messages whose update failed stay pending and are retried next round.
+    """
+
+    def __init__(self, model=DEFAULT_SUMMARY_MODEL, max_tokens=SUMMARY_MAX_TOKENS):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.threads = {}   # root id -> {"title", "summary", "pending"}
+        self.rounds = {}    # round -> {"summary", "pending"}
+        self.latest = []    # lines of the most recently summarised round
+
+    def to_dict(self):
+        # Round keys are ints or "Goal - ..." strings, so rounds are kept as pairs
+        return {"threads": self.threads, "rounds": list(self.rounds.items()), "latest": self.latest}
+
+    @classmethod
+    def from_dict(cls, data, **kwargs):
+        summary = cls(**kwargs)
+        summary.threads = data["threads"]
+        summary.rounds = dict(data["rounds"])
+        summary.latest = data["latest"]
+        return summary
+
+    def add(self, store, messages):
+        """Queues newly committed messages under their thread and round."""
+        for message in messages:
+            line = f"{message['persona']}: {message['text'].strip()}"
+            self.rounds.setdefault(message["round"], {"summary": "", "pending": []})["pending"].append(line)
+            if str(message["round"]).lower().startswith("goal"):
+                continue
+            root = store.root(message)
+            thread = self.threads.setdefault(root["id"], {
+                "title": f"Thread started by {root['persona']} (Round {root['round']})",
+                "summary": "",
+                "pending": []
+            })
+            thread["pending"].append(line)
+        if messages:
+            self.latest = [f"{m['persona']}: {m['text'].strip()}" for m in messages]
+
+    def update(self, store, messages, engine, concurrency=4):
+        """
+        Adds the round's messages and refreshes every summary that has
+        pending lines. Returns the number of summaries updated.
+        """
+        self.add(store, messages)
+        entries = [
+            (f"thread \"{thread['title']}\"", thread)
+            for thread in self.threads.values() if thread["pending"]
+        ] + [
+            (f"round {round_num}" if isinstance(round_num, int) else round_num, entry)
+            for round_num, entry in self.rounds.items() if entry["pending"]
+        ]
+        if not entries:
+            return 0
+        return engine.run(self._refresh(entries, engine, concurrency))
+
+    async def _refresh(self, entries, engine, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def refresh(kind, entry):
+            async with semaphore:
+                pending = list(entry["pending"])
+                try:
+                    entry["summary"] = await self._summarize(kind, entry["summary"], pending, engine)
+                except Exception as e:
+                    print(f"[red]Rolling summary update failed for {kind}[/red]")
+                    print(f"[dim]{str(e)}[/dim]")
+                    return 0
+                del entry["pending"][:len(pending)]
+                return 1
+
+        results = await asyncio.gather(*(refresh(kind, entry) for kind, entry in entries))
+        return sum(results)
+
+    async def _summarize(self, kind, previous, lines, engine):
+        budget = min(NEW_MESSAGES_BUDGET, token_budget(self.model, SUMMARY_SYSTEM_PROMPT) // 2)
+        new_text, _ = fit_target("\n\n".join(lines), budget, self.model)
+        prompt = (
+            f"Current summary of {kind}:\n{previous or '(nothing yet)'}\n\n"
+            f"New messages:\n{new_text}\n\n"
+            f"Rewrite the summary so it also covers the new messages, in at most {SUMMARY_SENTENCES} sentences. "
+            "Keep positions, agreements, disagreements and open questions. Reply with the summary only."
+        )
+        with metrics.labels(purpose="rolling_summary"):
+            response = await engine.chat(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=self.max_tokens
+            )
+        return response["content"].strip()
+
+    def digest(self):
+        """Round and thread summaries as one bounded block of text."""
+        lines = ["Round summaries:"]
+        for round_num, entry in self.rounds.items():
+            if entry["summary"]:
+                label = f"Round {round_num}" if isinstance(round_num, int) else round_num  # "Goal - decision"
+                lines.append(f"- {label}: {entry['summary']}")
+        lines += ["", "Thread summaries:"]
+        lines += [f"- {thread['title']}: {thread['summary']}" for thread in self.threads.values() if thread["summary"]]
+        return "\n".join(lines)
+
+    def goal_context(self):
+        """
+        What the goal round sees instead of the full transcript: the digest
+        plus the latest round verbatim, so recent wording isn't lost.
+        """
+        text = "Here is a summary of the conversation so far:\n\n" + self.digest()
+        if self.latest:
+            text += "\n\nMessages from the latest round:\n\n" + "\n\n".join(self.latest)
+        return text
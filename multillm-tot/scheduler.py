@@ -0,0 +1,294 @@
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+import metrics
+from openai import RateLimitError, APIConnectionError, APIStatusError, InternalServerError
+
+DEFAULT_RPM = 500
+DEFAULT_TPM = 200000
+DEFAULT_COMPLETION_ESTIMATE = 512
+
+# Errors worth retrying; anything else (bad request, auth, ...) fails at once
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+
+
+class CircuitOpenError(Exception):
+    """A provider's circuit breaker is open; the call was not sent."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """The per-call deadline passed while waiting, retrying or receiving."""
+
+
+# -----------------------------
+# Function: Retry-After (seconds) from a rate-limit error
+# -----------------------------
+def retry_after_seconds(error, default=1.0):
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+# -----------------------------
+# Class: Token Bucket (per minute)
+# -----------------------------
+class TokenBucket:
+    """
+    Refills continuously at `per_minute / 60` per second up to `per_minute`.
+    reserve() takes the amount straight away (the level may go negative) and
+    returns how long the caller must wait before using it, so waiting callers
+    queue up in reservation order without holding a lock while they sleep.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        with self._lock:
+            self._refill()
+            self.level -= min(amount, self.capacity)
+            return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    def refund(self, amount):
+        # A negative amount charges extra (e.g. the reply used more tokens than estimated)
+        with self._lock:
+            self._refill()
+            self.level = min(self.capacity, self.level + amount)
+
+
+# -----------------------------
+# Class: Circuit Breaker (per provider)
+# -----------------------------
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive connection/server failures
+    and rejects calls for `reset_seconds`. After that one trial call is let
+    through (half-open): success closes the circuit, failure reopens it.
+    Rate limits don't count; they mean "slow down", not "down".
+    """
+
+    def __init__(self, failure_threshold=5, reset_seconds=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def release(self):
+        # The trial call ended without telling us anything about the provider
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+
+# -----------------------------
+# Function: Per-model Limits from the Environment
+# -----------------------------
+def load_rate_limits():
+    """
+    LLM_RATE_LIMITS holds JSON (or a path to a JSON file) mapping model names
+    to {"rpm": ..., "tpm": ...}; models not listed use LLM_RPM / LLM_TPM.
+    """
+    value = os.environ.get("LLM_RATE_LIMITS")
+    if not value:
+        return {}
+    if os.path.exists(value):
+        with open(value, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return json.loads(value)
+
+
+# -----------------------------
+# Class: Request Scheduler
+# -----------------------------
+class RequestScheduler:
+    """
+    Paces and retries every request the engine sends:
+
+      - requests/min and tokens/min buckets per model, so concurrent
+        sessions queue at the quota ceiling instead of hitting 429s
+      - exponential backoff with full jitter, or Retry-After when the
+        provider sends one (a 429 also pauses that model for every caller)
+      - a deadline per call covering queueing, retries and the response
+      - a circuit breaker per provider for connection and 5xx failures
+    """
+
+    def __init__(self, rate_limits=None, default_rpm=None, default_tpm=None, max_retries=None,
+                 base_delay=1.0, max_delay=60.0, deadline=None, failure_threshold=5, reset_seconds=30.0):
+        self.rate_limits = rate_limits if rate_limits is not None else load_rate_limits()
+        self.default_rpm = default_rpm or int(os.environ.get("LLM_RPM", DEFAULT_RPM))
+        self.default_tpm = default_tpm or int(os.environ.get("LLM_TPM", DEFAULT_TPM))
+        self.max_retries = max_retries if max_retries is not None else int(os.environ.get("LLM_MAX_RETRIES", 5))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline or float(os.environ.get("LLM_CALL_DEADLINE", 300.0))
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.retries = 0
+        self._buckets = {}
+        self._breakers = {}
+        self._resume_at = {}
+        self._lock = threading.Lock()
+
+    def buckets(self, model):
+        with self._lock:
+            if model not in self._buckets:
+                limits = self.rate_limits.get(model, {})
+                self._buckets[model] = (
+                    TokenBucket(limits.get("rpm", self.default_rpm)),
+                    TokenBucket(limits.get("tpm", self.default_tpm))
+                )
+            return self._buckets[model]
+
+    def breaker(self, provider):
+        with self._lock:
+            if provider not in self._breakers:
+                self._breakers[provider] = CircuitBreaker(self.failure_threshold, self.reset_seconds)
+            return self._breakers[provider]
+
+    def backoff(self, attempt, error):
+        if isinstance(error, RateLimitError):
+            retry_after = retry_after_seconds(error, default=None)
+            if retry_after is not None:
+                return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def _sleep_until(self, delay, deadline):
+        if delay <= 0:
+            return
+        if time.monotonic() + delay > deadline:
+            raise DeadlineExceeded(f"Call deadline of {self.deadline:.0f}s would pass while waiting {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+    async def submit(self, make_request, model="default", provider="openai", estimated_tokens=0, slots=None,
+                     deadline=None):
+        """
+        Runs `await make_request()` under the model's rate limits and the
+        provider's breaker, retrying transient failures until the deadline.
+        `slots` (an asyncio.Semaphore) bounds requests in flight.
+        Returns the request's result; raises its last error otherwise.
+        """
+        ends_at = time.monotonic() + (deadline or self.deadline)
+        requests_bucket, tokens_bucket = self.buckets(model)
+        breaker = self.breaker(provider)
+
+        for attempt in range(self.max_retries + 1):
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for provider '{provider}'")
+
+            # A half-open trial taken by allow() must be released if pacing gives up or is cancelled
+            try:
+                await self._sleep_until(self._resume_at.get(model, 0.0) - time.monotonic(), ends_at)
+            except BaseException:
+                breaker.release()
+                raise
+            wait = max(requests_bucket.reserve(1), tokens_bucket.reserve(estimated_tokens))
+            try:
+                await self._sleep_until(wait, ends_at)
+            except BaseException:
+                requests_bucket.refund(1)
+                tokens_bucket.refund(estimated_tokens)
+                breaker.release()
+                raise
+
+            try:
+                if slots is not None:
+                    async with slots:
+                        result = await asyncio.wait_for(make_request(), ends_at - time.monotonic())
+                else:
+                    result = await asyncio.wait_for(make_request(), ends_at - time.monotonic())
+            except asyncio.TimeoutError:
+                breaker.record_failure()
+                raise DeadlineExceeded(f"No response from '{provider}' within the {self.deadline:.0f}s call deadline")
+            except RETRYABLE_ERRORS as e:
+                if isinstance(e, RateLimitError):
+                    breaker.record_success()  # the provider answered; it is up, just busy
+                else:
+                    breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff(attempt, e)
+                if isinstance(e, RateLimitError):
+                    with self._lock:
+                        self._resume_at[model] = max(self._resume_at.get(model, 0.0), time.monotonic() + delay)
+                    delay = 0.0
+                self.retries += 1
+                metrics.note_retry()
+                await self._sleep_until(delay, ends_at)
+                continue
+            except APIStatusError:
+                breaker.record_success()  # a 4xx is an answer: the provider is up
+                raise
+            except BaseException:
+                breaker.release()
+                raise
+
+            breaker.record_success()
+            return result
+
+    def settle(self, model, estimated_tokens, actual_tokens):
+        """Corrects the tokens/min bucket once the real usage is known."""
+        _, tokens_bucket = self.buckets(model)
+        tokens_bucket.refund(estimated_tokens - actual_tokens)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+# -----------------------------
+# Function: Process-wide Scheduler
+# -----------------------------
+def get_scheduler(**scheduler_kwargs):
+    """Shared by every engine so quotas and breakers are tracked process-wide."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler(**scheduler_kwargs)
+        return _scheduler
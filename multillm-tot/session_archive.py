@@ -0,0 +1,364 @@
+import os
+import sys
+import json
+import math
+import mmap
+import zlib
+import click
+import struct
+from array import array
+from rich import print
+from collections import Counter
+from tree_walk import TreeVisitor, visit_tree
+
+MAGIC = b"TOTARC01"
+# Footer length (uint32) + magic, at the very end of the file
+TRAILER = struct.Struct("<I8s")
+# A text block is compressed once it holds this many characters or rows
+BLOCK_CHARS = 1 << 16
+BLOCK_ROWS = 512
+
+# name -> array typecode; persona/llm index the string tables, round < 0 is -1 - index into round_labels
+COLUMNS = {
+    "parent": "i",
+    "depth": "i",
+    "persona": "H",
+    "llm": "H",
+    "round": "i",
+    "rag_score": "d"
+}
+# Keys every message carries; anything else is kept per row under "extra"
+MESSAGE_KEYS = ("id", "round", "persona", "llm", "parentId", "timestamp", "text", "rag_score")
+
+
+def _little_endian(values):
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+# -----------------------------
+# Class: Archive Writer (tree visitor)
+# -----------------------------
+class ArchiveVisitor(TreeVisitor):
+    """
+    Writes a session as a columnar archive, walking the thread tree once:
+
+      text blocks   zlib-compressed JSON rows [id, parentId, timestamp, text(, extra)]
+      columns       little-endian arrays, one value per message (COLUMNS)
+      footer        JSON: session metadata, string tables, column and block
+                    offsets; then TRAILER
+
+    Messages are stored in reading order, so every parent row comes before
+    its replies. Writes its own binary file and returns no text.
+    """
+
+    def __init__(self, path, session=None):
+        self.path = path
+        self.session = session or {}
+        self.columns = {name: array(typecode) for name, typecode in COLUMNS.items()}
+        self.strings = {"personas": {}, "llms": {}, "round_labels": {}}
+        self.blocks = []
+        self._ancestors = []
+        self._block = []
+        self._block_chars = 0
+        self._rows = 0
+        self._file = None
+
+    def header(self):
+        self._file = open(self.path, "wb")
+        self._file.write(MAGIC)
+        return ""
+
+    def enter(self, node, depth):
+        index = self._rows
+        self._rows += 1
+        columns = self.columns
+        columns["parent"].append(self._ancestors[-1] if depth else -1)
+        columns["depth"].append(depth)
+        columns["persona"].append(self._intern("personas", node["persona"]))
+        columns["llm"].append(self._intern("llms", node.get("llm") or ""))
+        round_value = node["round"]
+        if isinstance(round_value, int) and round_value >= 0:
+            columns["round"].append(round_value)
+        else:
+            columns["round"].append(-1 - self._intern("round_labels", str(round_value)))
+        rag_score = node.get("rag_score")
+        columns["rag_score"].append(math.nan if rag_score is None else rag_score)
+
+        row = [node["id"], node.get("parentId"), node.get("timestamp"), node["text"]]
+        extra = {key: value for key, value in node.items() if key not in MESSAGE_KEYS and key != "children"}
+        if extra:
+            row.append(extra)
+        self._block.append(row)
+        self._block_chars += len(node["text"])
+        if self._block_chars >= BLOCK_CHARS or len(self._block) >= BLOCK_ROWS:
+            self._flush_block()
+        self._ancestors.append(index)
+        return ""
+
+    def leave(self, node, depth):
+        self._ancestors.pop()
+        return ""
+
+    def footer(self):
+        self._flush_block()
+        offsets = {}
+        for name, values in self.columns.items():
+            # 8-byte aligned, so readers can view the column in place
+            self._file.write(b"\0" * (-self._file.tell() % 8))
+            offsets[name] = [self._file.tell(), len(values), values.typecode]
+            self._file.write(_little_endian(values).tobytes())
+
+        footer = json.dumps({
+            "version": 1,
+            "rows": self._rows,
+            "session": self.session,
+            "personas": list(self.strings["personas"]),
+            "llms": list(self.strings["llms"]),
+            "round_labels": list(self.strings["round_labels"]),
+            "columns": offsets,
+            "blocks": self.blocks
+        }, ensure_ascii=False).encode("utf-8")
+        self._file.write(footer)
+        self._file.write(TRAILER.pack(len(footer), MAGIC))
+        self._file.close()
+        return ""
+
+    def _intern(self, table, value):
+        return self.strings[table].setdefault(value, len(self.strings[table]))
+
+    def _flush_block(self):
+        if not self._block:
+            return
+        data = zlib.compress(json.dumps(self._block, ensure_ascii=False).encode("utf-8"))
+        # [offset, bytes, first row, row count]
+        self.blocks.append([self._file.tell(), len(data), self._rows - len(self._block), len(self._block)])
+        self._file.write(data)
+        self._block = []
+        self._block_chars = 0
+
+
+def write_archive(tree, path, session=None):
+    for _ in visit_tree(tree, [ArchiveVisitor(path, session)]):
+        pass
+
+
+# -----------------------------
+# Class: Archive Reader (memory-mapped)
+# -----------------------------
+class SessionArchive:
+    """
+    Opens an archive with mmap. Columns are zero-copy views of the file,
+    so filtering by persona or round reads only those columns; text blocks
+    are decompressed only for the rows that are asked for.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        footer_length, magic = TRAILER.unpack_from(self._map, len(self._map) - TRAILER.size)
+        if magic != MAGIC or self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a session archive")
+        footer_start = len(self._map) - TRAILER.size - footer_length
+        self.meta = json.loads(self._map[footer_start:footer_start + footer_length].decode("utf-8"))
+        self.rows = self.meta["rows"]
+        self.session = self.meta["session"]
+        self.personas = self.meta["personas"]
+        self.llms = self.meta["llms"]
+        self.round_labels = self.meta["round_labels"]
+        self._columns = {}
+        self._block_cache = (None, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._columns.clear()
+        self._block_cache = (None, None)
+        self._map.close()
+        self._file.close()
+
+    def column(self, name):
+        """A column as a sequence of ints/floats, backed by the file where possible."""
+        if name not in self._columns:
+            offset, count, typecode = self.meta["columns"][name]
+            view = memoryview(self._map)[offset:offset + count * array(typecode).itemsize]
+            if sys.byteorder == "big":
+                values = array(typecode, view.tobytes())
+                values.byteswap()
+                view.release()
+                view = values
+            else:
+                view = view.cast(typecode)
+            self._columns[name] = view
+        return self._columns[name]
+
+    def round_value(self, code):
+        return code if code >= 0 else self.round_labels[-1 - code]
+
+    def round_code(self, round_value):
+        # A label stored as a string (even "3") wins over the round number it looks like
+        if isinstance(round_value, int):
+            return round_value
+        if round_value in self.round_labels:
+            return -1 - self.round_labels.index(round_value)
+        if isinstance(round_value, str) and round_value.isdigit():
+            return int(round_value)
+        return None
+
+    def select(self, persona=None, round=None):
+        """Row numbers matching every filter given (persona name, round number or label)."""
+        rows = range(self.rows)
+        if persona is not None:
+            if persona not in self.personas:
+                return []
+            code = self.personas.index(persona)
+            column = self.column("persona")
+            rows = [row for row in rows if column[row] == code]
+        if round is not None:
+            code = self.round_code(round)
+            if code is None:
+                return []
+            column = self.column("round")
+            rows = [row for row in rows if column[row] == code]
+        return list(rows)
+
+    def _block_rows(self, index):
+        if self._block_cache[0] != index:
+            offset, length, _, _ = self.meta["blocks"][index]
+            self._block_cache = (index, json.loads(zlib.decompress(self._map[offset:offset + length])))
+        return self._block_cache[1]
+
+    def messages(self, rows=None, persona=None, round=None):
+        """
+        Yields message dicts (as in the JSON export, without "children") for
+        the given rows, or for the rows matching the filters, in file order.
+        """
+        if rows is None:
+            rows = self.select(persona, round) if persona is not None or round is not None else range(self.rows)
+        starts = [block[2] for block in self.meta["blocks"]]
+        personas, llms = self.column("persona"), self.column("llm")
+        rounds, scores = self.column("round"), self.column("rag_score")
+
+        block = 0
+        for row in sorted(rows):
+            while block + 1 < len(starts) and starts[block + 1] <= row:
+                block += 1
+            stored = self._block_rows(block)[row - starts[block]]
+            message = {
+                "id": stored[0],
+                "round": self.round_value(rounds[row]),
+                "persona": self.personas[personas[row]],
+                "llm": self.llms[llms[row]],
+                "parentId": stored[1],
+                "timestamp": stored[2],
+                "text": stored[3],
+                "rag_score": None if math.isnan(scores[row]) else scores[row]
+            }
+            if len(stored) > 4:
+                message.update(stored[4])
+            yield message
+
+    def tree(self):
+        """The nested thread tree, as build_thread_tree() returns it."""
+        nodes = []
+        roots = []
+        for row, message in enumerate(self.messages()):
+            message["children"] = []
+            nodes.append(message)
+            parent = self.column("parent")[row]
+            (nodes[parent]["children"] if parent >= 0 else roots).append(message)
+        return roots
+
+    def frame(self, text=False):
+        """The columns as a pandas DataFrame (pandas is only imported here); message text too if asked."""
+        import pandas as pd
+
+        data = {
+            "parent": self.column("parent"),
+            "depth": self.column("depth"),
+            "persona": pd.Categorical.from_codes(self.column("persona"), categories=self.personas),
+            "llm": pd.Categorical.from_codes(self.column("llm"), categories=self.llms),
+            "round": [self.round_value(code) for code in self.column("round")],
+            "rag_score": self.column("rag_score")
+        }
+        if text:
+            data["text"] = [message["text"] for message in self.messages()]
+        return pd.DataFrame(data)
+
+
+# -----------------------------
+# Function: Scan Many Archives
+# -----------------------------
+def scan(paths, persona=None, round=None):
+    """Yields (path, message) for matching messages across archives, opening one at a time."""
+    for path in paths:
+        with SessionArchive(path) as archive:
+            for message in archive.messages(persona=persona, round=round):
+                yield path, message
+
+
+def count_messages(paths, by="persona"):
+    """Message counts per persona or round across archives, from the columns alone (no text is read)."""
+    counts = Counter()
+    for path in paths:
+        with SessionArchive(path) as archive:
+            for code, count in Counter(archive.column(by)).items():
+                key = archive.personas[code] if by == "persona" else archive.round_value(code)
+                counts[key] += count
+    return counts
+
+
+# -----------------------------
+# CLI: pack JSON exports, query and count archives
+# -----------------------------
+@click.group()
+def cli():
+    """Columnar session archives."""
+
+
+@cli.command()
+@click.argument('json_files', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('--out-dir', default=None, help='Folder for the archives (default: next to each JSON file)')
+
+def pack(json_files, out_dir):
+    """Convert JSON tree exports (--output json) to archives."""
+    for json_file in json_files:
+        with open(json_file, "r", encoding="utf-8") as f:
+            tree = json.load(f)
+        stem = os.path.splitext(os.path.basename(json_file))[0]
+        path = os.path.join(out_dir or os.path.dirname(json_file), f"{stem}.archive")
+        write_archive(tree, path, session={"source": json_file})
+        print(f"[bold green]Archived:[/bold green] {json_file} -> {path} "
+              f"({os.path.getsize(json_file)} -> {os.path.getsize(path)} bytes)")
+
+
+@cli.command()
+@click.argument('archives', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('--persona', default=None, help='Only messages by this persona')
+@click.option('--round', 'round_value', default=None, help='Only messages from this round (number or label, e.g. "Goal: consensus")')
+
+def show(archives, persona, round_value):
+    """Print matching messages as JSON lines."""
+    for path, message in scan(archives, persona, round_value):
+        sys.stdout.write(json.dumps(dict(message, archive=path), ensure_ascii=False) + "\n")
+
+
+@cli.command()
+@click.argument('archives', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('--by', default='persona', type=click.Choice(["persona", "round"]), help='Count messages per persona or per round')
+
+def stats(archives, by):
+    """Count messages across many archives without decompressing any text."""
+    for key, count in count_messages(archives, by).most_common():
+        print(f"{key}: {count}")
+
+
+if __name__ == '__main__':
+    cli()
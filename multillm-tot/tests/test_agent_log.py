@@ -0,0 +1,52 @@
+import sys
+import json
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from agent_log import PromptLog, read_prompt_log
+
+
+def entry(content, role="user"):
+    return {"timestamp": "2026-01-01T00:00:00Z", "persona": "Surgeon", "role": role, "content": content}
+
+
+def raw_lines(path):
+    return [json.loads(line) for line in Path(path).read_text(encoding="utf-8").splitlines()]
+
+
+def test_payloads_become_blobs_only_when_they_repeat(tmp_path):
+    path = str(tmp_path / "prompts.log")
+    log = PromptLog("s", path, compression="off")
+    reference = "Hip fracture care guideline. " * 40
+    transcript = "Surgeon: the plan needs review. " * 40
+    unique = "A one-off reply that is long. " * 40
+    log.write(entry("Intro\n" + reference), payloads=[reference])
+    log.write(entry(unique, role="assistant"))
+    log.write(entry("Again\n" + reference), payloads=[reference])
+    log.write(entry(transcript))
+    log.write(entry(transcript))
+    log.close()
+
+    lines = raw_lines(path)
+    blobs = [line for line in lines if "blob" in line]
+    assert [blob["content"] for blob in blobs] == [reference, transcript]
+    entries = [line for line in lines if "blob" not in line]
+    # First sightings stay inline; the one-off reply never becomes a blob
+    assert [("content" in e, "content_parts" in e) for e in entries] == [
+        (True, False), (True, False), (False, True), (True, False), (False, True)
+    ]
+    assert entries[2]["content_parts"] == ["Again\n", {"blob": blobs[0]["blob"]}]
+
+    restored = [e["content"] for e in read_prompt_log(path)]
+    assert restored == ["Intro\n" + reference, unique, "Again\n" + reference, transcript, transcript]
+
+
+def test_each_segment_holds_the_blobs_it_references(tmp_path):
+    path = str(tmp_path / "prompts.log")
+    transcript = "Care Manager: discharge on day four. " * 40
+    log = PromptLog("s", path, compression="off", max_bytes=1)  # rotate after every entry
+    for _ in range(3):
+        log.write(entry(transcript))
+    log.close()
+    assert all("blob" not in line for segment in (path + ".1", path + ".2", path + ".3") for line in raw_lines(segment))
+    assert [e["content"] for e in read_prompt_log(path)] == [transcript] * 3
@@ -0,0 +1,35 @@
+import re
+import sys
+import json
+from pathlib import Path
+
+import click
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from batch_runner import read_manifest
+
+
+def write_manifest(tmp_path, entries):
+    path = tmp_path / "manifest.jsonl"
+    path.write_text("\n".join(json.dumps(entry) for entry in entries) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_defaults_and_unique_ids(tmp_path):
+    entries = read_manifest(write_manifest(tmp_path, [
+        {"prompt": "A", "personas_file": "p.json", "id": "first"},
+        {"prompt": "B", "personas_file": "p.json"}
+    ]))
+    assert [entry["id"] for entry in entries] == ["first", "session-0002"]
+    assert entries[1]["rounds"] == 3 and entries[1]["output"] == "markdown"
+
+
+@pytest.mark.parametrize("second_id", ["same", "session-0001"])
+def test_duplicate_ids_are_rejected_with_the_line(tmp_path, second_id):
+    first = {"prompt": "A", "personas_file": "p.json"}
+    if second_id == "same":
+        first["id"] = "same"
+    path = write_manifest(tmp_path, [first, {"prompt": "B", "personas_file": "p.json", "id": second_id}])
+    with pytest.raises(click.BadParameter, match=re.escape(f"line 2: duplicate id '{second_id}' (already used on line 1)")):
+        read_manifest(path)
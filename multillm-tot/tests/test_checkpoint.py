@@ -0,0 +1,90 @@
+import sys
+import random
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from checkpoint import Checkpoint, load_checkpoint, restore_rng
+from main import initialize_state, restore_state, run_jobs
+
+PERSONAS = [{"name": name, "llm": "ChatGPT", "model": "gpt-4o-mini"} for name in ("Surgeon", "Care Manager", "Son")]
+
+
+class CountingEngine:
+    """Answers every chat call with the persona's name and records which personas were asked."""
+
+    def __init__(self):
+        self.asked = []
+
+    def run(self, coro, timeout=None):
+        return asyncio.run(coro)
+
+    async def chat(self, model, messages, **kwargs):
+        name = messages[0]["content"][len("You are a "):].split(".")[0]
+        self.asked.append(name)
+        return {"content": f"Fresh reply from {name}", "usage": {}, "cached": False, "timing": {"ttft": None, "total": 0.0}}
+
+
+def start_session(tmp_path, rounds=2):
+    state = initialize_state("Hip plan", rounds, PERSONAS, seed=7)
+    state.update(generatedAt="2026-01-01 00:00:00", cli_command="python main.py")
+    checkpoint = Checkpoint("s1", str(tmp_path))
+    checkpoint.start(state, {"goal_round": "optional", "summary_mode": "full", "seed": 7})
+    return state, checkpoint
+
+
+def jobs_for(round_num):
+    return [{"id": f"msg-{round_num}-{p['name']}", "persona": p, "target_text": "Hip plan", "round_label": round_num,
+             "round": round_num, "parentId": None} for p in PERSONAS]
+
+
+def test_torn_last_line_is_ignored_and_repaired(tmp_path):
+    state, checkpoint = start_session(tmp_path)
+    checkpoint.round_started(state)
+    checkpoint.reply("msg-1-Surgeon", "Saved reply")
+    checkpoint.close()
+    path = tmp_path / "s1.jsonl"
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"type": "reply", "id": "msg-1-Son", "te')  # crash mid-write
+
+    saved = load_checkpoint("s1", str(tmp_path))
+    assert saved["round"] == 1
+    assert saved["replies"] == {"msg-1-Surgeon": "Saved reply"}
+
+    Checkpoint("s1", str(tmp_path)).close()  # reopening drops the torn tail
+    assert path.read_text(encoding="utf-8").endswith("\n")
+    assert load_checkpoint("s1", str(tmp_path))["replies"] == {"msg-1-Surgeon": "Saved reply"}
+
+
+def test_rng_is_restored_as_the_round_was_planned(tmp_path):
+    state, checkpoint = start_session(tmp_path)
+    state["rng"].random()
+    checkpoint.round_started(state)
+    expected = state["rng"].random()
+    checkpoint.close()
+
+    rng = random.Random()
+    restore_rng(rng, load_checkpoint("s1", str(tmp_path))["rng_state"])
+    assert rng.random() == expected
+
+
+def test_resume_only_requests_missing_replies(tmp_path):
+    state, checkpoint = start_session(tmp_path)
+    state["checkpoint"] = checkpoint
+    engine = CountingEngine()
+    run_jobs(state, jobs_for(1), engine, None, 1, None, lambda line: None)
+    state["currentRound"] = 2
+
+    # Round 2 is cut off: one reply committed, one received but not committed, one never arrived
+    checkpoint.round_started(state)
+    checkpoint.message(2, dict(state["conversationHistory"][0], id="msg-2-Surgeon", round=2, text="Committed"))
+    checkpoint.reply("msg-2-Care Manager", "Received")
+    checkpoint.close()
+
+    resumed = restore_state(load_checkpoint("s1", str(tmp_path)))
+    assert [m["id"] for m in resumed["conversationHistory"]] == [job["id"] for job in jobs_for(1)]
+    engine = CountingEngine()
+    committed = run_jobs(resumed, jobs_for(2), engine, None, 1, None, lambda line: None)
+
+    assert engine.asked == ["Son"]
+    assert [m["text"] for m in committed] == ["Committed", "Received", "Fresh reply from Son"]
@@ -0,0 +1,49 @@
+import sys
+from pathlib import Path
+from collections import OrderedDict
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import context_builder
+from context_builder import count_tokens
+
+
+class WordEncoding:
+    """One token per word; counts how often it is asked to encode."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, text, disallowed_special=()):
+        self.calls += 1
+        return text.split()
+
+
+@pytest.fixture
+def encoding(monkeypatch):
+    encoding = WordEncoding()
+    monkeypatch.setattr(context_builder, "get_encoding", lambda model: encoding)
+    monkeypatch.setattr(context_builder, "_token_counts", OrderedDict())
+    return encoding
+
+
+def test_long_texts_are_cached_by_digest(encoding):
+    transcript = "word " * 1000
+    assert count_tokens(transcript, "gpt-4o") == 1000
+    assert count_tokens("word " * 1000, "gpt-4o") == 1000  # an equal string, not the same object
+    assert encoding.calls == 1
+
+    count_tokens("Header:", "gpt-4o")
+    keys = [text for _, text in context_builder._token_counts]
+    assert keys[0] != transcript and len(keys[0]) == 16
+    assert keys[1] == "Header:"  # short texts are kept as they are
+
+
+def test_cache_is_bounded_least_recently_used_first(encoding, monkeypatch):
+    monkeypatch.setattr(context_builder, "TOKEN_COUNT_CACHE_SIZE", 2)
+    for text in ("a", "b", "a", "c"):
+        count_tokens(text)
+    assert [text for _, text in context_builder._token_counts] == ["a", "c"]
+    count_tokens("b")
+    assert encoding.calls == 4  # "b" was evicted and counted again
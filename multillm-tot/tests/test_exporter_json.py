@@ -0,0 +1,40 @@
+import sys
+import json
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from exporter_json import generate_json_from_tree
+
+
+def node(id, text, children=(), **extra):
+    return {"id": id, "persona": "Surgeon", "text": text, "children": list(children), **extra}
+
+
+def test_matches_json_dumps():
+    tree = [
+        node("m1", "Plan: \"rehab\" first\nthen café ☕", [
+            node("m2", "Agreed\tmostly", [node("m3", "")], usage={"prompt": 10, "tags": ["a", {"b": None}]}),
+            node("m4", "No children below"),
+        ], rag_score=0.75),
+        {"id": "m5", "children": [node("m6", "Keys after children")], "text": "x", "flags": []},
+        node("m7", "Lone root"),
+    ]
+    assert generate_json_from_tree(tree) == json.dumps(tree, indent=2)
+
+
+def test_empty_tree_matches_json_dumps():
+    assert generate_json_from_tree([]) == json.dumps([], indent=2)
+
+
+def test_deep_chain_does_not_recurse():
+    depth = sys.getrecursionlimit() * 2
+    root = current = node("m0", "start")
+    for i in range(1, depth):
+        child = node(f"m{i}", f"reply {i}")
+        current["children"].append(child)
+        current = child
+
+    output = generate_json_from_tree([root])
+    assert output.startswith("[\n  {\n    \"id\": \"m0\"")
+    assert output.count("\"id\":") == depth
+    assert output.rstrip().endswith("}\n]")
@@ -0,0 +1,32 @@
+import io
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from live_stream import TerminalStream
+
+
+def test_end_finishes_another_personas_line():
+    out = io.StringIO()
+    terminal = TerminalStream(out)
+    terminal.write("Surgeon", "Hip ")
+    terminal.write("Care Manager", "Plan")
+    terminal.end("Surgeon")  # Surgeon's reply is done while Care Manager holds the line
+    out.write("Surgeon: first token 0.1s\n")
+    terminal.write("Care Manager", " ahead")
+    terminal.end("Care Manager")
+    assert out.getvalue() == (
+        "[Surgeon] Hip \n[Care Manager] Plan\n"
+        "Surgeon: first token 0.1s\n"
+        "[Care Manager]  ahead\n"
+    )
+
+
+def test_reset_marks_discarded_output():
+    out = io.StringIO()
+    terminal = TerminalStream(out)
+    terminal.write("Surgeon", "Hel")
+    terminal.reset("Surgeon")
+    terminal.write("Surgeon", "Hello")
+    terminal.end("Surgeon")
+    assert out.getvalue() == "[Surgeon] Hel [retrying, discard the above]\n[Surgeon] Hello\n"
@@ -0,0 +1,114 @@
+import sys
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import llm_cache
+from llm_cache import ResponseCache, make_cache_key
+
+RESPONSE = {"content": "Agreed.", "usage": {"prompt_tokens": 10, "completion_tokens": 2, "cached_tokens": 0}}
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache.time, "time", clock)
+    return clock
+
+
+def last_access(path, key):
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT last_access FROM responses WHERE key = ?", (key,)).fetchone()[0]
+
+
+def test_key_covers_model_messages_and_params():
+    messages = [{"role": "user", "content": "Hip plan?"}]
+    key = make_cache_key("gpt-4o", messages, temperature=0.7)
+    assert key == make_cache_key("gpt-4o", [dict(messages[0])], temperature=0.7)
+    assert key != make_cache_key("gpt-4o-mini", messages, temperature=0.7)
+    assert key != make_cache_key("gpt-4o", messages, temperature=0.2)
+
+
+def test_read_mode_serves_hits(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "c.sqlite"), mode="read")
+    assert cache.get("k") is None
+    cache.put("k", "gpt-4o", RESPONSE)
+    assert cache.get("k") == RESPONSE
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+
+def test_write_mode_refreshes_without_reading(tmp_path, clock):
+    path = str(tmp_path / "c.sqlite")
+    cache = ResponseCache(path, mode="write")
+    cache.put("k", "gpt-4o", RESPONSE)
+    assert cache.get("k") is None
+    cache.put("k", "gpt-4o", dict(RESPONSE, content="Refreshed."))
+    cache.close()
+
+    reader = ResponseCache(path, mode="read")
+    assert reader.get("k")["content"] == "Refreshed."
+    reader.close()
+
+
+def test_off_mode_touches_nothing(tmp_path):
+    path = tmp_path / "c.sqlite"
+    cache = ResponseCache(str(path), mode="off")
+    cache.put("k", "gpt-4o", RESPONSE)
+    assert cache.get("k") is None
+    assert not path.exists()
+
+
+def test_expired_entries_are_ignored_and_purged(tmp_path, clock):
+    path = str(tmp_path / "c.sqlite")
+    cache = ResponseCache(path, mode="read", ttl_seconds=60)
+    cache.put("k", "gpt-4o", RESPONSE)
+    clock.now += 61
+    assert cache.get("k") is None
+    cache.evict()
+    with sqlite3.connect(path) as db:
+        assert db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 0
+    cache.close()
+
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path, clock):
+    size = len(llm_cache.json.dumps(RESPONSE, ensure_ascii=False).encode("utf-8"))
+    cache = ResponseCache(str(tmp_path / "c.sqlite"), mode="read", max_bytes=2 * size)
+    for key in ("a", "b", "c"):
+        clock.now += 1
+        cache.put(key, "gpt-4o", RESPONSE)
+    clock.now += 1
+    assert cache.get("a") == RESPONSE  # "a" is now more recent than "b"
+    cache.evict()
+    assert cache.get("b") is None
+    assert cache.get("a") == RESPONSE and cache.get("c") == RESPONSE
+    cache.close()
+
+
+def test_access_times_are_written_in_batches(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(ResponseCache, "FLUSH_ACCESS_EVERY", 2)
+    path = str(tmp_path / "c.sqlite")
+    cache = ResponseCache(path, mode="read")
+    cache.put("a", "gpt-4o", RESPONSE)
+    cache.put("b", "gpt-4o", RESPONSE)
+
+    clock.now = 2000.0
+    cache.get("a")
+    assert last_access(path, "a") == 1000.0  # noted in memory only
+    cache.get("b")
+    assert (last_access(path, "a"), last_access(path, "b")) == (2000.0, 2000.0)
+
+    clock.now = 3000.0
+    cache.get("a")
+    cache.close()
+    assert last_access(path, "a") == 3000.0  # flushed on close
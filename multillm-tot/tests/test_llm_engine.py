@@ -0,0 +1,53 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+from openai import APIConnectionError
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from llm_engine import LLMEngine
+from scheduler import RequestScheduler
+
+
+def chunk(text=None, usage=None):
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=text))] if text is not None else []
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+class FlakyStreams:
+    """Stands in for AsyncOpenAI: the first stream breaks after two deltas."""
+
+    def __init__(self):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        broken = self.calls == 1
+
+        async def stream():
+            for text in ("Hel", "lo "):
+                yield chunk(text)
+            if broken:
+                raise APIConnectionError(request=httpx.Request("POST", "http://test/chat/completions"))
+            yield chunk("world")
+            yield chunk(usage=SimpleNamespace(prompt_tokens=3, completion_tokens=3))
+        return stream()
+
+    async def close(self):
+        pass
+
+
+def test_retried_stream_resets_partial_output():
+    engine = LLMEngine(scheduler=RequestScheduler(rate_limits={}, base_delay=0.01, max_delay=0.01), api_key="test")
+    engine.client = FlakyStreams()
+    tokens = []
+    try:
+        response = engine.run(engine.chat("gpt-4o-mini", [{"role": "user", "content": "hi"}], on_token=tokens.append))
+    finally:
+        engine.close()
+
+    assert engine.client.calls == 2
+    assert tokens == ["Hel", "lo ", None, "Hel", "lo ", "world"]
+    assert response["content"] == "Hello world"
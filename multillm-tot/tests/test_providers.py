@@ -0,0 +1,19 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import providers
+
+
+def test_label_routes_to_its_provider_with_its_fallback_model(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    assert providers.provider_for("gpt-3.5-turbo", "Gemini") == "gemini"
+    assert providers.resolve_model("gpt-3.5-turbo", "Gemini") == ("gemini", "gemini-2.0-flash")
+    # A model the label's provider serves is kept
+    assert providers.resolve_model("gemini-1.5-pro", "Gemini") == ("gemini", "gemini-1.5-pro")
+
+
+def test_unconfigured_label_falls_back_to_the_model_prefix(monkeypatch):
+    monkeypatch.delenv("DEEPSEEK_API_KEY", raising=False)
+    assert providers.resolve_model("gpt-3.5-turbo", "DeepSeek") == ("openai", "gpt-3.5-turbo")
+    assert providers.provider_for("unknown-model", "DeepSeek") == "openai"
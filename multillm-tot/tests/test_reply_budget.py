@@ -0,0 +1,35 @@
+import sys
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from main import agent_reply_async
+from context_builder import MODEL_CONTEXT_WINDOWS, count_tokens
+
+
+class RoutedEngine:
+    """Routes every call to a fixed (provider, model) and records the messages sent."""
+
+    def __init__(self, target):
+        self.target = target
+        self.sent = []
+
+    def route(self, model, llm=None):
+        return [self.target]
+
+    async def chat(self, model, messages, **kwargs):
+        self.sent.append(messages)
+        return {"content": "ok", "usage": {}, "cached": False, "timing": {"ttft": None, "total": 0.0}}
+
+
+def test_goal_prompt_fits_the_routed_models_window():
+    # The persona names a 128k model, but the router sends the call to an 8k one
+    engine = RoutedEngine(("openai", "gpt-4"))
+    persona = {"name": "Surgeon", "llm": "ChatGPT", "model": "gpt-4o"}
+    transcript = "Surgeon: the recovery plan needs review. " * 3000
+
+    reply = asyncio.run(agent_reply_async(persona, transcript, "Goal - consensus", engine, None))
+
+    assert reply == "ok"
+    sent = sum(count_tokens(message["content"], "gpt-4") for message in engine.sent[0])
+    assert sent < MODEL_CONTEXT_WINDOWS["gpt-4"]
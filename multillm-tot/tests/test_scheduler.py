@@ -0,0 +1,139 @@
+import sys
+import asyncio
+from pathlib import Path
+
+import httpx
+import pytest
+from openai import APIConnectionError, RateLimitError
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import scheduler
+from scheduler import CircuitOpenError, DeadlineExceeded, RequestScheduler, retry_after_seconds
+
+REQUEST = httpx.Request("POST", "http://test/chat/completions")
+
+
+def rate_limited(retry_after=None):
+    headers = {"retry-after": retry_after} if retry_after is not None else {}
+    return RateLimitError("slow down", response=httpx.Response(429, headers=headers, request=REQUEST), body=None)
+
+
+def connection_error():
+    return APIConnectionError(request=REQUEST)
+
+
+def make_scheduler(**kwargs):
+    kwargs.setdefault("rate_limits", {})
+    return RequestScheduler(**kwargs)
+
+
+class Requests:
+    """make_request for submit(): raises the given errors in turn, then returns "ok"."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Records every pacing/backoff sleep instead of waiting
+    slept = []
+
+    async def sleep(delay):
+        slept.append(delay)
+
+    monkeypatch.setattr(scheduler.asyncio, "sleep", sleep)
+    return slept
+
+
+def test_retry_after_header():
+    assert retry_after_seconds(rate_limited("2.5")) == 2.5
+    assert retry_after_seconds(rate_limited("soon"), default=None) is None
+    assert retry_after_seconds(connection_error(), default=1.0) == 1.0
+
+
+def test_backoff_follows_retry_after_else_capped_exponential(monkeypatch):
+    monkeypatch.setattr(scheduler.random, "uniform", lambda low, high: high)
+    requests = make_scheduler(base_delay=1.0, max_delay=10.0)
+    assert requests.backoff(0, rate_limited("7")) == 7.0
+    assert [requests.backoff(attempt, connection_error()) for attempt in range(5)] == [1.0, 2.0, 4.0, 8.0, 10.0]
+    assert requests.backoff(2, rate_limited()) == 4.0
+
+
+def test_rate_limit_pauses_the_model_for_retry_after(sleeps):
+    requests = make_scheduler()
+    make_request = Requests(rate_limited("2"))
+    assert asyncio.run(requests.submit(make_request, model="gpt-4o")) == "ok"
+    assert make_request.calls == 2
+    assert requests.retries == 1
+    # The retry waited out the model's pause, not a backoff of its own
+    assert len(sleeps) == 1 and 1.9 < sleeps[0] <= 2.0
+    # A 429 means "busy", not "down": the breaker stays closed
+    assert requests.breaker("openai").failures == 0
+
+
+def test_gives_up_after_max_retries(sleeps):
+    requests = make_scheduler(max_retries=2)
+    make_request = Requests(*(connection_error() for _ in range(3)))
+    with pytest.raises(APIConnectionError):
+        asyncio.run(requests.submit(make_request))
+    assert make_request.calls == 3
+
+
+def test_breaker_trips_then_lets_one_trial_through(sleeps, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(scheduler.time, "monotonic", lambda: now[0])
+    requests = make_scheduler(max_retries=0, failure_threshold=2, reset_seconds=30.0)
+    for _ in range(2):
+        with pytest.raises(APIConnectionError):
+            asyncio.run(requests.submit(Requests(connection_error()), provider="gemini"))
+    breaker = requests.breaker("gemini")
+    assert breaker.state == "open"
+
+    make_request = Requests()
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(requests.submit(make_request, provider="gemini"))
+    assert make_request.calls == 0
+
+    now[0] += 30.0
+    assert breaker.state == "half-open"
+    assert breaker.allow() and not breaker.allow()  # one trial at a time
+    breaker.release()
+    assert asyncio.run(requests.submit(make_request, provider="gemini")) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_failed_trial_reopens_the_breaker(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(scheduler.time, "monotonic", lambda: now[0])
+    requests = make_scheduler(max_retries=0, failure_threshold=1, reset_seconds=30.0)
+    with pytest.raises(APIConnectionError):
+        asyncio.run(requests.submit(Requests(connection_error())))
+    now[0] += 30.0
+    with pytest.raises(APIConnectionError):
+        asyncio.run(requests.submit(Requests(connection_error())))
+    assert requests.breaker("openai").state == "open"
+
+
+def test_half_open_trial_is_released_when_pacing_gives_up(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(scheduler.time, "monotonic", lambda: now[0])
+    requests = make_scheduler(max_retries=0, failure_threshold=1, reset_seconds=30.0, deadline=5.0)
+    with pytest.raises(APIConnectionError):
+        asyncio.run(requests.submit(Requests(connection_error())))
+    now[0] += 30.0
+
+    # The model is paused past the call deadline, so the trial gives up before sending
+    requests._resume_at["gpt-4o"] = now[0] + 60.0
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(requests.submit(Requests(), model="gpt-4o"))
+    breaker = requests.breaker("openai")
+    assert not breaker.trial_in_flight
+    assert breaker.allow()  # the next caller gets the trial instead of waiting forever
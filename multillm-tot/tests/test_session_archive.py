@@ -0,0 +1,62 @@
+import sys
+import json
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import session_archive
+from session_archive import SessionArchive, write_archive
+
+
+def message(id, persona, round, parent=None, text="", **extra):
+    return dict({"id": id, "round": round, "persona": persona, "llm": "ChatGPT", "parentId": parent,
+                 "timestamp": "2026-01-01 00:00:00", "text": text or f"{persona} says {id}", "rag_score": None,
+                 "children": []}, **extra)
+
+
+def sample_tree():
+    root = message("m1", "Surgeon", 1, rag_score=0.5)
+    reply = message("m2", "Care Manager", 2, parent="m1", text="Agreed <b>ok</b> ✓")
+    nested = message("m3", "Surgeon", 3, parent="m2", note="kept")
+    reply["children"].append(nested)
+    root["children"].append(reply)
+    goal = message("m4", "Care Manager", "Goal - consensus")
+    labelled = message("m5", "Surgeon", "3")  # a round label that looks like a number
+    return [root, goal, labelled]
+
+
+def test_tree_round_trips(tmp_path):
+    tree = sample_tree()
+    path = tmp_path / "session.archive"
+    write_archive(tree, str(path), session={"prompt": "Hip plan"})
+    with SessionArchive(str(path)) as archive:
+        assert archive.session == {"prompt": "Hip plan"}
+        assert archive.rows == 5
+        assert json.dumps(archive.tree(), sort_keys=True) == json.dumps(tree, sort_keys=True)
+
+
+def test_round_trips_across_many_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_archive, "BLOCK_ROWS", 2)
+    chain = [message(f"m{i}", "Surgeon", i, parent=f"m{i - 1}" if i else None) for i in range(7)]
+    for parent, child in zip(chain, chain[1:]):
+        parent["children"].append(child)
+    path = tmp_path / "chain.archive"
+    write_archive([chain[0]], str(path))
+    with SessionArchive(str(path)) as archive:
+        assert len(archive.meta["blocks"]) == 4
+        assert [m["id"] for m in archive.messages(rows=[6, 1, 3])] == ["m1", "m3", "m6"]
+        assert json.dumps(archive.tree(), sort_keys=True) == json.dumps([chain[0]], sort_keys=True)
+
+
+def test_select_by_persona_and_round(tmp_path):
+    path = tmp_path / "session.archive"
+    write_archive(sample_tree(), str(path))
+    with SessionArchive(str(path)) as archive:
+        ids = lambda **filters: [m["id"] for m in archive.messages(**filters)]
+        assert ids(persona="Surgeon") == ["m1", "m3", "m5"]
+        assert ids(round=3) == ["m3"]
+        assert ids(round="3") == ["m5"]  # the stored label, not round 3
+        assert ids(round="2") == ["m2"]
+        assert ids(round="Goal - consensus") == ["m4"]
+        assert ids(persona="Surgeon", round=1) == ["m1"]
+        assert ids(persona="Nobody") == []
+        assert ids(round="Goal - decision") == []
@@ -0,0 +1,85 @@
+import sys
+import json
+import argparse
+from pathlib import Path
+from types import SimpleNamespace
+
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, VectorParams
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "vector-setup"))
+import upload_to_qdrant as upload
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.embedded = 0
+
+    def create(self, model, input):
+        self.embedded += len(input)
+        data = [SimpleNamespace(index=i, embedding=[0.1] * upload.VECTOR_SIZE) for i in range(len(input))]
+        return SimpleNamespace(data=data)
+
+
+def make_collection(qdrant, name="manual"):
+    qdrant.create_collection(
+        collection_name=name,
+        vectors_config={upload.VECTOR_NAME: VectorParams(size=upload.VECTOR_SIZE, distance=Distance.COSINE)}
+    )
+
+
+def write_manifest(tmp_path, product):
+    (tmp_path / "guide.md").write_text("# Coverage\n\nDeductibles apply.\n\n# Claims\n\nFile within 30 days.\n")
+    manifest = tmp_path / "manual.json"
+    manifest.write_text(json.dumps([{
+        "section_id": "01", "title": "Guide", "filename": "guide.md", "tags": ["Auto"], "product": product
+    }]))
+    return manifest
+
+
+def make_args(tmp_path, manifest):
+    return argparse.Namespace(
+        folder=str(tmp_path), manifest=str(manifest), collection="manual", chunk_chars=2000, overlap_chars=200,
+        embed_batch=64, upsert_batch=64, parallel=2, full=False,
+        state_file=upload.default_state_path(manifest, "manual")
+    )
+
+
+def stored_products(qdrant):
+    records, _ = qdrant.scroll(collection_name="manual", limit=100, with_payload=True)
+    return {record.payload["product"] for record in records}
+
+
+def test_metadata_only_change_updates_payload_without_reembedding(tmp_path):
+    qdrant = QdrantClient(":memory:")
+    make_collection(qdrant)
+    openai_client = SimpleNamespace(embeddings=FakeEmbeddings())
+
+    args = make_args(tmp_path, write_manifest(tmp_path, "auto"))
+    upload.ingest(args, openai_client, qdrant, created=True)
+    embedded = openai_client.embeddings.embedded
+    assert stored_products(qdrant) == {"auto"}
+
+    args = make_args(tmp_path, write_manifest(tmp_path, "restaurant"))
+    stats = upload.ingest(args, openai_client, qdrant)
+
+    assert stored_products(qdrant) == {"restaurant"}
+    assert openai_client.embeddings.embedded == embedded
+    assert stats["repayloaded"] == 2 and stats["upserted"] == 0
+
+
+def test_state_file_ignored_when_collection_is_empty(tmp_path):
+    openai_client = SimpleNamespace(embeddings=FakeEmbeddings())
+    args = make_args(tmp_path, write_manifest(tmp_path, "auto"))
+
+    qdrant = QdrantClient(":memory:")
+    make_collection(qdrant)
+    upload.ingest(args, openai_client, qdrant, created=True)
+
+    # Same state file, fresh (e.g. wiped) Qdrant
+    qdrant = QdrantClient(":memory:")
+    make_collection(qdrant)
+    stats = upload.ingest(args, openai_client, qdrant)
+
+    assert stats["upserted"] == 2
+    assert qdrant.count(collection_name="manual").count == 2
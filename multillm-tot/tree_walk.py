@@ -0,0 +1,86 @@
+ENTER = "enter"
+LEAVE = "leave"
+
+_DONE = object()
+
+
+def node_children(node):
+    return node.get("children") or ()
+
+
+# -----------------------------
+# Function: Walk a Thread Tree (explicit stack)
+# -----------------------------
+def walk(roots, children=node_children):
+    """
+    Yields (ENTER, node, depth) before a node's replies and (LEAVE, node,
+    depth) after them, roots at depth 0. Uses its own stack of iterators
+    instead of recursion, so thread depth is not limited by Python's
+    recursion limit. `children(node)` returns a node's replies.
+    """
+    stack = [iter(roots)]
+    path = []
+    while stack:
+        node = next(stack[-1], _DONE)
+        if node is _DONE:
+            stack.pop()
+            if path:
+                yield LEAVE, path.pop(), len(path)
+            continue
+        yield ENTER, node, len(path)
+        path.append(node)
+        stack.append(iter(children(node)))
+
+
+def preorder(roots, children=node_children):
+    """Yields (node, depth) in reading order: each node before its replies."""
+    for event, node, depth in walk(roots, children):
+        if event == ENTER:
+            yield node, depth
+
+
+# -----------------------------
+# Class: Tree Visitor
+# -----------------------------
+class TreeVisitor:
+    """
+    Base for exporters. header() and footer() wrap the document; enter()
+    and leave() are called around each node's replies. Each returns the
+    text to write (or "").
+    """
+
+    def header(self):
+        return ""
+
+    def enter(self, node, depth):
+        return ""
+
+    def leave(self, node, depth):
+        return ""
+
+    def footer(self):
+        return ""
+
+
+# -----------------------------
+# Function: Run Visitors over One Walk
+# -----------------------------
+def visit_tree(roots, visitors, children=node_children):
+    """
+    Walks the tree once for all visitors. Yields one tuple per step with
+    each visitor's text for it, in the order the visitors were given.
+    """
+    yield tuple(visitor.header() for visitor in visitors)
+    for event, node, depth in walk(roots, children):
+        if event == ENTER:
+            yield tuple(visitor.enter(node, depth) for visitor in visitors)
+        else:
+            yield tuple(visitor.leave(node, depth) for visitor in visitors)
+    yield tuple(visitor.footer() for visitor in visitors)
+
+
+def iter_visit(roots, visitor, children=node_children):
+    """Yields the non-empty chunks of a single visitor's document."""
+    for (chunk,) in visit_tree(roots, [visitor], children):
+        if chunk:
+            yield chunk
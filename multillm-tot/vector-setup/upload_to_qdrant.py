@@ -1,95 +1,418 @@
 import json
+import re
 import uuid
 import os
+import hashlib
 import argparse
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams, PointStruct
+from qdrant_client.http.models import (
+    Distance, VectorParams, PointStruct, PointIdsList, OverwritePayloadOperation, SetPayload
+)
 
-# Initialize OpenAI client
-openai_client = OpenAI()
+VECTOR_SIZE = 1536
+VECTOR_NAME = "content_embedding"
+EMBEDDING_MODEL = "text-embedding-3-small"
 
-# CLI + ENV fallback
-parser = argparse.ArgumentParser(description="Upload domain-specific markdown documents to Qdrant")
+# Fixed namespace so the same chunk always maps to the same point id
+POINT_NAMESPACE = uuid.UUID("5b0c1f8e-7a52-4c1e-9d8e-2f4b6a9c3d10")
 
-parser.add_argument(
-    "--folder",
-    required=True,
-    help="Base folder where the markdown files referenced in the JSON live"
-)
-parser.add_argument(
-    "--manifest",
-    required=True,
-    help="Path to the manifest JSON (e.g., hello-underwriting-manual.json)"
-)
-parser.add_argument(
-    "--collection",
-    required=True,
-    help="Qdrant collection name (e.g., underwriting_manual, care_guidelines)"
-)
-parser.add_argument(
-    "--host",
-    default=os.environ.get("QDRANT_HOST", "localhost"),
-    help="Qdrant host"
-)
-parser.add_argument(
-    "--port",
-    type=int,
-    default=int(os.environ.get("QDRANT_PORT", 6333)),
-    help="Qdrant port"
-)
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*\S)\s*$")
 
-args = parser.parse_args()
 
-# Setup Qdrant client
-qdrant = QdrantClient(host=args.host, port=args.port)
-VECTOR_SIZE = 1536
-VECTOR_NAME = "content_embedding"
+# -----------------------------
+# CLI + ENV fallback
+# -----------------------------
+def parse_args():
+    parser = argparse.ArgumentParser(description="Upload domain-specific markdown documents to Qdrant")
 
-# Create collection if it doesn't exist
-if not qdrant.collection_exists(collection_name=args.collection):
-    qdrant.create_collection(
-        collection_name=args.collection,
-        vectors_config={VECTOR_NAME: VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE)}
+    parser.add_argument(
+        "--folder",
+        required=True,
+        help="Base folder where the markdown files referenced in the JSON live"
+    )
+    parser.add_argument(
+        "--manifest",
+        required=True,
+        help="Path to the manifest JSON (e.g., hello-underwriting-manual.json)"
+    )
+    parser.add_argument(
+        "--collection",
+        required=True,
+        help="Qdrant collection name (e.g., underwriting_manual, care_guidelines)"
+    )
+    parser.add_argument(
+        "--host",
+        default=os.environ.get("QDRANT_HOST", "localhost"),
+        help="Qdrant host"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=int(os.environ.get("QDRANT_PORT", 6333)),
+        help="Qdrant port"
+    )
+    parser.add_argument(
+        "--chunk-chars",
+        type=int,
+        default=2000,
+        help="Max characters per chunk (~500 tokens); sections longer than this are split"
     )
-    print(f"✅ Created collection: {args.collection}")
+    parser.add_argument(
+        "--overlap-chars",
+        type=int,
+        default=200,
+        help="Characters repeated between consecutive chunks of a split section"
+    )
+    parser.add_argument(
+        "--embed-batch",
+        type=int,
+        default=64,
+        help="Chunks embedded per embeddings request"
+    )
+    parser.add_argument(
+        "--upsert-batch",
+        type=int,
+        default=64,
+        help="Points per upsert request"
+    )
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=4,
+        help="Upsert requests in flight at once"
+    )
+    parser.add_argument(
+        "--state-file",
+        default=None,
+        help="Index state JSON (default: <manifest>.<collection>.index-state.json next to the manifest)"
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Ignore the index state: re-embed and re-upload every chunk, still pruning stale points"
+    )
+    args = parser.parse_args()
+    args.state_file = args.state_file or default_state_path(args.manifest, args.collection)
+    return args
 
-# Load JSON manifest
-with open(args.manifest, "r", encoding="utf-8") as f:
-    documents = json.load(f)
 
-base_folder = Path(args.folder)
-batch = []
+# -----------------------------
+# Heading-aware chunking
+# -----------------------------
+def split_sections(text):
+    """
+    Splits markdown into (heading path, body) sections at every heading, e.g.
+    ("Section 3 > Discounts", "..."). Text before the first heading has an
+    empty heading path.
+    """
+    sections = []
+    path = []
+    body = []
 
-for doc in documents:
-    doc_path = base_folder / doc["filename"]
-    if not doc_path.exists():
-        print(f"[ERROR] File not found: {doc_path}")
-        continue
+    def flush():
+        content = "\n".join(body).strip()
+        if content:
+            sections.append((" > ".join(title for _, title in path), content))
 
-    with open(doc_path, "r", encoding="utf-8") as f:
-        content = f.read()
+    for line in text.splitlines():
+        match = HEADING_PATTERN.match(line)
+        if match:
+            flush()
+            body = [line]
+            level = len(match.group(1))
+            path = [(lvl, title) for lvl, title in path if lvl < level] + [(level, match.group(2))]
+        else:
+            body.append(line)
+    flush()
+    return sections
 
-    response = openai_client.embeddings.create(
-        model="text-embedding-3-small",
-        input=content
-    )
-    embedding = response.data[0].embedding
 
-    point = PointStruct(
-        id=str(uuid.uuid4()),
-        vector={VECTOR_NAME: embedding},
-        payload={
+def window_text(text, max_chars, overlap_chars):
+    """
+    Cuts an oversized section into windows of at most max_chars, preferring
+    paragraph, then line, then word boundaries, each starting overlap_chars
+    before the previous window ended.
+    """
+    if len(text) <= max_chars:
+        return [text]
+
+    windows = []
+    start = 0
+    while start < len(text):
+        end = min(start + max_chars, len(text))
+        if end < len(text):
+            for separator in ("\n\n", "\n", " "):
+                cut = text.rfind(separator, start + max_chars // 2, end)
+                if cut != -1:
+                    end = cut + len(separator)
+                    break
+        windows.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        start = max(end - overlap_chars, start + 1)
+    return [w for w in windows if w]
+
+
+def chunk_document(doc, content, max_chars, overlap_chars):
+    chunks = []
+    for heading, body in split_sections(content):
+        for piece in window_text(body, max_chars, overlap_chars):
+            chunks.append({"heading": heading, "content": piece})
+
+    for index, chunk in enumerate(chunks):
+        content_hash = hashlib.sha256(
+            f"{doc['filename']}\n{chunk['heading']}\n{chunk['content']}".encode("utf-8")
+        ).hexdigest()
+        chunk["id"] = str(uuid.uuid5(POINT_NAMESPACE, content_hash))
+        chunk["payload"] = {
             "section_id": doc.get("section_id"),
-            "title": doc.get("title"),
+            "title": f"{doc.get('title')} – {chunk['heading']}" if chunk["heading"] else doc.get("title"),
+            "doc_title": doc.get("title"),
+            "heading": chunk["heading"],
+            "chunk_index": index,
+            "content_hash": content_hash,
             "filename": doc.get("filename"),
             "product": doc.get("product"),
             "tags": [tag.lower() for tag in doc.get("tags", [])],
-            "content": content
+            "content": chunk["content"]
         }
+    return chunks
+
+
+# -----------------------------
+# Index state: which chunk ids each document currently has in Qdrant
+# -----------------------------
+def default_state_path(manifest, collection):
+    manifest = Path(manifest)
+    return str(manifest.with_name(f"{manifest.stem}.{collection}.index-state.json"))
+
+
+def load_index_state(path, collection, qdrant, created=False):
+    """
+    Returns {filename: {"fingerprint", "chunk_ids"}} from the local state
+    file. The file is only trusted when it describes this collection and
+    its chunk count matches the collection's point count; otherwise (no
+    file, a collection created in this run, a wiped Qdrant volume, a
+    collection filled by an older upload) the state is rebuilt from the
+    point payloads in Qdrant. Fingerprints are unknown then, so every
+    document is re-chunked once and missing chunks are uploaded again.
+    """
+    if Path(path).exists() and not created:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("collection") == collection:
+            stored = sum(len(entry["chunk_ids"]) for entry in state["documents"].values())
+            points = qdrant.count(collection_name=collection, exact=True).count
+            if stored == points:
+                return state["documents"]
+            print(f"⚠️ Index state lists {stored} chunks but '{collection}' holds {points} points; rebuilding it from Qdrant")
+
+    documents = {}
+    offset = None
+    while True:
+        records, offset = qdrant.scroll(
+            collection_name=collection,
+            limit=256,
+            offset=offset,
+            with_payload=["filename"],
+            with_vectors=False
+        )
+        for record in records:
+            filename = (record.payload or {}).get("filename")
+            entry = documents.setdefault(filename, {"fingerprint": None, "chunk_ids": []})
+            entry["chunk_ids"].append(str(record.id))
+        if offset is None:
+            break
+    return documents
+
+
+def save_index_state(path, collection, documents):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"collection": collection, "documents": documents}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def document_fingerprint(doc, content, max_chars, overlap_chars):
+    # Changes to the text, the manifest metadata or the chunking settings all re-chunk a document
+    metadata = {k: v for k, v in doc.items() if k != "content"}
+    return hashlib.sha256(
+        json.dumps([metadata, max_chars, overlap_chars, content], sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+# -----------------------------
+# Diff the manifest against the index state
+# -----------------------------
+def plan_changes(documents, base_folder, previous, args):
+    """
+    Returns (chunks to embed and upsert, chunks to re-payload, stale point
+    ids to delete, new state, stats). Unchanged documents are skipped
+    without being chunked; in changed ones only chunks whose content-hash
+    id is not stored yet are embedded. Chunks that are already stored keep
+    their vector but get their payload rewritten, so manifest edits
+    (product, tags, title) reach Qdrant without re-embedding.
+    """
+    to_upsert = []
+    to_repayload = []
+    stale_ids = []
+    new_state = {}
+    stats = {"documents": len(documents), "unchanged_documents": 0, "chunks": 0, "skipped": 0}
+
+    for doc in documents:
+        filename = doc["filename"]
+        known = previous.get(filename, {"fingerprint": None, "chunk_ids": []})
+        doc_path = base_folder / filename
+        if not doc_path.exists():
+            print(f"[ERROR] File not found: {doc_path}")
+            if filename in previous:
+                new_state[filename] = known  # leave what is indexed alone
+            continue
+
+        with open(doc_path, "r", encoding="utf-8") as f:
+            content = f.read()
+
+        fingerprint = document_fingerprint(doc, content, args.chunk_chars, args.overlap_chars)
+        if fingerprint == known["fingerprint"] and not args.full:
+            new_state[filename] = known
+            stats["unchanged_documents"] += 1
+            stats["chunks"] += len(known["chunk_ids"])
+            stats["skipped"] += len(known["chunk_ids"])
+            continue
+
+        chunks = chunk_document(doc, content, args.chunk_chars, args.overlap_chars)
+        current_ids = [chunk["id"] for chunk in chunks]
+        known_ids = set() if args.full else set(known["chunk_ids"])
+
+        new_chunks = [chunk for chunk in chunks if chunk["id"] not in known_ids]
+        to_upsert += new_chunks
+        to_repayload += [chunk for chunk in chunks if chunk["id"] in known_ids]
+        kept_ids = set(current_ids)
+        stale_ids += [point_id for point_id in known["chunk_ids"] if point_id not in kept_ids]
+        stats["chunks"] += len(chunks)
+        stats["skipped"] += len(chunks) - len(new_chunks)
+        new_state[filename] = {"fingerprint": fingerprint, "chunk_ids": current_ids}
+
+    # Documents dropped from the manifest lose all of their points
+    manifest_files = {doc["filename"] for doc in documents}
+    for filename, known in previous.items():
+        if filename not in manifest_files:
+            stale_ids += known["chunk_ids"]
+
+    return to_upsert, to_repayload, stale_ids, new_state, stats
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# -----------------------------
+# Ingestion pipeline
+# -----------------------------
+def ingest(args, openai_client, qdrant, created=False):
+    """
+    diff against index state -> batched embeddings for new/changed chunks ->
+    bounded, parallel upserts -> payload rewrites for kept chunks of changed
+    documents -> delete stale points -> save state.
+    Point ids come from chunk content hashes, so unchanged chunks are never
+    embedded or uploaded again.
+    """
+    with open(args.manifest, "r", encoding="utf-8") as f:
+        documents = json.load(f)
+
+    previous = load_index_state(args.state_file, args.collection, qdrant, created)
+    to_upsert, to_repayload, stale_ids, new_state, stats = plan_changes(documents, Path(args.folder), previous, args)
+    stats.update({"embedded": 0, "upserted": 0, "repayloaded": 0, "deleted": 0})
+
+    pending = []
+    in_flight = []
+
+    def upsert(points):
+        qdrant.upsert(collection_name=args.collection, points=points)
+        return len(points)
+
+    with ThreadPoolExecutor(max_workers=args.parallel) as pool:
+        for batch in batched(to_upsert, args.embed_batch):
+            response = openai_client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=[chunk["content"] for chunk in batch]
+            )
+            stats["embedded"] += len(batch)
+
+            for chunk, item in zip(batch, sorted(response.data, key=lambda d: d.index)):
+                pending.append(PointStruct(
+                    id=chunk["id"],
+                    vector={VECTOR_NAME: item.embedding},
+                    payload=chunk["payload"]
+                ))
+
+            while len(pending) >= args.upsert_batch:
+                in_flight.append(pool.submit(upsert, pending[:args.upsert_batch]))
+                pending = pending[args.upsert_batch:]
+
+            # Keep memory bounded: wait for the oldest upserts once the pool is full
+            while len(in_flight) > args.parallel:
+                stats["upserted"] += in_flight.pop(0).result()
+
+        if pending:
+            in_flight.append(pool.submit(upsert, pending))
+        for future in in_flight:
+            stats["upserted"] += future.result()
+
+    # Same vector, current metadata: one overwrite per point, sent in batches
+    for batch in batched(to_repayload, args.upsert_batch):
+        qdrant.batch_update_points(
+            collection_name=args.collection,
+            update_operations=[
+                OverwritePayloadOperation(overwrite_payload=SetPayload(payload=chunk["payload"], points=[chunk["id"]]))
+                for chunk in batch
+            ]
+        )
+        stats["repayloaded"] += len(batch)
+
+    # Delete only after the replacements are in, so searches never see a gap
+    for batch in batched(list(dict.fromkeys(stale_ids)), args.upsert_batch):
+        qdrant.delete(collection_name=args.collection, points_selector=PointIdsList(points=batch))
+        stats["deleted"] += len(batch)
+
+    save_index_state(args.state_file, args.collection, new_state)
+    return stats
+
+
+def main():
+    args = parse_args()
+
+    # Initialize OpenAI + Qdrant clients
+    openai_client = OpenAI()
+    qdrant = QdrantClient(host=args.host, port=args.port)
+
+    # Create collection if it doesn't exist
+    created = not qdrant.collection_exists(collection_name=args.collection)
+    if created:
+        qdrant.create_collection(
+            collection_name=args.collection,
+            vectors_config={VECTOR_NAME: VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE)}
+        )
+        print(f"✅ Created collection: {args.collection}")
+
+    stats = ingest(args, openai_client, qdrant, created)
+    print(
+        f"✅ {stats['chunks']} chunks from {stats['documents']} documents in '{args.collection}' "
+        f"({stats['unchanged_documents']} documents unchanged): "
+        f"{stats['upserted']} uploaded ({stats['embedded']} embedded), {stats['repayloaded']} payloads updated, "
+        f"{stats['skipped']} unchanged and skipped, {stats['deleted']} stale points deleted."
     )
-    batch.append(point)
 
-qdrant.upsert(collection_name=args.collection, points=batch)
-print(f"✅ Uploaded {len(batch)} documents to Qdrant in collection '{args.collection}'.")
+
+if __name__ == "__main__":
+    main()